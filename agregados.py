@@ -0,0 +1,180 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# agregados.py
+#
+# Tablas pre-agregadas del dataset final para el dashboard.
+#
+# En vez de filtrar y agrupar todas las filas en cada interacción, el
+# apartado 3 deja calculados dos cubos pequeños:
+#
+#   cubo_posiciones: cuántas veces (n) cada piloto acabó en cada posición
+#                    con cada número de pit-stops, por temporada
+#                    (Season, Driver, NPitstops, Position) -> n
+#   cubo_duraciones: estadísticos suficientes de (duración mediana, posición)
+#                    por temporada y piloto: n, sumas, sumas de cuadrados y
+#                    de productos, mínimo y máximo de la duración
+#
+# Con ellos el boxplot, las medias y la regresión de cualquier selección de
+# temporadas y pilotos salen de sumar unas pocas filas, crezca lo que crezca
+# el dataset.
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from almacenamiento import escribir_parquet, leer_tabla
+from metricas import METRICAS
+
+POSICION_MAXIMA = 20    # el dashboard solo mira posiciones 1..20
+
+
+def filas_validas(df):
+    return df.dropna(subset=["Season", "NPitstops", "Position"])
+
+
+def cubo_posiciones(df):
+    """
+    (Season, Driver, NPitstops, Position) -> n. Guardamos todas las
+    posiciones; el filtro 1..20 se hace al consultar.
+    """
+    df = filas_validas(df)
+    cubo = (df.groupby(["Season", "Driver", "NPitstops", "Position"], observed=True, dropna=False)
+            .size().rename("n").reset_index())
+    return cubo.astype({"Season": "int16", "NPitstops": "int16", "Position": "int16", "n": "int32"})
+
+
+def cubo_duraciones(df):
+    """
+    (Season, Driver) -> n, sx, sy, sxx, syy, sxy, xmin, xmax con
+    x = MedianPitStopDuration e y = Position, solo para filas con pit-stops
+    y posición 1..20 (las que usa la regresión del dashboard).
+    """
+    df = filas_validas(df)
+    df = df[(df["NPitstops"] > 0) & df["MedianPitStopDuration"].notna()
+            & (df["Position"] >= 1) & (df["Position"] <= POSICION_MAXIMA)]
+    x = df["MedianPitStopDuration"].astype("float64")
+    y = df["Position"].astype("float64")
+    partes = pd.DataFrame({"Season": df["Season"], "Driver": df["Driver"],
+                           "x": x, "y": y, "xx": x * x, "yy": y * y, "xy": x * y})
+    grupos = partes.groupby(["Season", "Driver"], observed=True, dropna=False)
+    cubo = grupos[["x", "y", "xx", "yy", "xy"]].sum().add_prefix("s")
+    cubo["n"] = grupos.size()
+    cubo["xmin"] = grupos["x"].min()
+    cubo["xmax"] = grupos["x"].max()
+    return cubo.reset_index().astype({"Season": "int16", "n": "int32"})
+
+
+def ruta_agregados(output_file):
+    """
+    Carpeta de los cubos junto a la salida del apartado 3 (data/agregados).
+    """
+    return Path(output_file).parent / "agregados"
+
+
+def guardar_agregados(final_df, output_file):
+    """
+    Calcula y guarda los dos cubos en el mismo formato que la salida.
+    """
+    carpeta = ruta_agregados(output_file)
+    carpeta.mkdir(parents=True, exist_ok=True)
+    parquet = str(output_file).endswith(".parquet")
+    with METRICAS.cronometro("agregados"):
+        for nombre, cubo in (("cubo_posiciones", cubo_posiciones(final_df)), ("cubo_duraciones", cubo_duraciones(final_df))):
+            if parquet:
+                escribir_parquet(cubo, carpeta / f"{nombre}.parquet")
+            else:
+                cubo.to_csv(carpeta / f"{nombre}.csv", index=False)
+    print(f"[TERMINADO] Agregados guardados en {carpeta}")
+
+
+def leer_agregados(carpeta):
+    """
+    Devuelve (cubo_posiciones, cubo_duraciones) o None si no están.
+    """
+    carpeta = Path(carpeta)
+    cubos = []
+    for nombre in ("cubo_posiciones", "cubo_duraciones"):
+        archivos = [a for a in (carpeta / f"{nombre}.parquet", carpeta / f"{nombre}.csv") if a.exists()]
+        if not archivos:
+            return None
+        archivo = max(archivos, key=lambda a: a.stat().st_mtime)    # si hay de los dos formatos, el más reciente
+        cubos.append(leer_tabla(archivo))
+    return tuple(cubos)
+
+
+def filtrar(cubo, temporadas=None, pilotos=None):
+    mascara = np.ones(len(cubo), dtype=bool)
+    if temporadas is not None:
+        mascara &= cubo["Season"].isin(temporadas).to_numpy()
+    if pilotos:
+        mascara &= cubo["Driver"].isin(pilotos).to_numpy()
+    return cubo[mascara]
+
+
+def resumen_por_paradas(posiciones):
+    """
+    Posición media y número de observaciones por número de pit-stops
+    (posiciones 1..20), a partir de un cubo de posiciones ya filtrado.
+    """
+    posiciones = posiciones[(posiciones["Position"] >= 1) & (posiciones["Position"] <= POSICION_MAXIMA)]
+    suma = (posiciones["Position"] * posiciones["n"]).groupby(posiciones["NPitstops"]).sum()
+    total = posiciones.groupby("NPitstops")["n"].sum()
+    return (pd.DataFrame({"NPitstops": total.index, "Posición_media": (suma / total).to_numpy(), "Observaciones": total.to_numpy()})
+            .sort_values("NPitstops", ignore_index=True))
+
+
+def percentil_ponderado(valores, cuentas, q):
+    """
+    Percentil q (0..1) con interpolación lineal, como np.percentile, de los
+    datos que resultan de repetir cada valor (ordenados) sus cuentas veces.
+    """
+    acumulado = np.cumsum(cuentas)
+    rango = (acumulado[-1] - 1) * q
+    abajo = valores[np.searchsorted(acumulado, np.floor(rango), side="right")]
+    arriba = valores[np.searchsorted(acumulado, np.ceil(rango), side="right")]
+    return abajo + (arriba - abajo) * (rango - np.floor(rango))
+
+
+def estadisticas_caja(posiciones):
+    """
+    Estadísticas para ax.bxp (una caja por número de pit-stops) a partir de
+    las cuentas, con el mismo criterio que DataFrame.boxplot: cuartiles con
+    interpolación lineal y bigotes a 1.5 veces el rango intercuartílico.
+    """
+    posiciones = posiciones[(posiciones["Position"] >= 1) & (posiciones["Position"] <= POSICION_MAXIMA)]
+    cuentas = posiciones.groupby(["NPitstops", "Position"])["n"].sum()
+    cajas = []
+    for paradas, grupo in cuentas.groupby(level="NPitstops"):
+        valores = grupo.index.get_level_values("Position").to_numpy(dtype="float64")
+        n = grupo.to_numpy()
+        q1, med, q3 = (percentil_ponderado(valores, n, q) for q in (0.25, 0.5, 0.75))
+        rango = q3 - q1
+        dentro = valores[(valores >= q1 - 1.5 * rango) & (valores <= q3 + 1.5 * rango)]
+        cajas.append({
+            "label": str(paradas), "q1": q1, "med": med, "q3": q3,
+            "whislo": dentro.min(), "whishi": dentro.max(),
+            "fliers": valores[(valores < dentro.min()) | (valores > dentro.max())],
+        })
+    return cajas
+
+
+def regresion(duraciones):
+    """
+    Recta de regresión y correlación de Pearson de posición frente a
+    duración sumando los estadísticos suficientes de un cubo ya filtrado.
+    Devuelve (pendiente, ordenada, r, xmin, xmax, n) o None si no hay datos.
+    """
+    s = duraciones[["n", "sx", "sy", "sxx", "syy", "sxy"]].sum()
+    n = s["n"]
+    if n < 2:
+        return None
+    sxx = s["sxx"] - s["sx"] ** 2 / n
+    syy = s["syy"] - s["sy"] ** 2 / n
+    sxy = s["sxy"] - s["sx"] * s["sy"] / n
+    if sxx <= 0:
+        return None
+    pendiente = sxy / sxx
+    ordenada = (s["sy"] - pendiente * s["sx"]) / n
+    r = sxy / np.sqrt(sxx * syy) if syy > 0 else np.nan
+    return pendiente, ordenada, r, duraciones["xmin"].min(), duraciones["xmax"].max(), int(n)
@@ -0,0 +1,199 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# almacenamiento.py
+#
+# Capa de almacenamiento columnar (Parquet) compartida por los tres apartados.
+#
+# En lugar de cientos de csv pequeños guardamos los datos particionados por
+# temporada, con tipos de verdad:
+#
+#   data/resultados/season=2013/2013_Australian_Grand_Prix.parquet   (apartado 1)
+#   data/pitstops/season=2013/race_01_pitstops.parquet               (apartado 2)
+#   data/pilotos/season=2013/race_01_drivers.parquet                 (apartado 2)
+#   data/calendario/season=2013/calendar.parquet                     (apartado 2)
+#   data/paradas/season=2013/race_01.parquet                         (apartado 2, siempre parquet)
+#   data/vueltas/season=2013/race_01.parquet                         (vueltas.py, siempre parquet)
+#   data/dim_pilotos/season=2013/part.parquet                        (apartado 3)
+#   data/final_merged.parquet/season=2013/part.parquet               (apartado 3)
+#
+# Así el apartado 3 y el dashboard leen solo las temporadas y columnas que
+# necesitan. convertir_arbol_csv pasa el árbol de csv antiguo a este formato.
+# Necesita pyarrow.
+
+import os
+import shutil
+import pandas as pd
+from pathlib import Path
+
+EXTENSIONES = (".csv", ".parquet")
+
+TIPOS_PITSTOPS = {
+    "Season": "int16",
+    "RaceNumber": "int8",
+    "DriverId": "category",
+    "DriverNumber": "Int16",    # entero con nulos: hay pilotos sin número en results
+    "NPitstops": "int16",
+    "MedianPitStopDuration": "float32",
+}
+
+
+def ruta_particion(raiz, dataset, season):
+    """
+    Carpeta de una temporada dentro de un dataset, p.ej. data/pitstops/season=2021
+    """
+    return Path(raiz) / dataset / f"season={int(season)}"
+
+
+def temporada_de_ruta(path):
+    """
+    Temporada a partir del nombre de la carpeta: "2021" o "season=2021".
+    """
+    return int(Path(path).name.split("=")[-1])
+
+
+def tipar_pitstops(df):
+    """
+    Convierte el resumen de pit-stops de una carrera a sus tipos compactos.
+    """
+    df = df.copy()
+    df["DriverNumber"] = pd.to_numeric(df["DriverNumber"], errors="coerce")
+    for columna, tipo in TIPOS_PITSTOPS.items():
+        if columna in df.columns:
+            df[columna] = df[columna].astype(tipo)
+    return df
+
+
+def escribir_parquet(df, path):
+    """
+    Escribe un DataFrame en un único parquet. Escribimos en un temporal y lo
+    renombramos para no dejar nunca un archivo a medias.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporal = path.with_name(path.name + ".tmp")
+    df.to_parquet(temporal, index=False, compression="zstd")
+    os.replace(temporal, path)
+    return path
+
+
+def leer_tabla(path, columnas=None):
+    """
+    Lee un csv o un parquet según su extensión. Con columnas solo se leen
+    las que existan en el archivo (las tablas de Wikipedia no tienen todas
+    las mismas).
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        if columnas is not None:
+            import pyarrow.parquet as pq
+            disponibles = set(pq.read_schema(path).names)
+            columnas = [c for c in columnas if c in disponibles]
+        return pd.read_parquet(path, columns=columnas)
+
+    if columnas is not None:
+        return pd.read_csv(path, usecols=lambda c: c in set(columnas))
+    return pd.read_csv(path)
+
+
+def escribir_particionado(df, ruta, columna="Season"):
+    """
+    Escribe df como dataset particionado: <ruta>/season=<valor>/part.parquet.
+    Reescribe el dataset entero (borramos lo que hubiera antes).
+    """
+    ruta = Path(ruta)
+    if ruta.exists():
+        shutil.rmtree(ruta)
+    for valor, parte in df.groupby(columna, observed=True, sort=True):
+        escribir_parquet(parte, ruta / f"season={int(valor)}" / "part.parquet")
+    return ruta
+
+
+def escribir_particion(df, ruta, season):
+    """
+    Sustituye solo la partición de una temporada dentro de un dataset.
+    """
+    return escribir_parquet(df, Path(ruta) / f"season={int(season)}" / "part.parquet")
+
+
+def borrar_particion(ruta, season):
+    carpeta = Path(ruta) / f"season={int(season)}"
+    if carpeta.exists():
+        shutil.rmtree(carpeta)
+
+
+def temporadas_particionadas(ruta):
+    ruta = Path(ruta)
+    if not ruta.is_dir():
+        return []
+    return sorted(temporada_de_ruta(p) for p in ruta.iterdir() if p.is_dir() and p.name.startswith("season="))
+
+
+def leer_particionado(ruta, columnas=None, temporadas=None):
+    """
+    Lee un dataset particionado por temporada leyendo solo las particiones de
+    `temporadas` (todas si es None) y solo las `columnas` pedidas.
+    La columna Season sale del nombre de la partición si no está en el archivo.
+    """
+    ruta = Path(ruta)
+    partes = []
+    for season in temporadas_particionadas(ruta):
+        if temporadas is not None and season not in temporadas:
+            continue
+        for archivo in sorted((ruta / f"season={season}").glob("*.parquet")):
+            parte = leer_tabla(archivo, columnas)
+            if "Season" not in parte.columns and (columnas is None or "Season" in columnas):
+                parte["Season"] = pd.Series(season, index=parte.index, dtype="int16")
+            partes.append(parte)
+
+    if not partes:
+        return pd.DataFrame(columns=columnas or [])
+    return pd.concat(partes, ignore_index=True)
+
+
+def convertir_arbol_csv(data_dir="data", borrar_csv=False):
+    """
+    Pasa el árbol antiguo data/<year>/*.csv (y data/final_merged.csv si
+    existe) al formato particionado. Los resultados de Wikipedia se guardan
+    con los tipos que infiere pandas y los pit-stops y las listas de pilotos
+    con TIPOS_PITSTOPS.
+
+    Devuelve el número de archivos convertidos.
+    """
+    base = Path(data_dir)
+    convertidos = 0
+
+    for season_path in sorted(p for p in base.iterdir() if p.is_dir() and p.name.isdigit()):
+        season = int(season_path.name)
+        for archivo in sorted(season_path.glob("*.csv")):
+            df = pd.read_csv(archivo)
+            if archivo.name.endswith("_pitstops.csv"):
+                df = tipar_pitstops(df)
+                destino = ruta_particion(base, "pitstops", season) / f"{archivo.stem}.parquet"
+            elif archivo.name.endswith("_drivers.csv"):
+                df = tipar_pitstops(df)
+                destino = ruta_particion(base, "pilotos", season) / f"{archivo.stem}.parquet"
+            elif archivo.name == "calendar.csv":
+                destino = ruta_particion(base, "calendario", season) / "calendar.parquet"
+            elif archivo.name == "dim_pilotos.csv":
+                destino = ruta_particion(base, "dim_pilotos", season) / "part.parquet"
+            else:
+                df = df.convert_dtypes()
+                destino = ruta_particion(base, "resultados", season) / f"{archivo.stem}.parquet"
+            escribir_parquet(df, destino)
+            convertidos += 1
+            if borrar_csv:
+                archivo.unlink()
+
+    final_csv = base / "final_merged.csv"
+    if final_csv.exists():
+        escribir_particionado(pd.read_csv(final_csv, low_memory=False), base / "final_merged.parquet")
+        convertidos += 1
+
+    print(f"[FINALIZADO] {convertidos} archivos convertidos a parquet en {base}")
+    return convertidos
+
+
+if __name__ == "__main__":
+    convertir_arbol_csv("data")
@@ -6,9 +6,239 @@
 
 import scrapy
 import pandas as pd
+import re
+import json
+import hashlib
+import shutil
+from datetime import datetime
 from pathlib import Path
 from io import StringIO
 from scrapy.crawler import CrawlerProcess
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import defer, threads
+from almacenamiento import ruta_particion, escribir_parquet
+from metricas import METRICAS
+
+
+def nombre_carrera(url):
+    """
+    Nombre del artículo de la carrera a partir de su url, que usamos como
+    nombre del csv. Por ejemplo .../wiki/2013_Australian_Grand_Prix#Report
+    -> 2013_Australian_Grand_Prix
+    """
+    return url.split("/wiki/")[1].split("#")[0]
+
+
+PRIMERA_TEMPORADA = 1950
+CONCURRENCIA_BACKFILL = 64
+
+
+def url_temporada(year):
+    return f"https://en.wikipedia.org/wiki/{year}_Formula_One_World_Championship"    # las temporadas antiguas redirigen a "..._season" y Scrapy sigue la redirección
+
+
+def temporadas_backfill():
+    return list(range(PRIMERA_TEMPORADA, datetime.now().year + 1))
+
+
+def temporada_cerrada(year):
+    return int(year) < datetime.now().year
+
+
+def _oculto(elem):
+    return elem.tag in ("sup", "style", "script") or "display:none" in (elem.get("style") or "").replace(" ", "")
+
+
+def _recorrer_texto(elem, partes):
+    if elem.text:
+        partes.append(elem.text)
+    for hijo in elem:
+        if isinstance(hijo.tag, str) and not _oculto(hijo):    # los comentarios html no tienen tag de texto
+            _recorrer_texto(hijo, partes)
+        if hijo.tail:    # lo que va detrás de una nota al pie sí es texto visible
+            partes.append(hijo.tail)
+
+
+def texto_celda(celda):
+    """
+    Texto visible de una celda (elemento lxml): sin notas al pie (<sup>),
+    sin estilos y sin lo que Wikipedia oculta con display:none. Recorremos
+    el árbol a mano, que es bastante más rápido que un XPath por celda.
+    """
+    partes = []
+    _recorrer_texto(celda, partes)
+    texto = " ".join("".join(partes).split())    # juntamos y normalizamos espacios (incluidos los &nbsp;)
+    return re.sub(r"\[[^\]]*\]", "", texto).strip()    # por si queda algún marcador tipo [a] o [1] fuera de <sup>
+
+
+def entero_atributo(celda, nombre):
+    valor = re.match(r"\d+", celda.get(nombre, "1") or "1")
+    return max(int(valor.group()), 1) if valor else 1
+
+
+def filas_tabla(tabla):
+    """
+    Convierte una tabla (elemento lxml) en una lista de filas de texto
+    ya expandidas: una celda con colspan=n ocupa n columnas y una con
+    rowspan=n se repite en las n-1 filas siguientes, igual que hace read_html.
+    """
+    filas = []
+    arrastradas = {}    # columna -> [filas que le quedan, texto] de las celdas con rowspan
+
+    for tr in tabla.xpath("./tr | ./thead/tr | ./tbody/tr | ./tfoot/tr"):
+        celdas = [c for c in tr if c.tag in ("th", "td")]
+        fila = []
+        i = 0
+        while i < len(celdas) or len(fila) in arrastradas:
+            col = len(fila)
+            if col in arrastradas:    # esta columna la ocupa una celda de una fila anterior
+                arrastradas[col][0] -= 1
+                fila.append(arrastradas[col][1])
+                if arrastradas[col][0] == 0:
+                    del arrastradas[col]
+                continue
+
+            celda = celdas[i]
+            i += 1
+            texto = texto_celda(celda)
+            rowspan = entero_atributo(celda, "rowspan")
+            for _ in range(entero_atributo(celda, "colspan")):
+                if rowspan > 1:
+                    arrastradas[len(fila)] = [rowspan - 1, texto]
+                fila.append(texto)
+
+        if fila:
+            filas.append(fila)
+    return filas
+
+
+def columnas_unicas(cabecera):
+    """
+    Nombres de columna sin repetir: igual que pandas, a la segunda
+    aparición de "Laps" la llamamos "Laps.1".
+    """
+    vistos = {}
+    columnas = []
+    for nombre in cabecera:
+        if nombre in vistos:
+            vistos[nombre] += 1
+            columnas.append(f"{nombre}.{vistos[nombre]}")
+        else:
+            vistos[nombre] = 0
+            columnas.append(nombre)
+    return columnas
+
+
+def cabecera_tabla(tabla):
+    """
+    Textos de la primera fila de una tabla (elemento lxml).
+    """
+    primera = tabla.xpath("(./tr | ./thead/tr | ./tbody/tr)[1]")
+    return [texto_celda(c) for c in primera[0] if c.tag in ("th", "td")] if primera else []
+
+
+# Firma de la tabla de la temporada con los enlaces a los informes de cada
+# carrera. Su posición cambia según la época (calendario, resultados,
+# carreras fuera del campeonato...), así que la reconocemos por sus columnas:
+# tiene que tener Report y la carrera, y preferimos la que además numera las
+# rondas (las carreras fuera del campeonato no tienen ronda).
+COLUMNAS_INFORME = {"report"}
+COLUMNAS_CARRERA = {"grand prix", "race", "race name", "event"}
+COLUMNAS_RONDA = {"round", "rnd", "rd", "r"}
+
+
+def puntuar_cabecera(cabecera):
+    """
+    0 si la cabecera no es la de la tabla de informes, 1 si lo es pero sin
+    columna de ronda y 2 si la tiene.
+    """
+    nombres = {c.lower().rstrip(".").strip() for c in cabecera}
+    if not nombres & COLUMNAS_INFORME or not nombres & COLUMNAS_CARRERA:
+        return 0
+    return 2 if nombres & COLUMNAS_RONDA else 1
+
+
+def buscar_tabla_informes(response):
+    """
+    Tabla (Selector) de la página de una temporada con los enlaces a los
+    informes de carrera, elegida por la firma de su cabecera y no por su
+    posición. Devuelve (tabla, cabeceras): si ninguna encaja, tabla es None
+    y cabeceras son las de todas las wikitable vistas, para poder revisar la
+    página después.
+    """
+    mejor, puntos, cabeceras = None, 0, []
+    for tabla in response.css("table.wikitable"):
+        cabecera = cabecera_tabla(tabla.root)
+        cabeceras.append(cabecera)
+        p = puntuar_cabecera(cabecera)
+        if p > puntos:
+            mejor, puntos = tabla, p
+    return mejor, cabeceras
+
+
+def enlace_informe(fila):
+    """
+    Enlace al informe de una fila de la tabla: el que tiene por texto
+    "Report" y, si no hay, el de la última celda (como hacíamos antes).
+    """
+    return (fila.xpath(".//a[normalize-space()='Report']/@href").get()
+            or fila.css("td:last-child a::attr(href)").get())
+
+
+def extraer_filas_resultados(response):
+    """
+    Busca, con selectores sobre la respuesta ya parseada por Scrapy, la
+    primera tabla con columnas Driver y Constructor y devuelve solo esa
+    tabla como (columnas, filas). read_html construía un DataFrame por cada
+    tabla de la página.
+
+    Igual que antes, las tablas con cabecera de varias filas no cuentan
+    (read_html les daba columnas MultiIndex y no pasaban el filtro).
+    Devuelve None si no hay ninguna tabla válida.
+    """
+    for tabla in response.xpath("//table"):
+        tabla = tabla.root    # a partir de aquí trabajamos con lxml directamente, sin crear un Selector por celda
+        primera = tabla.xpath("(./tr | ./thead/tr | ./tbody/tr)[1]")
+        celdas = [c for c in primera[0] if c.tag in ("th", "td")] if primera else []
+        if not celdas or any(entero_atributo(c, "rowspan") > 1 for c in celdas):
+            continue
+
+        cabecera = [texto_celda(c) for c in celdas]
+        if "Driver" not in cabecera or "Constructor" not in cabecera:
+            continue
+
+        filas = filas_tabla(tabla)
+        columnas = columnas_unicas(filas[0])
+        n = len(columnas)
+        cuerpo = [(fila + [None] * n)[:n] for fila in filas[1:]]    # rellenamos o recortamos cada fila al ancho de la cabecera
+        return columnas, cuerpo
+    return None
+
+
+def tabla_a_dataframe(columnas, filas):
+    df = pd.DataFrame(filas, columns=columnas)
+    return df.where(df != "")    # celdas vacías como NaN, igual que read_html
+
+
+def extraer_tabla_resultados(response):
+    """
+    Igual que extraer_filas_resultados pero devolviendo ya el DataFrame.
+    """
+    tabla = extraer_filas_resultados(response)
+    return None if tabla is None else tabla_a_dataframe(*tabla)
+
+
+def extraer_tabla_read_html(html):
+    """
+    Camino antiguo: read_html sobre la página entera y nos quedamos con la
+    primera tabla con Driver y Constructor. Lo dejamos para comparar en
+    benchmarks/bench_extraccion_tabla.py.
+    """
+    for df in pd.read_html(StringIO(html)):
+        cols = [str(c) for c in df.columns]
+        if "Driver" in cols and "Constructor" in cols:
+            return df
+    return None
 
 class QuoteSpyder(scrapy.Spider):
     name = "mi_arañita"
@@ -16,53 +246,289 @@ class QuoteSpyder(scrapy.Spider):
     #    Esta variable le hace una peticion al crawler de que debe empezar por ejecutar esa url, pero es el crawler quien decide cuando lo hace.
     #    Yield entrega la peticion a Scrapy y le deja el trabajo pendiente
 
-    start_urls = [f"https://en.wikipedia.org/wiki/{year}_Formula_One_World_Championship" for year in range(2012, 2025)]
+    start_urls = [url_temporada(year) for year in range(2012, 2025)]
+
+    data_dir = "data"
+    backfill = False    # con backfill=True no se vuelven a pedir los informes de temporadas cerradas que ya están en disco
+    formato = "csv"    # o "parquet": data/resultados/season=<year>/<carrera>.parquet
+    incremental = False    # se puede activar con process.crawl(QuoteSpyder, incremental=True)
+    #    En modo incremental guardamos en data/.estado_crawl.json el hash de cada página ya procesada
+    #    y los informes de carrera de cada temporada, para no repetir trabajo en la siguiente ejecución
+
+    def ruta_sin_clasificar(self):
+        return Path(self.data_dir) / "crawl_sin_clasificar.json"
+
+    def paginas_sin_clasificar(self):
+        # url -> página. Con JOBDIR (backfill) va dentro de self.state, que Scrapy guarda al
+        # parar y recupera al reanudar: así no se pierden las de las ejecuciones anteriores
+        if not hasattr(self, "sin_clasificar"):
+            self.sin_clasificar = getattr(self, "state", {}).setdefault("sin_clasificar", {})
+        return self.sin_clasificar
+
+    def apuntar_sin_clasificar(self, url, tipo, cabeceras):
+        """
+        Guardamos las páginas de las que no hemos sabido sacar la tabla
+        (tipo "temporada" o "informe") con las cabeceras de sus tablas; al
+        cerrar se escriben en crawl_sin_clasificar.json.
+        """
+        self.paginas_sin_clasificar()[url] = {"url": url, "tipo": tipo, "cabeceras": cabeceras}
+        METRICAS.contar("paginas_sin_clasificar", tipo=tipo)
+        self.logger.warning(f"Página de {tipo} sin tabla reconocible: {url}")
+
+    def ruta_estado(self):
+        return Path(self.data_dir) / ".estado_crawl.json"
+
+    def cargar_estado(self):
+        if not hasattr(self, "estado"):
+            self.estado = {"paginas": {}, "temporadas": {}}
+            ruta = self.ruta_estado()
+            if self.incremental and ruta.exists():
+                self.estado = json.loads(ruta.read_text(encoding="utf-8"))
+        return self.estado
+
+    def ruta_salida(self, year, url):
+        if self.formato == "parquet":
+            return ruta_particion(self.data_dir, "resultados", year) / f"{nombre_carrera(url)}.parquet"
+        return Path(self.data_dir) / year / f"{nombre_carrera(url)}.csv"
+
+    def pagina_sin_cambios(self, response):
+        """
+        Compara el hash del contenido con el de la última vez. Si ha cambiado
+        (o es nueva) actualizamos el estado y devolvemos False.
+        """
+        huella = hashlib.sha256(response.body).hexdigest()
+        paginas = self.cargar_estado()["paginas"]
+        if paginas.get(response.url) == huella:
+            return True
+        paginas[response.url] = huella
+        return False
+
+    def temporada_al_dia(self, year):
+        """
+        Una temporada cerrada está al día si ya conocemos todos sus informes y
+        todos tienen su csv escrito.
+        """
+        informes = self.cargar_estado()["temporadas"].get(year)
+        return temporada_cerrada(year) and bool(informes) and all(self.ruta_salida(year, url).exists() for url in informes)
+
+    def start_requests(self):
+        for url in self.start_urls:
+            year = url.split("/")[-1].split("_")[0]
+            if self.incremental and self.temporada_al_dia(year):    # temporada cerrada y completa: ni la pedimos
+                continue
+            yield scrapy.Request(url, callback=self.parse, meta={"year": year})    # el año va en meta: las temporadas antiguas redirigen a otra url
+
+    async def start(self):    # desde Scrapy 2.13 se usa start() y no start_requests(); mantenemos los dos
+        for request in self.start_requests():
+            yield request
+
+    def closed(self, reason):
+        apuntar_estadisticas(self.crawler.stats.get_stats())
+        sin_clasificar = list(self.paginas_sin_clasificar().values())
+        ruta = self.ruta_sin_clasificar()
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta.write_text(json.dumps(sin_clasificar, indent=1, ensure_ascii=False), encoding="utf-8")
+        if sin_clasificar:
+            print(f"[AVISO] {len(sin_clasificar)} páginas sin tabla reconocible (ver {ruta})")
+        if self.incremental:    # guardamos el estado para la próxima ejecución
+            ruta = self.ruta_estado()
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            ruta.write_text(json.dumps(self.cargar_estado(), indent=1), encoding="utf-8")
 
     def parse(self, response):
-        tables = response.css("table.wikitable")    # obtenemos una lista de todas las tablas de la pagina web
-        tabla = tables[3] # la cuarta tabla en la pagina web es la que nos interesa
-        
-        year = response.url.split("/")[-1].split("_")[0]
+        year = response.meta.get("year") or response.url.split("/")[-1].split("_")[0]
+        if self.incremental and self.pagina_sin_cambios(response) and self.temporada_al_dia(year):
+            return    # la página no ha cambiado y ya tenemos todos sus informes
+
+        # antes cogíamos tables[3], pero la posición de la tabla cambia de una época a otra:
+        # la buscamos por sus columnas (ver buscar_tabla_informes)
+        tabla, cabeceras = buscar_tabla_informes(response)
+        if tabla is None:
+            self.apuntar_sin_clasificar(response.url, "temporada", cabeceras)
+            return
         
+        informes = []
         rows = tabla.css("tr")[1:]    # quitamos cabecera
 
         for row in rows:    # por cada fila en la tabla
-            cells = row.css("td")    # cogemos las celdas en esa fila
-            if not cells:
+            if not row.css("td"):    # filas solo de cabecera
                 continue
             
-            report_cell = cells[-1]    # la ultima celda es la del report
-            link = report_cell.css("a::attr(href)").get()    # se coge el link de esa celda
+            link = enlace_informe(row)    # se coge el link del report
             if not link:
                 continue
 
+            url = response.urljoin(link)
+            informes.append(url)
+            if (self.incremental or self.backfill) and temporada_cerrada(year) and self.ruta_salida(year, url).exists():
+                continue    # informe de una temporada cerrada que ya tenemos: no cambia, no lo pedimos
+
             yield response.follow(link, callback=self.parse2, meta={"year": year})    # pedirle a scrpay que recorra esta web cuando pueda
 
+        self.cargar_estado()["temporadas"][year] = informes
+
     def parse2(self, response):
-        dfs = pd.read_html(response.text)     # cogemos todas las tablas de la pagina web
         year = response.meta["year"]    # el año que estamos analizando lo cogemos de meta, que nos lo pasa la funcion parse
-
-        race_df = None
+        if self.incremental and self.pagina_sin_cambios(response) and self.ruta_salida(year, response.url).exists():
+            return    # mismo contenido que la última vez: no hace falta volver a parsear
 
         # quedarnos con la primera tabla que tenga columna Driver, porque en una pagina es la segunda pero en otras la cuarta
-        for df in dfs:
-            cols = [str(c) for c in df.columns]
-            if "Driver" in cols and "Constructor" in cols:
-                race_df = df
-                break
+        with METRICAS.cronometro("extraccion_tabla"):
+            tabla = extraer_filas_resultados(response)
         
         # si no encontramos tabla válida, salimos sin romper nada
-        if race_df is None:
+        if tabla is None:
+            cabeceras = [cabecera_tabla(t.root) for t in response.css("table.wikitable")]
+            self.apuntar_sin_clasificar(response.url, "informe", cabeceras)
             return
 
-        base_path = Path("data") / year     # si no existe la carpeta data, lo crea, pero no da error si ya existe
-        base_path.mkdir(parents=True, exist_ok=True)
+        columnas, filas = tabla
+        yield {
+            "year": year,
+            "race_name": nombre_carrera(response.url),     # para ponerle el nombre correspondiente al csv que se va a crear
+            "columnas": columnas,
+            "filas": filas,
+        }    # el DataFrame y el csv los hace GuardarCarrerasPipeline fuera del hilo del reactor
+
+
+def apuntar_estadisticas(stats):
+    """
+    Pasamos a METRICAS lo que ya cuenta Scrapy: peticiones por código de
+    respuesta, bytes descargados, reintentos y 429 de Wikipedia.
+    """
+    for nombre, valor in stats.items():
+        if nombre.startswith("downloader/response_status_count/"):
+            METRICAS.contar("peticiones_http", valor, api="wikipedia", resultado=nombre.rsplit("/", 1)[1])
+    METRICAS.contar("bytes_recibidos", stats.get("downloader/response_bytes", 0), api="wikipedia")
+    METRICAS.contar("reintentos", stats.get("retry/count", 0), api="wikipedia")
+    METRICAS.contar("limite_tasa", stats.get("downloader/response_status_count/429", 0), api="wikipedia")
+    METRICAS.contar("cache_http", stats.get("httpcache/hit", 0), resultado="acierto")
+
+
+class GuardarCarrerasPipeline:
+    """
+    Pipeline de Scrapy que convierte los items de parse2 en DataFrame y los
+    escribe como data/<year>/<race_name>.csv.
+
+    pandas y la escritura a disco bloquean, así que no los hacemos en el
+    hilo del reactor de Twisted: acumulamos los items en lotes de
+    LOTE_ESCRITURA y cada lote se escribe en el pool de hilos del reactor
+    (deferToThread). Mientras tanto el crawler sigue descargando.
+    Al cerrar la araña esperamos a que terminen todas las escrituras.
+    """
+    def __init__(self, crawler=None, tam_lote=8):
+        self.crawler = crawler
+        self.tam_lote = tam_lote
+        self.lote = []
+        self.en_curso = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler, crawler.settings.getint("LOTE_ESCRITURA", 8))
 
-        race_name = response.url.split("/wiki/")[1].split("#")[0]     # para ponerle el nombre correspondiente al csv que se va a crear
-        race_df.to_csv(base_path / f"{race_name}.csv", index=False)
+    # el argumento spider es opcional: las versiones nuevas de Scrapy ya no lo pasan
+    def open_spider(self, spider=None):
+        spider = spider or self.crawler.spider
+        self.data_dir = Path(getattr(spider, "data_dir", "data"))
+        self.formato = getattr(spider, "formato", "csv")
+        self.logger = spider.logger
+
+    def process_item(self, item, spider=None):
+        self.lote.append(item)
+        if len(self.lote) >= self.tam_lote:
+            self.vaciar()
+        return item
+
+    def vaciar(self):
+        lote, self.lote = self.lote, []
+        d = threads.deferToThread(self.escribir_lote, lote, self.data_dir, self.formato)
+        self.en_curso.add(d)
+        d.addErrback(lambda fallo: self.logger.error(f"Error escribiendo csv: {fallo.getErrorMessage()}"))
+        d.addBoth(lambda _: self.en_curso.discard(d))
+
+    async def close_spider(self, spider=None):
+        if self.lote:
+            self.vaciar()
+        await maybe_deferred_to_future(defer.DeferredList(list(self.en_curso)))    # Scrapy espera a que terminen las escrituras antes de cerrar
+
+    @staticmethod
+    def escribir_lote(lote, data_dir, formato="csv"):
+        for item in lote:
+            race_df = tabla_a_dataframe(item["columnas"], item["filas"])
+            METRICAS.filas("crawl", entrada=len(item["filas"]), salida=len(race_df))
+
+            with METRICAS.cronometro("escritura", formato=formato):
+                if formato == "parquet":    # particionado por temporada y con tipos (ver almacenamiento.py)
+                    destino = ruta_particion(data_dir, "resultados", item["year"]) / f"{item['race_name']}.parquet"
+                    escribir_parquet(race_df.convert_dtypes(), destino)
+                    continue
+
+                base_path = data_dir / item["year"]     # si no existe la carpeta data, lo crea, pero no da error si ya existe
+                base_path.mkdir(parents=True, exist_ok=True)
+                race_df.to_csv(base_path / f"{item['race_name']}.csv", index=False)
         
         
-def run_part_i():
-    process = CrawlerProcess()
-    process.crawl(QuoteSpyder)
-    process.start()
\ No newline at end of file
+def run_part_i(incremental=False, concurrencia=None, formato="csv", seasons=None, data_dir="data", backfill=False):
+    """
+    Lanza el crawler. Con incremental=True además activamos la caché HTTP de
+    Scrapy con la política RFC2616, que guarda ETag/Last-Modified y hace
+    peticiones condicionales, de forma que las páginas que no han cambiado
+    vuelven como 304 sin descargarse de nuevo.
+
+    La escritura de los csv va por GuardarCarrerasPipeline, así que el
+    rendimiento lo marca la concurrencia de descargas. AutoThrottle ajusta
+    el ritmo a la latencia de Wikipedia para no saturarla.
+
+    formato="parquet" guarda las tablas particionadas por temporada en vez
+    de un csv por carrera (ver almacenamiento.py).
+
+    seasons permite elegir las temporadas (por defecto las de start_urls) y
+    data_dir la carpeta de salida.
+
+    backfill=True es para descargar todo el histórico (por defecto desde
+    1950, ver temporadas_backfill) de una vez:
+    - más concurrencia (CONCURRENCIA_BACKFILL) y AutoThrottle para no pasarse
+    - la cola de peticiones va a disco (JOBDIR en <data_dir>/.crawl_backfill),
+      así que la memoria no crece con el número de temporadas y si se corta
+      (Ctrl+C una vez) se puede relanzar y sigue donde se quedó; si termina
+      bien se borra
+    - primero se terminan los informes de una temporada y luego se piden
+      más temporadas (DEPTH_PRIORITY negativa), para no acumular pendientes
+    - no se vuelven a pedir los informes de temporadas cerradas ya guardados
+    Las páginas cuya tabla no se reconoce se apuntan en
+    <data_dir>/crawl_sin_clasificar.json.
+    """
+    concurrencia = concurrencia or (CONCURRENCIA_BACKFILL if backfill else 32)
+    settings = {
+        "ITEM_PIPELINES": {"apartado_1.GuardarCarrerasPipeline": 300},
+        "LOTE_ESCRITURA": 8,
+        "CONCURRENT_REQUESTS": concurrencia,
+        "CONCURRENT_REQUESTS_PER_DOMAIN": concurrencia,    # todo va contra en.wikipedia.org
+        "AUTOTHROTTLE_ENABLED": True,
+        "AUTOTHROTTLE_START_DELAY": 0.25,
+        "AUTOTHROTTLE_MAX_DELAY": 10,
+        "AUTOTHROTTLE_TARGET_CONCURRENCY": max(concurrencia / 4, 1.0),
+        "REACTOR_THREADPOOL_MAXSIZE": 8,    # hilos para las escrituras del pipeline
+    }
+    if incremental:
+        settings.update({
+            "HTTPCACHE_ENABLED": True,
+            "HTTPCACHE_POLICY": "scrapy.extensions.httpcache.RFC2616Policy",
+            "HTTPCACHE_DIR": "httpcache",    # relativo a la carpeta .scrapy del proyecto
+        })
+    if backfill:
+        settings.update({
+            "JOBDIR": str(Path(data_dir) / ".crawl_backfill"),
+            "DEPTH_PRIORITY": -1,    # los informes (profundidad 1) antes que nuevas temporadas
+            "MEMUSAGE_WARNING_MB": 1024,    # aviso en el log si aun así la memoria se dispara
+        })
+        seasons = seasons if seasons is not None else temporadas_backfill()
+    process = CrawlerProcess(settings)
+    opciones = {"incremental": incremental, "formato": formato, "data_dir": data_dir, "backfill": backfill}
+    if seasons is not None:
+        opciones["start_urls"] = [url_temporada(year) for year in seasons]
+    crawler = process.create_crawler(QuoteSpyder)
+    process.crawl(crawler, **opciones)
+    process.start()
+    if backfill and crawler.stats.get_value("finish_reason") == "finished":
+        shutil.rmtree(settings["JOBDIR"], ignore_errors=True)    # terminado: el próximo backfill empieza de cero (si no, su filtro de duplicados lo descartaría todo)
\ No newline at end of file
@@ -6,13 +6,258 @@
 
 import pandas as pd
 import requests 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import ReadTimeoutError
 import time #para hacer pausas en los requests y evitar hacer demasiadas peticiones al servidor en poco tiempo
 import os #permite crear carpetas y rutas
+import threading #para compartir el limitador de peticiones entre hilos
+import re
+import json
+import hashlib #para direccionar la caché por contenido (hash de url + parámetros)
+from datetime import datetime
+from email.utils import parsedate_to_datetime #para leer Retry-After cuando viene como fecha HTTP
+from almacenamiento import ruta_particion, escribir_parquet, tipar_pitstops
+from paradas import guardar_paradas #pit-stops en bruto, una fila por parada (ver paradas.py)
+from metricas import METRICAS #contadores y tiempos de la etapa (ver metricas.py)
+from concurrent.futures import ThreadPoolExecutor, as_completed #pool de hilos acotado para el modo concurrente
 
-BASE = "https://api.jolpi.ca/ergast/f1" #url base de Jolpica (que replica el esquema de Ergast)
+BASE = os.environ.get("JOLPICA_BASE", "https://api.jolpi.ca/ergast/f1") #url base de Jolpica (que replica el esquema de Ergast); JOLPICA_BASE permite apuntar a otro servidor (p.ej. benchmarks/servidor_jolpica.py)
+TIMEOUT_PETICION = 60 #segundos que esperamos una respuesta antes de reintentar
+BACKOFF_BASE = 1.0 #primera espera del backoff exponencial (1, 2, 4... segundos)
+POR_HORA_JOLPICA = 500 #límite sostenido de Jolpica: 500 peticiones por hora (además de ráfagas de 4/s)
 
 
-def peticion_json(url, params, max_reintentos=6, sleep_base=1.0):
+class LimitadorTasa:
+    """
+    Token bucket compartido por todos los hilos que hacen peticiones.
+
+    El cubo se rellena a razón de `tasa` tokens por segundo hasta un máximo
+    de `capacidad`. Cada petición consume un token y, si no queda ninguno,
+    el hilo espera solo lo necesario hasta que se genere el siguiente.
+    Así el ritmo total de peticiones al servidor queda acotado da igual
+    cuántos hilos estén descargando a la vez.
+
+    Jolpica tiene dos límites: 4 peticiones/s en ráfaga y 500 por hora. Con
+    por_hora encadenamos un segundo cubo de `por_hora` tokens que se rellena
+    a por_hora/3600 por segundo: cada petición necesita un token de cada
+    cubo, así que una descarga corta va a 4/s y una larga baja sola a unas
+    500 por hora. El cupo es por proceso (None = sin límite por hora).
+    """
+    def __init__(self, tasa=4.0, capacidad=4, por_hora=POR_HORA_JOLPICA):
+        self.tasa = float(tasa) #tokens que se generan por segundo
+        self.capacidad = float(capacidad) #ráfaga máxima permitida
+        self.tokens = float(capacidad) #empezamos con el cubo lleno
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+        self.hora = LimitadorTasa(tasa=por_hora / 3600, capacidad=por_hora, por_hora=None) if por_hora else None
+
+    def adquirir(self):
+        if self.hora is not None: #primero el cupo de la hora, después el de la ráfaga
+            self.hora.adquirir()
+        while True:
+            with self.lock:
+                ahora = time.monotonic()
+                self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa) #rellenamos según el tiempo transcurrido
+                self.ultimo = ahora
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                espera = (1 - self.tokens) / self.tasa #lo que falta para el siguiente token
+            METRICAS.dormir(espera, "limitador") #esperamos fuera del lock para no bloquear al resto de hilos
+
+
+LIMITADOR = None #si está definido (modo concurrente), todas las peticiones pasan por él
+
+
+class CacheRespuestas:
+    """
+    Caché en disco de las respuestas JSON de la API.
+
+    Cada respuesta se guarda en <directorio>/<hash[:2]>/<hash>.json, siendo
+    hash el sha256 de la url junto con los parámetros ordenados, de modo que
+    la misma petición siempre cae en el mismo fichero.
+
+    Reglas de frescura:
+        - temporadas cerradas (anteriores al año actual): no caducan nunca,
+          sus resultados ya no cambian
+        - temporada actual o urls sin temporada: caducan tras `ttl` segundos
+
+    Si el tamaño total supera `max_bytes` borramos las entradas usadas hace
+    más tiempo (LRU, usando el mtime que actualizamos en cada acierto).
+
+    Con offline=True nunca se sale a la red: se sirve cualquier respuesta
+    guardada (aunque esté caducada) y si falta alguna se lanza un error.
+    """
+    def __init__(self, directorio="data/.cache_http", ttl=6 * 3600, max_bytes=200 * 1024 * 1024, offline=False):
+        self.directorio = directorio
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+        self.bytes_totales = sum(os.path.getsize(r) for r in self._ficheros()) #tamaño actual de la caché
+
+    def _ficheros(self):
+        for raiz, _, nombres in os.walk(self.directorio):
+            for nombre in nombres:
+                if nombre.endswith(".json"):
+                    yield os.path.join(raiz, nombre)
+
+    @staticmethod
+    def clave(url, params):
+        contenido = json.dumps({"url": url, "params": params or {}}, sort_keys=True)
+        return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave[:2], f"{clave}.json")
+
+    @staticmethod
+    def temporada_de(url):
+        #la temporada es el primer tramo de la ruta tras BASE: {BASE}/2021/5/results.json o {BASE}/2021.json
+        #(BASE puede no acabar en /f1, p.ej. el servidor local de los benchmarks)
+        base = BASE.rstrip("/")
+        if not url.startswith(base + "/"):
+            return None
+        encontrado = re.match(r"(\d{4})(?:/|\.json|$)", url[len(base) + 1:])
+        return int(encontrado.group(1)) if encontrado else None
+
+    def es_fresca(self, url, guardado):
+        temporada = self.temporada_de(url)
+        if temporada is not None and temporada < datetime.now().year: #temporada cerrada
+            return True
+        return time.time() - guardado < self.ttl
+
+    def obtener(self, url, params):
+        ruta = self._ruta(self.clave(url, params))
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                entrada = json.load(f)
+        except (OSError, ValueError): #no está o está corrupta
+            if self.offline:
+                raise RuntimeError(f"Modo offline: no hay respuesta en caché para {url} {params}")
+            return None
+
+        if not self.offline and not self.es_fresca(url, entrada["guardado"]):
+            return None
+
+        try:
+            os.utime(ruta) #marcamos el uso para el LRU
+        except OSError:
+            pass
+        return entrada["datos"]
+
+    def guardar(self, url, params, datos):
+        ruta = self._ruta(self.clave(url, params))
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        contenido = json.dumps({"url": url, "params": params or {}, "guardado": time.time(), "datos": datos})
+
+        with self.lock:
+            anterior = os.path.getsize(ruta) if os.path.exists(ruta) else 0
+            temporal = f"{ruta}.{threading.get_ident()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                f.write(contenido)
+            os.replace(temporal, ruta) #escritura atómica, nunca dejamos un json a medias
+            self.bytes_totales += os.path.getsize(ruta) - anterior
+            if self.bytes_totales > self.max_bytes:
+                self._desalojar()
+
+    def _desalojar(self):
+        """
+        Borra las entradas menos usadas hasta quedarnos en el 90% del límite.
+        """
+        entradas = sorted((os.stat(r).st_mtime, os.path.getsize(r), r) for r in self._ficheros())
+        for _, tam, ruta in entradas:
+            if self.bytes_totales <= 0.9 * self.max_bytes:
+                break
+            os.remove(ruta)
+            self.bytes_totales -= tam
+
+
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504} #rate limit y fallos del servidor: merece la pena reintentar
+
+
+def crear_sesion(max_conexiones=8, reintentos_conexion=3):
+    """
+    Crea la sesión HTTP compartida de la parte II.
+
+    - pool de conexiones keep-alive: reutilizamos la conexión TCP/TLS en
+      vez de abrir una nueva en cada petición
+    - como mucho `max_conexiones` conexiones abiertas con el mismo host
+      (pool_block hace que el resto de hilos esperen a que quede una libre)
+    - respuestas comprimidas con gzip
+    - reintentos a nivel de transporte solo para fallos al conectar (la
+      petición no llegó a salir); los 429/5xx los gestiona peticion_json
+      para poder respetar Retry-After y pasar por el limitador
+    """
+    sesion = requests.Session()
+    reintentos = Retry(total=reintentos_conexion, connect=reintentos_conexion, read=0, status=0,
+                       backoff_factor=0.5, allowed_methods=frozenset(["GET"]),
+                       respect_retry_after_header=False, raise_on_status=False) #si no, un 429 con Retry-After acaba en RetryError antes de llegar a peticion_json
+    adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=max_conexiones, pool_block=True, max_retries=reintentos)
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    sesion.headers.update({"Accept": "application/json", "Accept-Encoding": "gzip, deflate"})
+    return sesion
+
+
+SESION = None #sesión compartida por todas las peticiones (se crea la primera vez que se usa)
+_LOCK_SESION = threading.Lock()
+
+
+def obtener_sesion():
+    global SESION
+    with _LOCK_SESION:
+        if SESION is None:
+            SESION = crear_sesion()
+        return SESION
+
+
+def configurar_sesion(max_conexiones=8, reintentos_conexion=3):
+    """
+    Sustituye la sesión compartida por una nueva con otro tamaño de pool.
+    """
+    global SESION
+    with _LOCK_SESION:
+        if SESION is not None:
+            SESION.close()
+        SESION = crear_sesion(max_conexiones, reintentos_conexion)
+
+
+def espera_retry_after(response, por_defecto, maximo=120):
+    """
+    Segundos que hay que esperar según la cabecera Retry-After (en segundos
+    o como fecha HTTP). Si no viene o no se entiende usamos `por_defecto`.
+    """
+    valor = response.headers.get("Retry-After")
+    if not valor:
+        return por_defecto
+    try:
+        segundos = float(valor)
+    except ValueError:
+        try:
+            fecha = parsedate_to_datetime(valor)
+            segundos = (fecha - datetime.now(fecha.tzinfo)).total_seconds()
+        except (TypeError, ValueError):
+            return por_defecto
+    return min(max(segundos, 0.0), maximo)
+
+
+def tipo_fallo_red(error):
+    """
+    "timeout" o "conexion". Con read=0 en el Retry de la sesión un timeout
+    de lectura no llega como Timeout sino como ConnectionError que lo envuelve.
+    """
+    motivo = getattr(error.args[0], "reason", None) if error.args else None
+    return "timeout" if isinstance(error, requests.exceptions.Timeout) or isinstance(motivo, ReadTimeoutError) else "conexion"
+
+
+CACHE = None #si está definida, peticion_json la consulta antes de ir a la red
+PETICIONES_RED = 0 #peticiones que han salido realmente a la red (las servidas por la caché no cuentan)
+_LOCK_PETICIONES = threading.Lock() #en modo concurrente varios hilos suman a la vez y "+= 1" no es atómico
+
+
+def peticion_json(url, params, max_reintentos=6, sleep_base=None):
     """
     Hemos tenido que implementar esta función para hacer las peticiones
     que hemos obtenido con ayuda de la inteligencia artificial ya que 
@@ -23,26 +268,74 @@ def peticion_json(url, params, max_reintentos=6, sleep_base=1.0):
     Nuestro código tardará un poco más pero nos aseguraremos que tenemos
     todos los archivos creados para los años pedidos con este manejo de 
     las peticiones
+
+    Si hay una CacheRespuestas activa la consultamos primero y guardamos
+    en ella cada respuesta correcta.
     """
+    global PETICIONES_RED
+    sleep_base = BACKOFF_BASE if sleep_base is None else sleep_base
+    if CACHE is not None:
+        datos = CACHE.obtener(url, params)
+        if datos is not None:
+            METRICAS.contar("cache_http", resultado="acierto")
+            return datos
+        METRICAS.contar("cache_http", resultado="fallo")
+
     for intento in range(max_reintentos):
+        if LIMITADOR is not None: #en modo concurrente pedimos turno al limitador compartido
+            LIMITADOR.adquirir()
+        espera = sleep_base * (2 ** intento) #backoff exponencial
+        if intento > 0:
+            METRICAS.contar("reintentos", api="jolpica")
         try:
-            response = requests.get(url, params=params, timeout=60) #realizamos la peitción
-            
-            if response.status_code == 429: #en caso de rate limiting añadimos esperas y reintentamos
-                time.sleep(sleep_base * (2 ** intento))
-                continue
+            with _LOCK_PETICIONES:
+                PETICIONES_RED += 1
+            with METRICAS.cronometro("peticion_http", api="jolpica"):
+                response = obtener_sesion().get(url, params=params, timeout=TIMEOUT_PETICION) #realizamos la peitción
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            METRICAS.contar("peticiones_http", api="jolpica", resultado=tipo_fallo_red(e))
+            METRICAS.dormir(espera, "backoff")
+            continue
 
-            response.raise_for_status()
-            return response.json() #devolvemos el archivo json
+        METRICAS.contar("peticiones_http", api="jolpica", resultado=str(response.status_code))
+        METRICAS.contar("bytes_recibidos", len(response.content), api="jolpica")
+        if response.status_code in ESTADOS_REINTENTABLES: #rate limiting o fallo del servidor: esperamos lo que nos pida y reintentamos
+            if response.status_code == 429:
+                METRICAS.contar("limite_tasa", api="jolpica")
+            METRICAS.dormir(espera_retry_after(response, espera), "retry_after")
+            continue
 
-        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
-            time.sleep(sleep_base * (2 ** intento))
-        except requests.exceptions.HTTPError:
+        if 400 <= response.status_code < 500: #el resto de 4xx (404, 400...) no se arregla reintentando
+            raise RuntimeError(f"Error {response.status_code} no reintentable: {response.url}")
 
-            time.sleep(sleep_base * (2 ** intento))
+        response.raise_for_status()
+        datos = response.json()
+        if CACHE is not None:
+            CACHE.guardar(url, params, datos)
+        return datos #devolvemos el archivo json
 
     raise RuntimeError(f"No se pudo obtener respuesta tras {max_reintentos} intentos: {url}")
 
+def calendario_temporada(temporada):
+    """
+    Devuelve el calendario de la temporada como lista de diccionarios con
+    round (entero), fecha ("YYYY-MM-DD"), nombre de la carrera y la url de
+    su artículo en Wikipedia.
+    """
+    url = f"{BASE}/{temporada}.json" #nos construimos la url para pedir el calendario de la temporada 
+    data = peticion_json(url,params={"limit":1000})
+    carreras = data["MRData"]["RaceTable"]["Races"] #extraemos usando la estructura del json la lista de carreras
+
+    calendario = []
+    for carrera in carreras:
+        calendario.append({
+            "round": int(carrera["round"]), #pasamos el round a entero (ya que estaba en string)
+            "date": carrera.get("date", ""),
+            "raceName": carrera.get("raceName", ""),
+            "url": carrera.get("url", ""),
+        })
+    return calendario
+
 def rounds_por_temporadas(temporada):
     """
     Nos permite obtener una lista con el round de todas las carreras
@@ -57,28 +350,31 @@ def rounds_por_temporadas(temporada):
     
     nota: limitamos los elementos máximos que devuelve una respuesta usando limit en parametros
     """
-    url = f"{BASE}/{temporada}.json" #nos construimos la url para pedir el calendario de la temporada 
-    data = peticion_json(url,params={"limit":1000})
-    carreras = data["MRData"]["RaceTable"]["Races"] #extraemos usando la estructura del json la lista de carreras
-    
-    lista_rounds  = []
-    for carrera in carreras:
-        p = int(carrera["round"]) #de cada carrera guardamos el round y lo pasamos a entero (ya que estaba en string)
-        lista_rounds.append(p)
-    
-    return lista_rounds
+    return [carrera["round"] for carrera in calendario_temporada(temporada)]
 
-def obtener_numero_por_piloto_en_carrera(temporada, round_number):
+def resultados_carrera(temporada, round_number):
     """
-    Mapea driverId -> number (número usado en ESA carrera), para capturar cambios como el #1.
+    Filas Results de una carrera tal cual vienen de la API (lista vacía si no hay).
     """
     url = f"{BASE}/{temporada}/{round_number}/results.json"
     datos = peticion_json(url, params={"limit": 1000})
     races = datos["MRData"]["RaceTable"]["Races"]
     if not races:
-        return {}
+        return []
+    return races[0].get("Results", [])
+
+def obtener_numero_por_piloto_en_carrera(temporada, round_number):
+    """
+    Mapea driverId -> number (número usado en ESA carrera), para capturar cambios como el #1.
+    """
+    return numeros_desde_resultados(resultados_carrera(temporada, round_number))
 
-    results = races[0].get("Results", [])
+def numeros_desde_resultados(results):
+    """
+    Construye el diccionario driverId -> number a partir de las filas
+    Results de una carrera (vengan de la petición por carrera o de la
+    descarga de la temporada entera).
+    """
     mapping = {}
     for r in results:
         driver_id = r["Driver"]["driverId"]
@@ -86,6 +382,71 @@ def obtener_numero_por_piloto_en_carrera(temporada, round_number):
         mapping[driver_id] = number
     return mapping
 
+COLUMNAS_PILOTOS = ["Season", "RaceNumber", "DriverId", "DriverNumber", "GivenName", "FamilyName", "Url"]
+
+def construir_dataframe_pilotos(temporada, round, results):
+    """
+    Nos permite construir la lista de pilotos de una carrera (una fila por
+    piloto) a partir de sus filas Results:
+    [Season, RaceNumber, DriverId, DriverNumber, GivenName, FamilyName, Url]
+
+    Es la que usa el apartado 3 para unir resultados y pit-stops con el
+    piloto correcto aunque no haya parado nunca (ver dimension_pilotos).
+    """
+    filas = []
+    for r in results:
+        piloto = r["Driver"]
+        filas.append({
+            "Season": int(temporada),
+            "RaceNumber": int(round),
+            "DriverId": piloto["driverId"],
+            "DriverNumber": r.get("number", ""), #número del coche en esa carrera
+            "GivenName": piloto.get("givenName", ""),
+            "FamilyName": piloto.get("familyName", ""),
+            "Url": piloto.get("url", ""),
+        })
+    return pd.DataFrame(filas, columns=COLUMNAS_PILOTOS)
+
+def descargar_temporada_paginada(temporada, recurso, clave, limit=100, sleep=1.2):
+    """
+    Descarga de golpe un recurso de toda la temporada
+    (/{temporada}/results.json o /{temporada}/pitstops.json) paginando con
+    offset, en lugar de ir carrera por carrera.
+
+    Cada página trae una lista de carreras y dentro de cada una las filas
+    bajo `clave` ("Results" o "PitStops"). Una misma carrera puede venir
+    partida entre dos páginas, así que vamos acumulando por round.
+
+    nota: avanzamos el offset con el limit que devuelve el servidor, porque
+    Jolpica recorta los limit demasiado grandes (máximo 100)
+
+    Devolvemos un diccionario {round: [filas]}
+    """
+    url = f"{BASE}/{temporada}/{recurso}.json"
+    por_round = {}
+    offset = 0
+
+    while True:
+        antes = PETICIONES_RED
+        datos = peticion_json(url, params={"limit": limit, "offset": offset})
+        carreras = datos["MRData"]["RaceTable"]["Races"]
+
+        leidas = 0
+        for carrera in carreras:
+            filas = carrera.get(clave, [])
+            por_round.setdefault(int(carrera["round"]), []).extend(filas)
+            leidas += len(filas)
+
+        total = int(datos["MRData"].get("total", "0"))
+        offset += int(datos["MRData"].get("limit", limit)) #lo que realmente nos ha dado el servidor
+        if leidas == 0 or offset >= total: #ya hemos leído todo
+            break
+
+        if LIMITADOR is None and PETICIONES_RED > antes: #solo esperamos si la página vino de la red
+            METRICAS.dormir(sleep, "pausa")
+
+    return por_round
+
 def descargar_pitstops_carrera(temporada, numero_ronda, limit = 1000, sleep = 1.2):
     """
     Nos permite descargar todos los pit-stops de una carrera.
@@ -133,16 +494,17 @@ def descargar_pitstops_carrera(temporada, numero_ronda, limit = 1000, sleep = 1.
         lista_pitstops.extend(pitstops) #añadimos los diccionarios que tenemos dentro de esa lista (no la lista en sí, por ello no hacemos append)
         
         total = int(datos["MRData"].get("total", "0"))
-        offset += limit #actualizamos para leer en la próxima petición desde donde nos hemos quedado
+        offset += int(datos["MRData"].get("limit", limit)) #actualizamos para leer en la próxima petición desde donde nos hemos quedado (el servidor puede darnos menos de lo pedido: Jolpica no pasa de 100)
         
         # Si ya hemos leído todo, paramos
         if offset >= total:
             break
         
-        time.sleep(sleep) #para evitar muchas peticiones en corto periodo de tiempo
+        if LIMITADOR is None: #en modo concurrente el ritmo ya lo marca el limitador
+            METRICAS.dormir(sleep, "pausa") #para evitar muchas peticiones en corto periodo de tiempo
     return lista_pitstops #devolvemos la lista con los diccionarios representando cada pitstop de esa carrera en esa temporada
 
-def construir_dataframe_pitstops(temporada, round, num_piloto_dict):
+def construir_dataframe_pitstops(temporada, round, num_piloto_dict, filas_pitstops=None):
     """
     Nos permite construir el dataframe final pedido por el enunciado.
     Tendremos una fila por piloto conteniendo las siguientes columnas
@@ -165,9 +527,12 @@ def construir_dataframe_pitstops(temporada, round, num_piloto_dict):
     
     >>Devolvemos un dataframe con todas las columnas pedidas
     
+    Si ya tenemos los pit-stops de la carrera (modo bulk, descargados con
+    toda la temporada) los pasamos en filas_pitstops y no se pide nada.
     """
     
-    filas_pitstops = descargar_pitstops_carrera(temporada,round) #usamos la función creada previamente para obtener la lista de diccionarios con la info de los pitstops
+    if filas_pitstops is None:
+        filas_pitstops = descargar_pitstops_carrera(temporada,round) #usamos la función creada previamente para obtener la lista de diccionarios con la info de los pitstops
     
     if len(filas_pitstops) == 0: #en caso de no tener pit-stops devolvemos un dataframe vacío con las mismas columnas (importante para que luego funcione todo más adelante en el proyecto)
         return pd.DataFrame(columns=["Season","RaceNumber","DriverId","DriverNumber","NPitstops","MedianPitStopDuration"]) 
@@ -194,43 +559,335 @@ def construir_dataframe_pitstops(temporada, round, num_piloto_dict):
 
 
 
-def save_race_df(df, out_dir, season, round_number):
+def save_race_df(df, out_dir, season, round_number, formato="csv", dataset="pitstops"):
     """
     Nos permite guardar el dataframe de una carrera como csv en su carpeta del 
     año correspondiente. 
     
     Nos crea una ruta, por ejemplo:
     data/2021/race_05_pitstops.csv
+
+    Con formato="parquet" lo guardamos tipado en la partición de su temporada:
+    data/pitstops/season=2021/race_05_pitstops.parquet
+
+    Con dataset="pilotos" guardamos la lista de pilotos de la carrera
+    (data/2021/race_05_drivers.csv o data/pilotos/season=2021/race_05_drivers.parquet)
     
-    No devuelve nada, solo escribe un archivo
+    Devuelve la ruta del archivo escrito
     """
-    filename = f"race_{int(round_number):02d}_pitstops.csv" #creamos los nombres que tendrán los csv que irán cambiando según la carrera y temporada
+    sufijo = "drivers" if dataset == "pilotos" else "pitstops"
+    if formato == "parquet":
+        path = ruta_particion(out_dir, dataset, season) / f"race_{int(round_number):02d}_{sufijo}.parquet"
+        return str(escribir_parquet(tipar_pitstops(df), path))
+
+    filename = f"race_{int(round_number):02d}_{sufijo}.csv" #creamos los nombres que tendrán los csv que irán cambiando según la carrera y temporada
     path = os.path.join(out_dir, str(season), filename) #creamos la ruta completa
 
     os.makedirs(os.path.dirname(path), exist_ok=True) #manejamos directorio
     df.to_csv(path, index=False) #pasamos a csv
+    return path
+
+
+def guardar_calendario(calendario, out_dir, season, formato="csv"):
+    """
+    Guarda el calendario de la temporada (round, fecha, nombre y url de
+    Wikipedia). El apartado 3 lo usa para saber a qué round corresponde
+    cada tabla de resultados del apartado 1.
+
+    data/2021/calendar.csv o data/calendario/season=2021/calendar.parquet
+    """
+    df = pd.DataFrame(calendario, columns=["round", "date", "raceName", "url"])
+    if formato == "parquet":
+        return str(escribir_parquet(df, ruta_particion(out_dir, "calendario", season) / "calendar.parquet"))
+
+    path = os.path.join(out_dir, str(season), "calendar.csv")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_csv(path, index=False)
+    return path
+
+
+def checksum_fichero(path):
+    """
+    sha256 del contenido de un archivo, para detectar csv corruptos o editados.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 16), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+class ManifiestoPartII:
+    """
+    Registro de las unidades (season, round) ya terminadas de la parte II.
+
+    Se guarda en <out_dir>/manifest_part_ii.json con esta forma:
+    {
+        "carreras": {"2023-17": {"archivo": "...", "sha256": "...", "filas": 20, "fecha": "..."}},
+        "temporadas": {"2023": {"rounds": [1, 2, ...], "completa": true}}
+    }
+
+    Una carrera cuenta como hecha si su csv existe, su checksum coincide
+    con el registrado y están guardadas sus paradas en bruto (las carreras
+    registradas antes de existir data/paradas se vuelven a procesar, desde
+    la caché de respuestas si la hay). Las carreras de la temporada en curso sin pitstops se
+    consideran obsoletas (la API puede no haberlos publicado todavía) y se
+    vuelven a pedir.
+    """
+    def __init__(self, out_dir):
+        self.path = os.path.join(out_dir, "manifest_part_ii.json")
+        self.lock = threading.Lock()
+        self.datos = {"carreras": {}, "temporadas": {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self.datos = json.load(f)
+            except ValueError: #manifiesto corrupto: empezamos de cero
+                print(f"[AVISO] manifiesto ilegible, se ignora: {self.path}")
+
+    def guardar(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporal = f"{self.path}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(self.datos, f, indent=1, sort_keys=True)
+        os.replace(temporal, self.path) #atómico: si el proceso muere no queda a medias
+
+    def esta_completa(self, season, rnd):
+        entrada = self.datos["carreras"].get(f"{season}-{rnd}")
+        if entrada is None or not os.path.exists(entrada["archivo"]) or not os.path.exists(entrada.get("paradas", "")):
+            return False
+        if entrada["filas"] == 0 and int(season) >= datetime.now().year: #temporada en curso sin datos todavía
+            return False
+        return checksum_fichero(entrada["archivo"]) == entrada["sha256"]
+
+    def registrar(self, season, rnd, path, filas, paradas=None):
+        with self.lock:
+            self.datos["carreras"][f"{season}-{rnd}"] = {
+                "archivo": path,
+                "paradas": paradas,
+                "sha256": checksum_fichero(path),
+                "filas": int(filas),
+                "fecha": datetime.now().isoformat(timespec="seconds"),
+            }
+            self.guardar()
+
+    def temporada_completa(self, season):
+        return self.datos["temporadas"].get(str(season), {}).get("completa", False)
+
+    def actualizar_temporada(self, season, rounds):
+        """
+        Marcamos la temporada como completa si está cerrada y todas sus
+        carreras están en el manifiesto.
+        """
+        with self.lock:
+            completa = int(season) < datetime.now().year and all(f"{season}-{r}" in self.datos["carreras"] for r in rounds)
+            self.datos["temporadas"][str(season)] = {"rounds": list(rounds), "completa": completa}
+            self.guardar()
+
 
+def planificar_carreras(seasons, manifiesto=None, solo_nuevas=False, out_dir=None, formato="csv", cola=None):
+    """
+    Decide qué unidades (season, round) hay que descargar.
+
+    - sin manifiesto: todas las carreras del calendario
+    - con manifiesto: solo las que faltan, están obsoletas o corruptas
+    - solo_nuevas=True: además saltamos sin ninguna petición las temporadas
+      ya completas y nos quedamos con las carreras ya disputadas, así que
+      añadir el último fin de semana cuesta el calendario más dos peticiones
+
+    Si nos pasan out_dir guardamos además el calendario completo de cada
+    temporada pedida (ver guardar_calendario) y si nos pasan una cola se lo
+    mandamos al apartado 3 como ("calendario", season, calendario).
+
+    Devuelve la lista de pendientes y los calendarios ({season: [rounds]}).
+    """
+    hoy = datetime.now().strftime("%Y-%m-%d")
+    pendientes = []
+    calendarios = {}
+
+    for season in seasons:
+        if solo_nuevas and manifiesto is not None and manifiesto.temporada_completa(season):
+            continue
+
+        calendario = calendario_temporada(season)
+        if out_dir is not None:
+            guardar_calendario(calendario, out_dir, season, formato)
+        if cola is not None:
+            cola.put(("calendario", season, calendario))
+        if solo_nuevas:
+            calendario = [c for c in calendario if c["date"] and c["date"] <= hoy] #solo carreras ya disputadas
+        rounds = [c["round"] for c in calendario]
+        calendarios[season] = rounds
+
+        for rnd in rounds:
+            if manifiesto is None or not manifiesto.esta_completa(season, rnd):
+                pendientes.append((season, rnd))
+
+    return pendientes, calendarios
+
+
+def entregar_carrera(season, rnd, race_df, pilotos_df, out_dir, manifiesto=None, formato="csv", cola=None, guardar=True,
+                     paradas=None):
+    """
+    Destino de una carrera ya resumida:
+    - guardar=True: la escribimos (pit-stops, paradas en bruto si nos las
+      pasan y lista de pilotos) y, si hay manifiesto, la registramos como terminada
+    - cola: además la pasamos en memoria al apartado 3 como
+      ("carrera", season, round, race_df, pilotos_df) (ver MergeStreaming)
+    """
+    if guardar:
+        ruta_paradas = guardar_paradas(paradas, out_dir, season, rnd) if paradas is not None else None
+        save_race_df(pilotos_df, out_dir, season, rnd, formato, dataset="pilotos")
+        path = save_race_df(race_df, out_dir, season, rnd, formato) #guardamos en csv (o parquet)
+        if manifiesto is not None:
+            manifiesto.registrar(season, rnd, path, len(race_df), ruta_paradas)
+    if cola is not None:
+        cola.put(("carrera", season, rnd, race_df, pilotos_df))
+    METRICAS.filas("fetch", entrada=int(race_df["NPitstops"].sum()) if len(race_df) else 0, salida=len(race_df))
+    print(f"[TERMINADO] season={season} round={rnd} rows={len(race_df)}")
+
+
+def procesar_carrera(season, rnd, out_dir, manifiesto=None, formato="csv", cola=None, guardar=True):
+    """
+    Descarga, resume y guarda una única carrera (una unidad de trabajo).
+    Si hay manifiesto, la registra como terminada.
+    Devuelve el número de filas escritas.
+    """
+    results = resultados_carrera(season, rnd)
+    driver_map = numeros_desde_resultados(results) #generamos el diccionario que conecta piloto y número
+    filas_pitstops = descargar_pitstops_carrera(season, rnd) #las paradas en bruto se guardan además del resumen
+    race_df = construir_dataframe_pitstops(season, rnd, driver_map, filas_pitstops) #construímos el dataframe de los pitstops
+    entregar_carrera(season, rnd, race_df, construir_dataframe_pilotos(season, rnd, results),
+                     out_dir, manifiesto, formato, cola, guardar, paradas=filas_pitstops)
+    return len(race_df)
+
+
+def procesar_temporada_bulk(season, rounds, out_dir, manifiesto=None, formato="csv", cola=None, guardar=True):
+    """
+    Modo bulk: descargamos resultados y pit-stops de toda la temporada en
+    unas pocas peticiones paginadas y los repartimos por carrera en local.
+    Solo escribimos las carreras de `rounds` (las pendientes).
+    Devuelve el número total de filas escritas.
+    """
+    resultados = descargar_temporada_paginada(season, "results", "Results")
+    pitstops = descargar_temporada_paginada(season, "pitstops", "PitStops")
 
-def run_part_ii(seasons, out_dir="data"):
+    filas = 0
+    for rnd in rounds:
+        driver_map = numeros_desde_resultados(resultados.get(rnd, []))
+        race_df = construir_dataframe_pitstops(season, rnd, driver_map, filas_pitstops=pitstops.get(rnd, []))
+        entregar_carrera(season, rnd, race_df, construir_dataframe_pilotos(season, rnd, resultados.get(rnd, [])),
+                         out_dir, manifiesto, formato, cola, guardar, paradas=pitstops.get(rnd, []))
+        filas += len(race_df)
+    return filas
+
+
+def agrupar_por_temporada(pendientes):
+    """
+    Pasa la lista [(season, round), ...] a {season: [rounds]} respetando el orden.
+    """
+    por_temporada = {}
+    for season, rnd in pendientes:
+        por_temporada.setdefault(season, []).append(rnd)
+    return por_temporada
+
+
+def run_part_ii_concurrente(tareas, max_workers=8, tasa=4.0, capacidad=4, por_hora=POR_HORA_JOLPICA):
+    """
+    Versión concurrente de la parte II.
+
+    Lanzamos todas las tareas pendientes (carreras, o temporadas enteras en
+    modo bulk) a la vez en un pool de hilos acotado (max_workers). Las
+    peticiones de muchas carreras quedan en vuelo al mismo tiempo, pero
+    todas pasan por un único LimitadorTasa, de modo que el ritmo total nunca
+    supera `tasa` peticiones por segundo (con ráfagas de hasta `capacidad`)
+    ni `por_hora` peticiones por hora (por defecto los límites de Jolpica).
+
+    `tareas` es una lista de tuplas (funcion, argumentos).
+    """
+    global LIMITADOR
+    LIMITADOR = LimitadorTasa(tasa=tasa, capacidad=capacidad, por_hora=por_hora)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futuros = [pool.submit(funcion, *args) for funcion, args in tareas]
+            for futuro in as_completed(futuros):
+                futuro.result() #propagamos cualquier error de las carreras
+    finally:
+        LIMITADOR = None
+
+
+def run_part_ii(seasons, out_dir="data", concurrente=False, max_workers=8, tasa=4.0, capacidad=4,
+                por_hora=POR_HORA_JOLPICA, usar_cache=True, cache_dir=None, offline=False, reanudar=True, solo_nuevas=False,
+                bulk=False, formato="csv", cola=None, guardar=True):
     """
     Ejecutamos toda la parte II del proyecto.
     -Para cada temporada extraemos los rounds, construímos el diccionario
     que conecta driverId con su número respectivo
     -descargamos los pitstops de cada carrera
     -los resumimos por piloto
-    -guardamos en csv
+    -guardamos en csv (junto con el calendario y la lista de pilotos de cada carrera)
     
+    Con concurrente=True las carreras se descargan en paralelo con un
+    limitador de tasa compartido (ver run_part_ii_concurrente).
+
+    Las respuestas se guardan en una caché en disco (por defecto
+    <out_dir>/.cache_http), así que repetir la ejecución no vuelve a pedir
+    las temporadas cerradas. Con offline=True se reconstruye todo solo a
+    partir de la caché, sin conexión.
+
+    Con reanudar=True llevamos un manifiesto de las carreras terminadas y
+    una nueva ejecución solo descarga las que faltan o están obsoletas o
+    corruptas. solo_nuevas=True añade únicamente las carreras nuevas de
+    las temporadas no cerradas (ver planificar_carreras).
+
+    Con bulk=True cada temporada se pide entera en unas pocas peticiones
+    paginadas (ver procesar_temporada_bulk) en vez de dos por carrera.
+
+    formato="parquet" guarda cada carrera tipada en data/pitstops/season=<año>/
+    en lugar del csv (ver almacenamiento.py).
+
+    Con una cola (queue.Queue) cada carrera se entrega además en memoria al
+    apartado 3 según se termina, en este orden de mensajes:
+    ("calendario", season, calendario) por temporada, ("pendientes",
+    {season: [rounds]}), ("carrera", ...) por carrera y ("fin",) al acabar.
+    Con guardar=False no se escribe ninguna carrera en disco (ni manifiesto).
     """
-    for season in seasons: #recorre las temporadas que le pasemos
-        rounds = rounds_por_temporadas(season) #obtenemos la lista de rounds de la temporada
-        
+    global CACHE
+    configurar_sesion(max_conexiones=max_workers if concurrente else 2) #una conexión por hilo como mucho
+    if usar_cache or offline:
+        CACHE = CacheRespuestas(cache_dir or os.path.join(out_dir, ".cache_http"), offline=offline)
+    manifiesto = ManifiestoPartII(out_dir) if (reanudar or solo_nuevas) and guardar else None
+
+    try:
+        pendientes, calendarios = planificar_carreras(seasons, manifiesto, solo_nuevas=solo_nuevas,
+                                                      out_dir=out_dir if guardar else None, formato=formato, cola=cola)
+        print(f"[PLAN] {len(pendientes)} carreras pendientes")
+        if cola is not None:
+            por_temporada = agrupar_por_temporada(pendientes)
+            cola.put(("pendientes", {season: por_temporada.get(season, []) for season in calendarios}))
+
+        if bulk:
+            tareas = [(procesar_temporada_bulk, (season, rounds, out_dir, manifiesto, formato, cola, guardar))
+                      for season, rounds in agrupar_por_temporada(pendientes).items()]
+        else:
+            tareas = [(procesar_carrera, (season, rnd, out_dir, manifiesto, formato, cola, guardar)) for season, rnd in pendientes]
+
+        if concurrente:
+            run_part_ii_concurrente(tareas, max_workers=max_workers, tasa=tasa, capacidad=capacidad, por_hora=por_hora)
+        else:
+            for funcion, args in tareas: #recorremos cada carrera (o temporada) pendiente
+                antes = PETICIONES_RED
+                funcion(*args)
+                if PETICIONES_RED > antes: #si todo salió de la caché no hace falta esperar
+                    METRICAS.dormir(1.2, "pausa") #añadimos espera
 
-        for rnd in rounds: #recorremos cada rounds
-            driver_map = obtener_numero_por_piloto_en_carrera(season,rnd) #generamos el diccionario que conecta piloto y número
-            race_df = construir_dataframe_pitstops(season, rnd, driver_map) #construímos el dataframe de los pitstops
-            save_race_df(race_df, out_dir, season, rnd) #guardamos en csv
-            print(f"[TERMINADO] season={season} round={rnd} rows={len(race_df)}")
-            time.sleep(1.2) #añadimos espera
+        if manifiesto is not None:
+            for season, rounds in calendarios.items():
+                manifiesto.actualizar_temporada(season, rounds)
+        if cola is not None:
+            cola.put(("fin",))
+    finally:
+        CACHE = None
             
 
 if __name__ == "__main__":
@@ -4,41 +4,149 @@
 # ETSI ICAI
 # apartado_3.py
 
+import os
+import re
+import json
+import queue
+import hashlib
+import threading
 import pandas as pd
 from pathlib import Path
+from urllib.parse import unquote
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from agregados import guardar_agregados
+from almacenamiento import (EXTENSIONES, leer_tabla, ruta_particion, temporada_de_ruta, temporadas_particionadas,
+                            escribir_parquet, escribir_particionado, escribir_particion, borrar_particion)
+from metricas import METRICAS
 
-def cargar_resultados(season_path):
-    season = int(season_path.name)
-    archivos = sorted(season_path.glob("*.csv"))
-    resultados = []
 
-    race_number = 1
-    for archivo in archivos:
-        if "pitstops" in archivo.name:
-            continue
+NO_RESULTADOS = ("race_", "calendar", "dim_")    # archivos del apartado 2 y de este que comparten carpeta en csv
 
-        try:
-            df = pd.read_csv(archivo)
 
-            if "Driver" not in df.columns or "No." not in df.columns:
-                continue
+def archivos_resultados(season_path):
+    # season_path es data/<year> (csv) o data/resultados/season=<year> (parquet)
+    return sorted(a for a in season_path.glob("*") if a.suffix in EXTENSIONES and not a.name.startswith(NO_RESULTADOS))
+
+
+def archivos_pitstops(season_path):
+    return sorted(a for a in season_path.glob("race_*_pitstops.*") if a.suffix in EXTENSIONES)
+
+
+def archivos_pilotos(season_path):
+    return sorted(a for a in season_path.glob("race_*_drivers.*") if a.suffix in EXTENSIONES)
+
+
+def ruta_dataset(ruta_pitstops, dataset):
+    """
+    Carpeta de otro dataset de la misma temporada que ruta_pitstops: en csv
+    todo está en data/<year>, en parquet es data/<dataset>/season=<year>.
+    """
+    if ruta_pitstops.name.startswith("season="):
+        return ruta_pitstops.parent.parent / dataset / ruta_pitstops.name
+    return ruta_pitstops
+
+
+def archivo_calendario(ruta_pitstops):
+    carpeta = ruta_dataset(ruta_pitstops, "calendario")
+    return next((a for a in sorted(carpeta.glob("calendar.*")) if a.suffix in EXTENSIONES), None)
+
+
+def clave_articulo(texto):
+    """
+    Nombre del artículo de Wikipedia normalizado, para cruzar el nombre de
+    los archivos del apartado 1 con las url del calendario de Jolpica:
+    "http://en.wikipedia.org/wiki/2021_S%C3%A3o_Paulo_Grand_Prix" -> "2021_são_paulo_grand_prix"
+    """
+    return unquote(str(texto).split("/wiki/")[-1].split("#")[0]).replace(" ", "_").lower()
+
+
+def leer_calendario(ruta_pitstops):
+    """
+    Diccionario {articulo: round} de la temporada a partir del calendario que
+    guarda el apartado 2. None si no hay calendario (datos antiguos).
+    """
+    archivo = archivo_calendario(ruta_pitstops)
+    if archivo is None:
+        return None
+    calendario = leer_tabla(archivo).dropna(subset=["url"])
+    return {clave_articulo(url): int(rnd) for url, rnd in zip(calendario["url"], calendario["round"])} or None
+
+
+def leer_resultados_archivo(archivo):
+    """
+    Lee y limpia la tabla de resultados de una carrera.
+    Devuelve None si el archivo no sirve (sin Driver o No., o ilegible).
+    """
+    try:
+        df = leer_tabla(archivo)
+
+        if "Driver" not in df.columns or "No." not in df.columns:
+            return None
+
+        # Filtrar filas basura (vectorizado: nada de apply fila a fila)
+        driver = df["Driver"]
+        basura = driver.astype("string").str.contains("Source|107%|Fastest lap", regex=True, na=True)
+        df = df[driver.notna() & ~basura]
+
+        # Convertir No. a string SIEMPRE
+        df = df.assign(**{"No.": df["No."].astype(str).str.extract(r"(\d+)", expand=False)})  # extrae solo números
+        df = df.dropna(subset=["No."])  # elimina filas sin número válido
+        return df
+
+    except Exception as e:
+        print(f"[ERROR] leyendo {archivo.name}: {e}")
+        return None
 
-            # Filtrar filas basura
-            df = df[df["Driver"].apply(lambda x: isinstance(x, str) and "Source" not in x and "107%" not in x)]
 
-            # Convertir No. a string SIEMPRE
-            df["No."] = df["No."].astype(str).str.extract(r"(\d+)")  # extrae solo números
-            df = df.dropna(subset=["No."])  # elimina filas sin número válido
-            df["No."] = df["No."].astype(str)
+def leer_pitstops_archivo(archivo):
+    try:
+        df = leer_tabla(archivo)
+        df["DriverNumber"] = df["DriverNumber"].astype(str)
+        return df
+    except Exception as e:
+        print(f"[ERROR] leyendo {archivo.name}: {e}")
+        return None
 
-            df["Season"] = season
-            df["RaceNumber"] = race_number
-            race_number += 1
 
-            resultados.append(df)
+def leer_pilotos_archivo(archivo):
+    try:
+        return leer_tabla(archivo)
+    except Exception as e:
+        print(f"[ERROR] leyendo {archivo.name}: {e}")
+        return None
 
-        except Exception as e:
-            print(f"[ERROR] leyendo {archivo.name}: {e}")
+
+def numerar_carreras(season, archivos, tablas, calendario=None):
+    """
+    Añade Season y RaceNumber a las tablas válidas de una temporada.
+
+    Con calendario ({articulo: round}, ver leer_calendario) cada tabla
+    recibe el round de su carrera según el nombre de su archivo; las que no
+    aparecen en el calendario se descartan con un aviso. Sin calendario
+    numeramos en el orden de los archivos (solo cuentan las que se han
+    podido leer), que solo es correcto si ese orden es el del calendario.
+    """
+    validas = []
+    for archivo, df in zip(archivos, tablas):
+        if df is None:
+            continue
+        if calendario is None:
+            race_number = len(validas) + 1
+        else:
+            race_number = calendario.get(clave_articulo(archivo.stem))
+            if race_number is None:
+                print(f"[AVISO] {archivo.name} no está en el calendario de {season}, se descarta")
+                continue
+        df["Season"] = season
+        df["RaceNumber"] = race_number
+        validas.append(df)
+    return validas
+
+
+def cargar_resultados(season_path, calendario=None):
+    season = temporada_de_ruta(season_path)
+    archivos = archivos_resultados(season_path)
+    resultados = numerar_carreras(season, archivos, [leer_resultados_archivo(a) for a in archivos], calendario)
 
     if not resultados:
         print(f"[AVISO] No hay resultados válidos en {season_path}")
@@ -48,16 +156,7 @@ def cargar_resultados(season_path):
 
 
 def cargar_pitstops(season_path):
-    archivos = sorted(season_path.glob("race_*_pitstops.csv"))
-    pitstops = []
-
-    for archivo in archivos:
-        try:
-            df = pd.read_csv(archivo)
-            df["DriverNumber"] = df["DriverNumber"].astype(str)
-            pitstops.append(df)
-        except Exception as e:
-            print(f"[ERROR] leyendo {archivo.name}: {e}")
+    pitstops = [df for df in map(leer_pitstops_archivo, archivos_pitstops(season_path)) if df is not None]
 
     if not pitstops:
         print(f"[AVISO] No hay pitstops en {season_path}")
@@ -66,51 +165,666 @@ def cargar_pitstops(season_path):
     return pd.concat(pitstops, ignore_index=True)
 
 
-def merge_datos(resultados, pitstops):
+# --------------------------------------------------
+# DIMENSIÓN DE PILOTOS
+# --------------------------------------------------
+# Wikipedia identifica al piloto por nombre y número de coche y Jolpica por
+# driverId. La dimensión une las dos cosas por carrera y le da a cada piloto
+# una clave entera (DriverKey) dentro de su temporada, así que el merge se
+# hace siempre sobre enteros (Season, RaceNumber, DriverKey).
+
+CLAVES_CARRERA = ["Season", "RaceNumber"]
+
+
+def clave_nombre(serie):
+    """
+    Nombre normalizado para cruzar pilotos por nombre: sin acentos, notas ni
+    signos, en minúsculas y con las palabras ordenadas
+    ("Zhou Guanyu" y "Guanyu Zhou" -> "guanyu zhou").
+    """
+    texto = (serie.astype("string")
+             .str.normalize("NFKD").str.replace("[\u0300-\u036f]", "", regex=True)
+             .str.lower().str.replace(r"\[[^\]]*\]|[^a-z ]", " ", regex=True))
+    return texto.str.split().map(lambda palabras: " ".join(sorted(palabras)) if isinstance(palabras, list) and palabras else pd.NA)
+
+
+def dimension_pilotos(pilotos, pitstops):
+    """
+    Construye la dimensión de pilotos: una fila por piloto y carrera con
+    [Season, RaceNumber, DriverKey, DriverId, DriverNumber, GivenName, FamilyName, Url, NameKey]
+
+    Sale de las listas de pilotos del apartado 2 (race_XX_drivers); para las
+    carreras que no la tengan (datos antiguos) usamos los propios pit-stops,
+    que traen driverId y número pero no nombre.
+
+    DriverKey es un entero 1..n por temporada (pilotos ordenados por driverId).
+    """
+    columnas = CLAVES_CARRERA + ["DriverId", "DriverNumber"]
+    partes = [df for df in (pilotos, pitstops) if not df.empty and set(columnas) <= set(df.columns)]
+    if not partes:
+        return pd.DataFrame(columns=CLAVES_CARRERA + ["DriverKey", "DriverId", "DriverNumber", "NameKey"])
+
+    dim = pd.concat([df.drop(columns=["NPitstops", "MedianPitStopDuration"], errors="ignore") for df in partes], ignore_index=True)
+    dim = dim.dropna(subset=["DriverId"]).drop_duplicates(CLAVES_CARRERA + ["DriverId"])    # las listas de pilotos van primero
+    dim = dim.astype({"Season": "int16", "RaceNumber": "int8", "DriverId": "string"})
+    dim["DriverNumber"] = pd.to_numeric(dim["DriverNumber"], errors="coerce").astype("Int16")
+
+    unicos = dim[["Season", "DriverId"]].drop_duplicates().sort_values(["Season", "DriverId"])
+    unicos["DriverKey"] = (unicos.groupby("Season").cumcount() + 1).astype("int16")
+    dim = dim.merge(unicos, on=["Season", "DriverId"], how="left")
+
+    if "GivenName" in dim.columns:
+        dim["NameKey"] = clave_nombre(dim["GivenName"].fillna("") + " " + dim["FamilyName"].fillna(""))
+    else:
+        dim["NameKey"] = pd.Series(pd.NA, index=dim.index, dtype="string")
+
+    orden = CLAVES_CARRERA + ["DriverKey", "DriverId", "DriverNumber"]
+    return dim[orden + [c for c in dim.columns if c not in orden]].sort_values(CLAVES_CARRERA + ["DriverKey"], ignore_index=True)
+
+
+def claves_resultados(resultados, dim):
+    """
+    DriverKey de cada fila de resultados: primero por número de coche en esa
+    carrera y, para las que no casan (números mal extraídos, coches
+    compartidos...), por nombre. Las que no casan por ninguna quedan nulas.
+    """
+    claves = pd.Series(pd.NA, index=resultados.index, dtype="Int16")
+    if dim.empty:
+        return claves
+
+    numero = pd.to_numeric(resultados["No."], errors="coerce").astype("Int16")
+    por_numero = (dim.dropna(subset=["DriverNumber"])
+                  .drop_duplicates(CLAVES_CARRERA + ["DriverNumber"], keep=False)    # números repetidos en una carrera: ambiguos
+                  [CLAVES_CARRERA + ["DriverNumber", "DriverKey"]])
+    izquierda = resultados[CLAVES_CARRERA].assign(DriverNumber=numero)
+    claves[:] = izquierda.merge(por_numero, on=CLAVES_CARRERA + ["DriverNumber"], how="left")["DriverKey"].to_numpy()
+
+    faltan = claves.isna() & resultados["Driver"].notna()
+    if faltan.any() and dim["NameKey"].notna().any():
+        por_nombre = (dim.dropna(subset=["NameKey"])
+                      .drop_duplicates(CLAVES_CARRERA + ["NameKey"], keep=False)
+                      [CLAVES_CARRERA + ["NameKey", "DriverKey"]])
+        izquierda = resultados.loc[faltan, CLAVES_CARRERA].assign(NameKey=clave_nombre(resultados.loc[faltan, "Driver"]))
+        claves[faltan] = izquierda.merge(por_nombre, on=CLAVES_CARRERA + ["NameKey"], how="left")["DriverKey"].to_numpy()
+    return claves
+
+
+def merge_datos(resultados, pitstops, dim=None):
+    """
+    Une resultados y pit-stops por (Season, RaceNumber, DriverKey).
+    Sin dimensión la construimos solo con los pit-stops.
+    """
     if resultados.empty:
         return pd.DataFrame()
+    if dim is None:
+        dim = dimension_pilotos(pd.DataFrame(), pitstops)
 
-    if pitstops.empty:
-        resultados["DriverId"] = ""
-        resultados["DriverNumber"] = ""
-        resultados["NPitstops"] = 0
-        resultados["MedianPitStopDuration"] = None
-        return resultados
-
-    # Asegurar tipos homogéneos
-    resultados["No."] = resultados["No."].astype(str)
-    pitstops["DriverNumber"] = pitstops["DriverNumber"].astype(str)
-
+    resultados = resultados.astype({"Season": "int16", "RaceNumber": "int8"})
+    resultados["DriverKey"] = claves_resultados(resultados, dim)
     merged = resultados.merge(
-        pitstops,
-        left_on=["Season", "RaceNumber", "No."],
-        right_on=["Season", "RaceNumber", "DriverNumber"],
-        how="left"
+        dim[CLAVES_CARRERA + ["DriverKey", "DriverId", "DriverNumber"]].drop_duplicates(CLAVES_CARRERA + ["DriverKey"]),
+        on=CLAVES_CARRERA + ["DriverKey"], how="left"
     )
-    return merged
 
+    if pitstops.empty:
+        merged["NPitstops"] = 0
+        merged["MedianPitStopDuration"] = None
+        return merged
+
+    # los pit-stops solo necesitan el DriverKey de su driverId en la temporada
+    pit = pitstops[CLAVES_CARRERA + ["DriverId", "NPitstops", "MedianPitStopDuration"]].astype(
+        {"Season": "int16", "RaceNumber": "int8", "DriverId": "string"})
+    pit = pit.merge(dim[["Season", "DriverId", "DriverKey"]].drop_duplicates(), on=["Season", "DriverId"], how="inner")
+    merged = merged.merge(pit.drop(columns="DriverId"), on=CLAVES_CARRERA + ["DriverKey"], how="left")
+
+    # un piloto identificado en una carrera con pit-stops que no aparece en ellos no ha parado
+    carreras_con_pitstops = pd.MultiIndex.from_frame(pit[CLAVES_CARRERA].drop_duplicates())
+    sin_paradas = (merged["DriverKey"].notna() & merged["NPitstops"].isna()
+                   & pd.MultiIndex.from_frame(merged[CLAVES_CARRERA]).isin(carreras_con_pitstops))
+    # y las temporadas sin ningún pit-stop quedan igual que con merge_datos por temporada
+    sin_paradas |= ~merged["Season"].isin(pit["Season"].unique())
+    merged.loc[sin_paradas, "NPitstops"] = 0
+    return merged
 
-def run_part_iii(data_dir="data", output_file="data/final_merged.csv"):
-    base_path = Path(data_dir)
-    temporadas = [p for p in base_path.iterdir() if p.is_dir() and p.name.isdigit()]
 
-    todos = []
+def mergear_contando(resultados, pitstops, dim=None):
+    """
+    merge_datos apuntando en METRICAS su tiempo y las filas que entran y salen.
+    """
+    with METRICAS.cronometro("merge"):
+        merged = merge_datos(resultados, pitstops, dim)
+    METRICAS.filas("merge", entrada=len(resultados) + len(pitstops))
+    return merged
 
-    for temporada in temporadas:
-        print(f"[CARGANDO] Temporada {temporada.name}")
 
-        resultados = cargar_resultados(temporada)
-        pitstops = cargar_pitstops(temporada)
+def guardar_dimension(dim, ruta_pitstops):
+    """
+    Persiste la dimensión de una temporada: data/<year>/dim_pilotos.csv o
+    data/dim_pilotos/season=<year>/part.parquet.
+    """
+    carpeta = ruta_dataset(ruta_pitstops, "dim_pilotos")
+    if carpeta.name.startswith("season="):
+        return escribir_parquet(dim, carpeta / "part.parquet")
+    carpeta.mkdir(parents=True, exist_ok=True)
+    dim.to_csv(carpeta / "dim_pilotos.csv", index=False)
+    return carpeta / "dim_pilotos.csv"
+
+
+# --------------------------------------------------
+# ESQUEMA CANÓNICO
+# --------------------------------------------------
+# Las tablas de Wikipedia cambian de nombre de columna según la página
+# (Pos. / Position, Grid / Grid[43] / Final grid, Points / Pts., Laps1...).
+# Aquí las llevamos todas a un único esquema con tipos compactos.
+
+ALIAS_COLUMNAS = {
+    "Pos.": "Position", "Pos": "Position", "Position": "Position", "Finish": "Position",
+    "No.": "No", "No": "No",
+    "Driver": "Driver",
+    "Constructor": "Constructor",
+    "Grid": "Grid", "Final grid": "Grid",
+    "Laps": "Laps",
+    "Time/Retired": "TimeRetired", "TimeRetired": "TimeRetired",
+    "Points": "Points", "Pts.": "Points", "Pts": "Points",
+    "Q1": "Q1", "Q2": "Q2", "Q3": "Q3",
+    "Season": "Season", "RaceNumber": "RaceNumber",
+    "DriverKey": "DriverKey", "DriverId": "DriverId", "DriverNumber": "DriverNumber",
+    "NPitstops": "NPitstops", "MedianPitStopDuration": "MedianPitStopDuration",
+}
+
+TIPOS_CANONICOS = {
+    "Season": "int16",
+    "RaceNumber": "int8",
+    "Position": "Int8",    # Ret, DNF, NC... quedan como nulo (el texto original va en PositionText)
+    "PositionText": "category",
+    "No": "Int16",
+    "Driver": "category",
+    "Constructor": "category",
+    "Grid": "Int8",    # PL (pit lane) queda como nulo
+    "Laps": "Int16",
+    "TimeRetired": "string",
+    "Points": "float32",
+    "Q1": "float32",    # tiempos de clasificación en segundos
+    "Q2": "float32",
+    "Q3": "float32",
+    "DriverKey": "Int16",    # clave entera del piloto en la temporada (ver dimension_pilotos)
+    "DriverId": "category",
+    "DriverNumber": "Int16",
+    "NPitstops": "Int8",
+    "MedianPitStopDuration": "float32",
+}
+
+
+def nombre_canonico(columna):
+    """
+    Nombre canónico de una columna de Wikipedia o None si no nos interesa
+    (Unnamed: 8, Rounds...). Quitamos notas al pie como [43] o la letra o
+    número pegado al final (Laps1, Lapsa).
+    """
+    nombre = re.sub(r"\[[^\]]*\]", "", str(columna)).strip()
+    if nombre in ALIAS_COLUMNAS:
+        return ALIAS_COLUMNAS[nombre]
+    return ALIAS_COLUMNAS.get(re.sub(r"(?<=[a-z.])[a-z0-9]$", "", nombre))
+
+
+def a_segundos(serie):
+    """
+    "1:41.568" -> 101.568, "59.1" -> 59.1, lo que no sea un tiempo -> NaN.
+    """
+    partes = serie.astype("string").str.extract(r"^\s*(?:(\d+):)?(\d+(?:\.\d+)?)\s*$")
+    minutos = pd.to_numeric(partes[0], errors="coerce").fillna(0)
+    return minutos * 60 + pd.to_numeric(partes[1], errors="coerce")
+
+
+def normalizar_esquema(df):
+    """
+    Lleva un DataFrame (mergeado o leído de final_merged) al esquema
+    canónico: une las variantes de cada columna (nos quedamos con el primer
+    valor no nulo), descarta las que no están en el esquema y aplica
+    TIPOS_CANONICOS. Es idempotente, así que se puede aplicar otra vez
+    tras un concat o al leer un csv.
+    """
+    salida = pd.DataFrame(index=df.index)
+    for columna in df.columns:
+        canonica = nombre_canonico(columna)
+        if canonica is None:
+            continue
+        valores = df[columna].astype(object).where(df[columna].notna(), None)
+        salida[canonica] = valores if canonica not in salida else salida[canonica].combine_first(valores)
 
-        merged = merge_datos(resultados, pitstops)
+    if "PositionText" in df.columns:
+        salida["PositionText"] = df["PositionText"]
+    elif "Position" in salida:
+        salida["PositionText"] = salida["Position"].astype("string")
 
-        if not merged.empty:
-            todos.append(merged)
+    for columna, tipo in TIPOS_CANONICOS.items():
+        if columna not in salida:
+            continue
+        valores = salida[columna]
+        if columna in ("Q1", "Q2", "Q3", "MedianPitStopDuration") and valores.dtype == object:
+            valores = a_segundos(valores)
+        elif tipo.lower().startswith(("int", "float")):
+            valores = pd.to_numeric(valores.astype("string").str.extract(r"^\s*(-?\d+(?:\.\d+)?)\s*$", expand=False), errors="coerce")
+            if tipo.startswith("Int"):
+                valores = valores.round()
+        elif tipo == "category":
+            valores = valores.astype("string").replace("", pd.NA)
+        salida[columna] = valores.astype(tipo)
+
+    orden = [c for c in TIPOS_CANONICOS if c in salida.columns]
+    return salida[orden]
+
+
+def rutas_temporadas(base_path, formato="csv"):
+    """
+    Devuelve [(season, carpeta_resultados, carpeta_pitstops)].
+    En csv las dos están en data/<year>; en parquet cada dataset tiene su
+    partición data/resultados/season=<year> y data/pitstops/season=<year>.
+    """
+    if formato == "parquet":
+        return [(s, ruta_particion(base_path, "resultados", s), ruta_particion(base_path, "pitstops", s))
+                for s in temporadas_particionadas(base_path / "resultados")]
+    return [(int(p.name), p, p) for p in base_path.iterdir() if p.is_dir() and p.name.isdigit()]
+
+
+def cargar_todas(temporadas, n_procesos=None):
+    """
+    Carga paralela de todas las temporadas.
+
+    Repartimos los archivos de todas las temporadas (resultados, pitstops y
+    listas de pilotos) en un pool de procesos, así la lectura y limpieza
+    escala con los núcleos. Cada archivo se lee una sola vez y al final
+    hacemos un único concat de cada tipo (en vez de uno por temporada y
+    otro final).
+
+    Con n_procesos=1 se hace todo en el proceso actual.
+    Devuelve (resultados, pitstops, pilotos).
+    """
+    tareas_resultados = [(season, archivos_resultados(r), leer_calendario(p)) for season, r, p in temporadas]
+    todos_resultados = [a for _, archivos, _ in tareas_resultados for a in archivos]
+    todos_pitstops = [a for _, _, p in temporadas if p.exists() for a in archivos_pitstops(p)]
+    todos_pilotos = [a for _, _, p in temporadas for a in archivos_pilotos(ruta_dataset(p, "pilotos"))]
+
+    n_procesos = n_procesos or os.cpu_count() or 1
+    METRICAS.contar("archivos_leidos", len(todos_resultados) + len(todos_pitstops) + len(todos_pilotos))
+    with METRICAS.cronometro("lectura"):
+        if n_procesos > 1 and len(todos_resultados) + len(todos_pitstops) > 8:    # con pocos archivos no compensa arrancar procesos
+            with ProcessPoolExecutor(max_workers=n_procesos) as pool:
+                tablas = list(pool.map(leer_resultados_archivo, todos_resultados, chunksize=8))
+                tablas_pitstops = list(pool.map(leer_pitstops_archivo, todos_pitstops, chunksize=8))
+                tablas_pilotos = list(pool.map(leer_pilotos_archivo, todos_pilotos, chunksize=8))
+        else:
+            tablas = [leer_resultados_archivo(a) for a in todos_resultados]
+            tablas_pitstops = [leer_pitstops_archivo(a) for a in todos_pitstops]
+            tablas_pilotos = [leer_pilotos_archivo(a) for a in todos_pilotos]
 
-    if not todos:
+    resultados = []
+    inicio = 0
+    for season, archivos, calendario in tareas_resultados:    # volvemos a repartir por temporada para numerar las carreras
+        print(f"[CARGANDO] Temporada {season}")
+        validas = numerar_carreras(season, archivos, tablas[inicio:inicio + len(archivos)], calendario)
+        if not validas:
+            print(f"[AVISO] No hay resultados válidos en la temporada {season}")
+        resultados.extend(validas)
+        inicio += len(archivos)
+
+    pitstops = [df for df in tablas_pitstops if df is not None]
+    pilotos = [df for df in tablas_pilotos if df is not None and not df.empty]
+    return (pd.concat(resultados, ignore_index=True) if resultados else pd.DataFrame(),
+            pd.concat(pitstops, ignore_index=True) if pitstops else pd.DataFrame(),
+            pd.concat(pilotos, ignore_index=True) if pilotos else pd.DataFrame())
+
+
+VERSION_MERGE = 3    # subirla cuando cambie el resultado del merge (esquema, join...)
+
+
+def huella_temporada(ruta_resultados, ruta_pitstops):
+    """
+    Huella de los archivos de entrada de una temporada (nombre, tamaño y
+    mtime). Si cualquiera cambia, aparece o desaparece, cambia la huella.
+    """
+    archivos = archivos_resultados(ruta_resultados)
+    if ruta_pitstops.exists():
+        archivos += archivos_pitstops(ruta_pitstops)
+    archivos += archivos_pilotos(ruta_dataset(ruta_pitstops, "pilotos"))
+    calendario = archivo_calendario(ruta_pitstops)
+    if calendario is not None:
+        archivos.append(calendario)
+
+    h = hashlib.sha256(f"v{VERSION_MERGE}".encode("utf-8"))    # si cambia cómo mergeamos, la caché deja de valer
+    for archivo in sorted(set(archivos)):
+        info = archivo.stat()
+        h.update(f"{archivo.name}|{info.st_size}|{info.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+class CacheMerge:
+    """
+    Caché del merge por temporada en <data_dir>/.merge_cache.
+
+    Por cada temporada guardamos su parte ya mergeada (pickle, conserva los
+    tipos tal cual) y la huella de sus archivos de entrada en huellas.json.
+    Una temporada solo se vuelve a calcular si su huella ha cambiado.
+    """
+    def __init__(self, data_dir):
+        self.dir = Path(data_dir) / ".merge_cache"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.ruta_huellas = self.dir / "huellas.json"
+        self.huellas = json.loads(self.ruta_huellas.read_text()) if self.ruta_huellas.exists() else {}
+
+    def ruta(self, season):
+        return self.dir / f"{season}.pkl"
+
+    def vigente(self, season, huella):
+        return self.huellas.get(str(season)) == huella and self.ruta(season).exists()
+
+    def cargar(self, season):
+        return pd.read_pickle(self.ruta(season))
+
+    def guardar(self, season, huella, df):
+        df.to_pickle(self.ruta(season))
+        self.huellas[str(season)] = huella
+
+    def podar(self, seasons):
+        """
+        Olvida las temporadas que ya no están en los datos de entrada.
+        """
+        for season in list(self.huellas):
+            if int(season) not in seasons:
+                self.ruta(season).unlink(missing_ok=True)
+                del self.huellas[season]
+
+    def persistir(self):
+        self.ruta_huellas.write_text(json.dumps(self.huellas, indent=1, sort_keys=True))
+
+
+def mismas_columnas(output_file, df):
+    """
+    True si la salida parquet ya existe y tiene las mismas columnas que df
+    (si no, p.ej. tras un cambio de esquema, hay que reescribirla entera).
+    """
+    existentes = temporadas_particionadas(output_file)
+    if not existentes:
+        return False
+    import pyarrow.parquet as pq
+    primera = next((Path(output_file) / f"season={existentes[0]}").glob("*.parquet"), None)
+    return primera is not None and pq.read_schema(primera).names == list(df.columns)
+
+
+def guardar_final(final_df, output_file, cambiadas=None):
+    """
+    Si la salida acaba en .parquet la escribimos particionada por temporada
+    (data/final_merged.parquet/season=<year>/part.parquet), si no como csv.
+
+    En parquet, si nos pasan las temporadas cambiadas solo reescribimos sus
+    particiones (y las que falten) y borramos las que sobren.
+    """
+    METRICAS.filas("merge", salida=len(final_df))
+    with METRICAS.cronometro("escritura", formato="parquet" if str(output_file).endswith(".parquet") else "csv"):
+        escribir_final(final_df, output_file, cambiadas)
+
+
+def escribir_final(final_df, output_file, cambiadas=None):
+    if not str(output_file).endswith(".parquet"):
+        final_df.to_csv(output_file, index=False)
+        return
+
+    if cambiadas is None or not mismas_columnas(output_file, final_df):
+        escribir_particionado(final_df, output_file)
+        return
+
+    actuales = set(final_df["Season"].unique())
+    existentes = set(temporadas_particionadas(output_file))
+    for season in existentes - actuales:
+        borrar_particion(output_file, season)
+    for season in actuales:
+        if season in cambiadas or season not in existentes:
+            escribir_particion(final_df[final_df["Season"] == season], output_file, season)
+
+
+def actualizar_cache(cache, temporadas, n_procesos=None):
+    """
+    Recalcula y guarda en la caché las temporadas cuyos archivos de entrada
+    han cambiado (las demás ya están). Devuelve las huellas de todas las
+    temporadas y la lista de las recalculadas.
+    """
+    huellas = {season: huella_temporada(r, p) for season, r, p in temporadas}
+    cambiadas = [t for t in temporadas if not cache.vigente(t[0], huellas[t[0]])]
+    METRICAS.contar("cache_merge", len(temporadas) - len(cambiadas), resultado="acierto")
+    METRICAS.contar("cache_merge", len(cambiadas), resultado="fallo")
+    print(f"[CACHE] {len(temporadas) - len(cambiadas)} temporadas sin cambios, {len(cambiadas)} a recalcular")
+
+    if cambiadas:
+        resultados, pitstops, pilotos = cargar_todas(cambiadas, n_procesos)
+        for season, _, p in cambiadas:    # merge por temporada para poder guardar cada parte por separado
+            res, pit, pil = (df[df["Season"] == season].copy() if not df.empty else df for df in (resultados, pitstops, pilotos))
+            dim = dimension_pilotos(pil, pit)
+            guardar_dimension(dim, p)
+            merged = mergear_contando(res, pit, dim)
+            cache.guardar(season, huellas[season], normalizar_esquema(merged) if not merged.empty else merged)
+    return huellas, cambiadas
+
+
+def run_part_iii(data_dir="data", output_file="data/final_merged.csv", formato="csv", n_procesos=None, incremental=True,
+                 ritmo=False):
+    """
+    Merge de resultados (Wikipedia) y pit-stops (Jolpica) de todas las
+    temporadas.
+
+    Con incremental=True (por defecto) solo se recalculan las temporadas
+    cuyos archivos de entrada han cambiado desde la última ejecución; el
+    resto sale de la caché (ver CacheMerge). Con incremental=False se
+    rehace todo desde cero.
+
+    Con ritmo=True se añaden al final las columnas de ritmo por stint de
+    data/agregados/ritmo_stints.parquet (ver vueltas.py; NaN en las carreras
+    sin vueltas). Como el ritmo puede cambiar sin que cambien las entradas
+    del merge, en parquet se reescriben entonces todas las particiones.
+
+    La salida sigue el esquema canónico (ver normalizar_esquema). La
+    dimensión de pilotos de cada temporada recalculada se guarda junto a sus
+    pit-stops (ver guardar_dimension) y los cubos del dashboard en
+    data/agregados (ver agregados.py).
+    """
+    base_path = Path(data_dir)
+    temporadas = rutas_temporadas(base_path, formato)
+
+    if not incremental:
+        resultados, pitstops, pilotos = cargar_todas(temporadas, n_procesos)
+        dim = dimension_pilotos(pilotos, pitstops)
+        for season, _, p in temporadas:
+            guardar_dimension(dim[dim["Season"] == season], p)
+        final_df = mergear_contando(resultados, pitstops, dim)
+        if final_df.empty:
+            raise RuntimeError("No se pudo generar ningún DataFrame final. Revisa los CSV.")
+        final_df = normalizar_esquema(final_df)
+        if ritmo:
+            final_df = unir_ritmo(final_df, data_dir)
+        guardar_final(final_df, output_file)
+        guardar_agregados(final_df, output_file)
+        print(f"[FINALIZADO] Datos exportados a {output_file} con {len(final_df)} filas")
+        return
+
+    cache = CacheMerge(data_dir)
+    huellas, cambiadas = actualizar_cache(cache, temporadas, n_procesos)
+    cache.podar(set(huellas))
+    cache.persistir()
+
+    partes = [cache.cargar(season) for season in sorted(huellas)]
+    partes = [p for p in partes if not p.empty]
+    if not partes:
         raise RuntimeError("No se pudo generar ningún DataFrame final. Revisa los CSV.")
 
-    final_df = pd.concat(todos, ignore_index=True)
-    final_df.to_csv(output_file, index=False)
-
-    print(f"[FINALIZADO] CSV exportado a {output_file} con {len(final_df)} filas")
+    final_df = normalizar_esquema(pd.concat(partes, ignore_index=True))    # otra vez para unificar las categorías de cada temporada
+    if ritmo:
+        final_df = unir_ritmo(final_df, data_dir)
+    guardar_final(final_df, output_file, cambiadas=None if ritmo else {season for season, _, _ in cambiadas})
+    guardar_agregados(final_df, output_file)
+
+    print(f"[FINALIZADO] Datos exportados a {output_file} con {len(final_df)} filas")
+
+
+def unir_ritmo(final_df, data_dir):
+    from vueltas import unir_ritmo as unir    # solo si se pide: vueltas trae el apartado 2 consigo
+    return unir(final_df, data_dir)
+
+
+# --------------------------------------------------
+# MODO STREAMING (APARTADO 2 -> APARTADO 3 EN MEMORIA)
+# --------------------------------------------------
+
+def numero_carrera(archivo):
+    # race_05_pitstops.csv -> 5
+    return int(re.match(r"race_(\d+)_", archivo.name).group(1))
+
+
+class MergeStreaming:
+    """
+    Merge incremental que consume las carreras según las va descargando el
+    apartado 2 (ver run_part_ii con cola), sin pasar por los csv.
+
+    - ("calendario", season, calendario): empezamos a leer en segundo plano
+      los resultados de Wikipedia de esa temporada (que sí están en disco)
+    - ("pendientes", {season: [rounds]}): qué carreras van a llegar por la cola
+    - ("carrera", season, round, pitstops, pilotos): la guardamos y, cuando
+      han llegado todas las de su temporada, mergeamos la temporada entera
+
+    Así el merge de una temporada se solapa con la descarga de las demás.
+    Las carreras que el apartado 2 no vuelve a descargar (ya estaban en el
+    manifiesto) se leen de disco, y las temporadas que ni siquiera se han
+    pedido salen de la caché del merge (CacheMerge) como en run_part_iii,
+    así la salida final tiene todas las temporadas que hay en data_dir.
+
+    Con guardar=True (las carreras también se escriben en disco) las
+    temporadas mergeadas aquí se apuntan en la caché; con guardar=False no,
+    porque lo que hay en disco no es lo que se ha mergeado.
+    """
+    def __init__(self, data_dir="data", formato="csv", guardar=True):
+        self.base = Path(data_dir)
+        self.formato = formato
+        self.guardar = guardar
+        self.lector = ThreadPoolExecutor(max_workers=2)    # lectura de resultados mientras se descarga
+        self.resultados = {}    # season -> futuro con los resultados
+        self.esperadas = {}     # season -> rounds que faltan por llegar
+        self.carreras = {}      # season -> [(round, pitstops, pilotos)]
+        self.partes = {}        # season -> temporada ya mergeada
+
+    def rutas(self, season):
+        if self.formato == "parquet":
+            return ruta_particion(self.base, "resultados", season), ruta_particion(self.base, "pitstops", season)
+        return self.base / str(season), self.base / str(season)
+
+    def recibir(self, mensaje):
+        tipo = mensaje[0]
+        if tipo == "calendario":
+            _, season, calendario = mensaje
+            articulos = {clave_articulo(c["url"]): int(c["round"]) for c in calendario if c.get("url")} or None
+            ruta_resultados, _ = self.rutas(season)
+            self.resultados[season] = self.lector.submit(cargar_resultados, ruta_resultados, articulos)
+            self.carreras.setdefault(season, [])
+        elif tipo == "pendientes":
+            for season, rounds in mensaje[1].items():
+                self.esperadas[season] = set(rounds)
+                if not rounds:    # nada que descargar: todo sale de disco
+                    self.mergear(season)
+        elif tipo == "carrera":
+            _, season, rnd, pitstops, pilotos = mensaje
+            self.carreras[season].append((rnd, pitstops, pilotos))
+            self.esperadas[season].discard(rnd)
+            if not self.esperadas[season]:
+                self.mergear(season)
+
+    def de_disco(self, season, recibidas):
+        """
+        Pit-stops y pilotos de las carreras de la temporada que no han llegado por la cola.
+        """
+        _, ruta_pitstops = self.rutas(season)
+        pitstops = [leer_pitstops_archivo(a) for a in archivos_pitstops(ruta_pitstops) if numero_carrera(a) not in recibidas] \
+            if ruta_pitstops.exists() else []
+        pilotos = [leer_pilotos_archivo(a) for a in archivos_pilotos(ruta_dataset(ruta_pitstops, "pilotos"))
+                   if numero_carrera(a) not in recibidas]
+        return [df for df in pitstops if df is not None], [df for df in pilotos if df is not None]
+
+    def mergear(self, season):
+        recibidas = self.carreras.pop(season, [])
+        pitstops = [p for _, p, _ in recibidas if not p.empty]
+        pilotos = [d for _, _, d in recibidas if not d.empty]
+        disco_pitstops, disco_pilotos = self.de_disco(season, {rnd for rnd, _, _ in recibidas})
+
+        pit = pd.concat(pitstops + disco_pitstops, ignore_index=True) if pitstops or disco_pitstops else pd.DataFrame()
+        pil = pd.concat(pilotos + disco_pilotos, ignore_index=True) if pilotos or disco_pilotos else pd.DataFrame()
+        if not pit.empty:
+            pit["DriverNumber"] = pit["DriverNumber"].astype(str)
+        res = self.resultados.pop(season).result()
+
+        dim = dimension_pilotos(pil, pit)
+        if self.guardar:
+            guardar_dimension(dim, self.rutas(season)[1])
+        merged = mergear_contando(res, pit, dim)
+        self.partes[season] = normalizar_esquema(merged) if not merged.empty else merged
+        print(f"[TERMINADO] Merge de la temporada {season} ({len(merged)} filas)")
+
+    def finalizar(self, output_file):
+        for season in list(self.resultados):    # temporadas que no se completaron (no debería pasar)
+            self.mergear(season)
+        self.lector.shutdown()
+
+        cache = CacheMerge(self.base)
+        temporadas = rutas_temporadas(self.base, self.formato) if self.base.exists() else []
+        if self.guardar:    # ya están en disco: la próxima vez no hay que recalcularlas
+            for season, r, p in temporadas:
+                if season in self.partes:
+                    cache.guardar(season, huella_temporada(r, p), self.partes[season])
+        huellas, cambiadas = actualizar_cache(cache, [t for t in temporadas if t[0] not in self.partes])
+        cache.podar({season for season, _, _ in temporadas})
+        cache.persistir()
+
+        partes = dict(self.partes)
+        partes.update({season: cache.cargar(season) for season in huellas})
+        partes = [partes[season] for season in sorted(partes) if not partes[season].empty]
+        if not partes:
+            raise RuntimeError("No se pudo generar ningún DataFrame final. Revisa los datos de entrada.")
+        final_df = normalizar_esquema(pd.concat(partes, ignore_index=True))
+        guardar_final(final_df, output_file, cambiadas=set(self.partes) | {season for season, _, _ in cambiadas})
+        guardar_agregados(final_df, output_file)
+        print(f"[FINALIZADO] Datos exportados a {output_file} con {len(final_df)} filas")
+        return final_df
+
+
+def run_part_ii_iii(seasons, data_dir="data", output_file="data/final_merged.csv", formato="csv", guardar=True, **opciones_part_ii):
+    """
+    Apartados 2 y 3 encadenados en memoria: el apartado 2 descarga en un
+    hilo y va entregando cada carrera por una cola; aquí las mergeamos por
+    temporadas según se completan (ver MergeStreaming).
+
+    Con guardar=False las carreras no se escriben en disco: solo queda la
+    salida final. opciones_part_ii se pasan tal cual a run_part_ii
+    (concurrente, bulk, tasa...).
+    """
+    from apartado_2 import run_part_ii
+
+    cola = queue.Queue(maxsize=256)    # acotada: si el merge se retrasa, la descarga espera
+    fallo = []
+
+    def productor():
+        try:
+            run_part_ii(seasons, out_dir=data_dir, formato=formato, cola=cola, guardar=guardar, **opciones_part_ii)
+        except BaseException as e:
+            fallo.append(e)
+            cola.put(("fin",))
+
+    hilo = threading.Thread(target=productor, name="apartado_2", daemon=True)
+    hilo.start()
+
+    merge = MergeStreaming(data_dir, formato, guardar)
+    while True:
+        mensaje = cola.get()
+        if mensaje[0] == "fin":
+            break
+        merge.recibir(mensaje)
+    hilo.join()
+
+    if fallo:
+        merge.lector.shutdown()
+        raise RuntimeError("El apartado 2 falló durante el modo streaming") from fallo[0]
+    return merge.finalizar(output_file)
@@ -2,6 +2,14 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+from pathlib import Path
+from almacenamiento import leer_particionado
+from apartado_3 import ALIAS_COLUMNAS, nombre_canonico, normalizar_esquema
+from agregados import (ruta_agregados, leer_agregados, cubo_posiciones, cubo_duraciones,
+                       resumen_por_paradas, estadisticas_caja, regresion, POSICION_MAXIMA)
+from consultas import TablaIndexada
+from graficos import CacheFiguras, dispersion, UMBRAL_PUNTOS
+from estadisticas import resumen_por_grupo
 
 # --------------------------------------------------
 # CONFIGURACIÓN GENERAL
@@ -22,38 +30,90 @@ st.markdown(
 # --------------------------------------------------
 # CARGA DE DATOS
 # --------------------------------------------------
+COLUMNAS = ["Season", "Driver", "Constructor", "NPitstops", "MedianPitStopDuration", "Position"]
+
 @st.cache_data
 def load_data():
-    return pd.read_csv("data/final_merged.csv")
+    # si el apartado 3 se ejecutó con salida parquet leemos solo las columnas que usamos
+    if Path("data/final_merged.parquet").exists():
+        columnas = [c for c in ALIAS_COLUMNAS if ALIAS_COLUMNAS[c] in COLUMNAS]    # también los nombres antiguos (Pos., ...)
+        df = leer_particionado("data/final_merged.parquet", columnas=columnas)
+    else:
+        df = pd.read_csv("data/final_merged.csv", usecols=lambda c: nombre_canonico(c) in COLUMNAS)
+    df = normalizar_esquema(df)    # esquema canónico: Position, tipos compactos...
 
-df = load_data()
+    # limpieza básica una sola vez (la caché la comparten todas las sesiones):
+    # quitamos nulos y pasamos a enteros normales para graficar
+    df = df.dropna(subset=["Position", "NPitstops", "Season"])
+    return df.astype({"Position": "int16", "NPitstops": "int16"})
 
-# --------------------------------------------------
-# DETECTAR COLUMNA DE POSICIÓN
-# --------------------------------------------------
-possible_position_cols = ["Position", "Pos", "Pos.", "Finish"]
-position_col = None
 
-for col in possible_position_cols:
-    if col in df.columns:
-        position_col = col
-        break
+@st.cache_data
+def load_cubos():
+    # los cubos que deja el apartado 3 en data/agregados; si no están (datos antiguos) los calculamos aquí
+    cubos = leer_agregados(ruta_agregados("data/final_merged.csv"))
+    if cubos is None:
+        df = load_data()
+        cubos = (cubo_posiciones(df), cubo_duraciones(df))
+    return cubos
 
-if position_col is None:
-    st.error(f"No se encontró columna de posición. Columnas: {list(df.columns)}")
-    st.stop()
 
-# --------------------------------------------------
-# LIMPIEZA BÁSICA
-# --------------------------------------------------
-df[position_col] = pd.to_numeric(df[position_col], errors="coerce")
-df["NPitstops"] = pd.to_numeric(df["NPitstops"], errors="coerce")
-df["Season"] = pd.to_numeric(df["Season"], errors="coerce")
-df["MedianPitStopDuration"] = pd.to_numeric(
-    df["MedianPitStopDuration"], errors="coerce"
-)
+@st.cache_data
+def load_puntos():
+    # observaciones del gráfico de dispersión (solo las que usa el apartado de duración)
+    df = load_data()
+    df = df[(df["NPitstops"] > 0) & df["MedianPitStopDuration"].notna()
+            & (df["Position"] >= 1) & (df["Position"] <= POSICION_MAXIMA)]
+    return df[["Season", "Driver", "Constructor", "MedianPitStopDuration", "Position"]].reset_index(drop=True)
+
+
+@st.cache_resource
+def load_indices():
+    # cubos y observaciones ordenados por temporada e indexados por piloto (ver consultas.py):
+    # cada filtro sale de cortar tramos ya ordenados, sin recorrer todas las filas
+    posiciones, duraciones = load_cubos()
+    tablas = {"posiciones": posiciones, "duraciones": duraciones, "puntos": load_puntos()}
+    return {nombre: TablaIndexada(df, indices=["Season", "Driver"]) for nombre, df in tablas.items()}
+
+
+def consultar(tabla, temporadas, pilotos):
+    # sin pilotos seleccionados no filtramos por piloto
+    return load_indices()[tabla].seleccionar(Season=list(temporadas), Driver=list(pilotos) or None)
+
+
+# vistas filtradas: la clave es la selección (tuplas ordenadas) y guardamos
+# solo las últimas, así cambiar de filtro y volver no recalcula nada
+@st.cache_data(max_entries=64)
+def vista_paradas(temporadas, pilotos):
+    posiciones = consultar("posiciones", temporadas, pilotos)
+    return resumen_por_paradas(posiciones), estadisticas_caja(posiciones)
+
+
+@st.cache_data(max_entries=64)
+def vista_duraciones(temporadas, pilotos):
+    puntos = consultar("puntos", temporadas, pilotos)
+    return regresion(consultar("duraciones", temporadas, pilotos)), puntos["MedianPitStopDuration"], puntos["Position"]
+
+
+@st.cache_resource
+def cache_figuras():
+    # una sola caché de PNG para todas las sesiones (las figuras no dependen de quién las pide)
+    return CacheFiguras(max_entradas=32)
+
+
+figuras = cache_figuras()
 
-df = df.dropna(subset=[position_col, "NPitstops", "Season"])
+
+@st.cache_data(max_entries=64)
+def vista_grupos(temporadas, pilotos, columna):
+    # regresión, correlación y medianas por grupo con intervalos bootstrap (ver estadisticas.py)
+    puntos = consultar("puntos", temporadas, pilotos)
+    tabla = resumen_por_grupo(puntos["MedianPitStopDuration"], puntos["Position"], puntos[columna], n_bootstrap=500)
+    return tabla.rename(columns={"mediana_x": "mediana_duración", "mediana_x_inf": "mediana_duración_inf",
+                                 "mediana_x_sup": "mediana_duración_sup", "mediana_y": "mediana_posición"})
+
+
+indice_posiciones = load_indices()["posiciones"]
 
 # --------------------------------------------------
 # SIDEBAR – FILTROS Y NAVEGACIÓN
@@ -66,62 +126,56 @@ section = st.sidebar.radio(
 )
 
 # Temporadas
-seasons = sorted(df["Season"].unique())
+seasons = indice_posiciones.valores("Season")
 season_sel = st.sidebar.multiselect(
     "Temporadas",
     seasons,
     default=seasons
 )
 
-df = df[df["Season"].isin(season_sel)]
-
 # Pilotos
-if "Driver" in df.columns:
-    drivers = sorted(df["Driver"].dropna().unique())
-    driver_sel = st.sidebar.multiselect(
-        "Pilotos (opcional)",
-        drivers,
-        default=[]
-    )
-    if driver_sel:
-        df = df[df["Driver"].isin(driver_sel)]
+drivers = indice_posiciones.valores("Driver", Season=season_sel)
+driver_sel = st.sidebar.multiselect(
+    "Pilotos (opcional)",
+    drivers,
+    default=[]
+)
+
+seleccion = (tuple(sorted(season_sel)), tuple(sorted(driver_sel)))
 
 # ==================================================
 # APARTADO 4.A – NÚMERO DE PIT-STOPS
 # ==================================================
-if section.startswith("Apartado 4.A"):
+if section == "Número de pit-stops":
 
     st.header("Número de pit-stops vs posición final")
 
-    df_plot = df[(df[position_col] >= 1) & (df[position_col] <= 20)]
+    summary, cajas = vista_paradas(*seleccion)
     col1, col2 = st.columns(2)
 
     # BOXPLOT
-    with col1:
-        st.subheader("Distribución de posiciones")
+    def dibujar_cajas():
         fig1, ax1 = plt.subplots(figsize=(5, 4))
-        df_plot.boxplot(column=position_col, by="NPitstops", ax=ax1)
+        ax1.bxp(cajas)    # las cajas ya vienen calculadas de las cuentas del cubo
         ax1.set_xlabel("Número de pit-stops")
         ax1.set_ylabel("Posición final")
-        ax1.set_title("")
-        plt.suptitle("")
-        st.pyplot(fig1)
+        return fig1
 
-    # BARRAS
-    with col2:
-        st.subheader("Posición media")
-        summary = (
-        df_plot.groupby("NPitstops")[position_col]
-        .agg(Posición_media="mean", Observaciones="count")
-        .reset_index()
-        .sort_values("NPitstops")
-    )
+    with col1:
+        st.subheader("Distribución de posiciones")
+        st.image(figuras.obtener(("cajas",) + seleccion, dibujar_cajas))
 
+    # BARRAS
+    def dibujar_barras():
         fig2, ax2 = plt.subplots(figsize=(5, 4))
         ax2.bar(summary["NPitstops"], summary["Posición_media"])
         ax2.set_xlabel("Número de pit-stops")
         ax2.set_ylabel("Posición media")
-        st.pyplot(fig2)
+        return fig2
+
+    with col2:
+        st.subheader("Posición media")
+        st.image(figuras.obtener(("barras",) + seleccion, dibujar_barras))
 
     st.subheader("Resumen numérico")
     st.dataframe(summary, use_container_width=True)
@@ -133,51 +187,54 @@ else:
 
     st.header("Duración del pit-stop vs posición final")
 
+    recta, x, y = vista_duraciones(*seleccion)
 
-    df_b = df[
-    (df["NPitstops"] > 0) &
-    (df["MedianPitStopDuration"].notna()) &
-    (df[position_col] >= 1) &
-    (df[position_col] <= 20)
-    ]
+    # con muchas observaciones no dibujamos todos los puntos (ver graficos.dispersion)
+    modo = "densidad"
+    if len(x) > UMBRAL_PUNTOS:
+        modo = st.radio("Muchas observaciones: mostrar", ["densidad", "muestra"], horizontal=True)
 
     # SCATTER
     st.subheader("Duración media del pit-stop vs posición final")
 
-    fig_b, ax_b = plt.subplots(figsize=(6, 4))
-
-    x = df_b["MedianPitStopDuration"]
-    y = df_b[position_col]
+    def dibujar_dispersion():
+        fig_b, ax_b = plt.subplots(figsize=(6, 4))
 
-    ax_b.scatter(x, y, alpha=0.4, label="Observaciones")
+        dispersion(ax_b, x, y, modo=modo)
 
-    # Línea de regresión
-    coef = np.polyfit(x, y, 1)
-    poly = np.poly1d(coef)
+        # Línea de regresión (sale de los estadísticos suficientes del cubo, con todos los datos)
+        if recta is not None:
+            pendiente, ordenada, _, x_min, x_max, _ = recta
+            x_line = np.linspace(x_min, x_max, 100)
+            y_line = pendiente * x_line + ordenada
 
-    x_line = np.linspace(x.min(), x.max(), 100)
-    y_line = poly(x_line)
+            ax_b.plot(
+                x_line,
+                y_line,
+                color="red",
+                linewidth=2,
+                label="Regresión lineal"
+            )
 
-    ax_b.plot(
-        x_line,
-        y_line,
-        color="red",
-        linewidth=2,
-        label="Regresión lineal"
-    )
+        ax_b.set_xlabel("Duración media del pit-stop (s)")
+        ax_b.set_ylabel("Posición final")
+        ax_b.legend()
+        return fig_b
 
-    ax_b.set_xlabel("Duración media del pit-stop (s)")
-    ax_b.set_ylabel("Posición final")
-    ax_b.legend()
-
-    st.pyplot(fig_b)
+    st.image(figuras.obtener(("dispersion", modo) + seleccion, dibujar_dispersion))
 
     # CORRELACIÓN
     st.subheader("Correlación")
 
-    corr_b = np.corrcoef(
-        df_b["MedianPitStopDuration"],
-        df_b[position_col]
-    )[0, 1]
+    if recta is None:
+        st.info("No hay suficientes observaciones para la regresión.")
+    else:
+        st.metric("Coeficiente de correlación (Pearson)", f"{recta[2]:.3f}")
+
+    # POR GRUPO
+    st.subheader("Por temporada, escudería o piloto")
 
-    st.metric("Coeficiente de correlación (Pearson)", f"{corr_b:.3f}")
+    agrupar = st.selectbox("Agrupar por", ["Temporada", "Escudería", "Piloto"])
+    columna = {"Temporada": "Season", "Escudería": "Constructor", "Piloto": "Driver"}[agrupar]
+    st.dataframe(vista_grupos(*seleccion, columna).round(3), use_container_width=True)
+    st.caption("Intervalos de confianza del 95 % por bootstrap (500 réplicas, remuestreo dentro de cada grupo).")
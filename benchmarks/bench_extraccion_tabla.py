@@ -0,0 +1,104 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# benchmarks/bench_extraccion_tabla.py
+#
+# Micro-benchmark de la extracción de la tabla de resultados de un informe
+# de carrera: pd.read_html sobre toda la página (camino antiguo) frente a
+# extraer_tabla_resultados con selectores sobre la respuesta ya parseada.
+#
+# Uso:
+#   python benchmarks/bench_extraccion_tabla.py [ficheros.html ...] [--repeticiones 50]
+#   python benchmarks/bench_extraccion_tabla.py --descargar 2023_British_Grand_Prix 2013_Australian_Grand_Prix
+# Sin ficheros usa todos los .html de benchmarks/fixtures.
+#
+# gp_muestra.html es una página escrita a mano con la forma de un informe
+# de carrera (72 líneas): sirve para comprobar que los dos caminos dan la
+# misma tabla, pero sus tiempos dicen poco de una página real de Wikipedia,
+# que es mucho más grande (infobox, navboxes, cientos de referencias...).
+# Con --descargar se guardan informes reales en benchmarks/fixtures (se
+# nombran como en Wikipedia, p.ej. 2023_British_Grand_Prix.html) y se miden
+# junto a la muestra; son los números que hay que dar.
+
+import sys
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))    # para importar los apartados desde la raíz
+
+from scrapy.http import HtmlResponse
+from apartado_1 import extraer_tabla_resultados, extraer_tabla_read_html
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+WIKIPEDIA = "https://en.wikipedia.org/wiki/"
+
+
+def descargar(titulos, destino=FIXTURES):
+    """
+    Guarda los informes de Wikipedia indicados (títulos de artículo) como
+    <destino>/<titulo>.html y devuelve sus rutas.
+    """
+    import requests
+    rutas = []
+    for titulo in titulos:
+        response = requests.get(WIKIPEDIA + titulo, timeout=30, headers={"User-Agent": "proyecto-f1-icai (benchmark)"})
+        if response.status_code != 200:
+            raise RuntimeError(f"No se pudo descargar {titulo} (HTTP {response.status_code})")
+        ruta = destino / f"{titulo}.html"
+        ruta.write_text(response.text, encoding="utf-8")
+        print(f"[TERMINADO] {titulo} guardado en {ruta} ({len(response.content) // 1024} KiB)")
+        rutas.append(ruta)
+    return rutas
+
+
+def medir(funcion, repeticiones):
+    """
+    Devuelve (milisegundos por llamada, pico de memoria en KiB) de funcion().
+    """
+    funcion()    # calentamos (imports perezosos, cachés de lxml...)
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    ms = (time.perf_counter() - inicio) / repeticiones * 1000
+
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ms, pico / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("ficheros", nargs="*", type=Path)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--descargar", nargs="+", metavar="TITULO", help="guardar antes estos informes de Wikipedia en fixtures")
+    args = parser.parse_args()
+
+    if args.descargar:
+        descargar(args.descargar)
+    ficheros = args.ficheros or sorted(FIXTURES.glob("*.html"))
+    if not ficheros:
+        sys.exit(f"No hay ficheros html en {FIXTURES}")
+
+    print(f"{'fichero':<40}{'read_html ms':>14}{'KiB':>10}{'selectores ms':>15}{'KiB':>10}{'x CPU':>8}{'x mem':>8}")
+    for fichero in ficheros:
+        html = fichero.read_text(encoding="utf-8")
+        response = HtmlResponse(url=f"https://en.wikipedia.org/wiki/{fichero.stem}", body=html.encode("utf-8"), encoding="utf-8")
+        response.selector    # en el crawler la respuesta ya llega parseada, así que no lo contamos
+
+        antiguo = extraer_tabla_read_html(html)
+        nuevo = extraer_tabla_resultados(response)
+        if (antiguo is None) != (nuevo is None) or (nuevo is not None and antiguo.shape != nuevo.shape):
+            print(f"[AVISO] {fichero.name}: los dos caminos no devuelven la misma tabla")
+
+        ms_a, kib_a = medir(lambda: extraer_tabla_read_html(html), args.repeticiones)
+        ms_n, kib_n = medir(lambda: extraer_tabla_resultados(response), args.repeticiones)
+        print(f"{fichero.name:<40}{ms_a:>14.2f}{kib_a:>10.0f}{ms_n:>15.2f}{kib_n:>10.0f}{ms_a / ms_n:>8.1f}{kib_a / kib_n:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
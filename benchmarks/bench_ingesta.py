@@ -0,0 +1,174 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# benchmarks/bench_ingesta.py
+#
+# Benchmark de la ingesta del apartado 2 contra el servidor local de
+# servidor_jolpica.py, para comparar estrategias de concurrencia y de
+# backoff de forma repetible (mismos datos y mismos fallos en cada
+# ejecución).
+#
+# Para cada estrategia levantamos un servidor nuevo, ejecutamos run_part_ii
+# sin caché de respuestas y contamos, con las métricas del propio apartado 2
+# (ver metricas.py):
+#   - tiempo total y peticiones por segundo
+#   - peticiones, reintentos, 429, 5xx y timeouts
+#   - sobrecoste de los reintentos: esperas de backoff y Retry-After más el
+#     tiempo perdido en peticiones colgadas
+#   - esperas de cortesía (pausas fijas) y del limitador de tasa
+# y comprobamos que se han guardado todos los pit-stops que sirve el servidor.
+#
+# Uso:
+#   python benchmarks/bench_ingesta.py [--temporadas 2] [--estrategias concurrente bulk]
+#   python benchmarks/bench_ingesta.py --prob-429 0.1 --retry-after 0.5 --backoff 0.25 --hilos 16 --tasa 50
+
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import io
+from pathlib import Path
+from datetime import datetime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))    # para importar los apartados desde la raíz
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import apartado_2
+from metricas import METRICAS
+from servidor_jolpica import ServidorJolpica, Datos, Fallos, FIXTURES
+
+RESULTADOS = Path(__file__).resolve().parent / "resultados" / "ingesta.json"
+
+# nombre -> opciones de run_part_ii
+ESTRATEGIAS = {
+    "secuencial": {},
+    "concurrente": {"concurrente": True},
+    "bulk": {"bulk": True},
+    "bulk_concurrente": {"bulk": True, "concurrente": True},
+}
+
+
+def suma(informe, nombre, **filtro):
+    """
+    Suma de un contador (o del tiempo total de un cronómetro) del informe de
+    METRICAS con las etiquetas dadas.
+    """
+    total = 0
+    for c in informe["contadores"]:
+        if c["nombre"] == nombre and all(c["etiquetas"].get(k) == v for k, v in filtro.items()):
+            total += c["valor"]
+    for t in informe["tiempos"]:
+        if t["nombre"] == nombre and all(t["etiquetas"].get(k) == v for k, v in filtro.items()):
+            total += t["segundos"]
+    return total
+
+
+def pitstops_esperados(datos, temporadas):
+    return sum(len(c["PitStops"]) for s in temporadas for c in datos.temporada(s)["Races"])
+
+
+def medir(nombre, opciones, args):
+    datos = Datos(args.fixtures, carreras=args.carreras, semilla=args.semilla)
+    fallos = Fallos(args.prob_429, args.retry_after, args.prob_5xx, args.prob_cuelgue, args.cuelgue,
+                    args.max_fallos, args.semilla)
+    servidor = ServidorJolpica(datos, fallos, args.latencia, args.jitter)
+    apartado_2.BASE = servidor.arrancar()
+    apartado_2.TIMEOUT_PETICION = args.timeout
+    apartado_2.BACKOFF_BASE = args.backoff
+    METRICAS.reiniciar()
+
+    try:
+        with tempfile.TemporaryDirectory() as out_dir:
+            inicio = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):    # sin un [TERMINADO] por carrera
+                apartado_2.run_part_ii(args.temporadas, out_dir=out_dir, usar_cache=False, reanudar=False,
+                                       max_workers=args.hilos, tasa=args.tasa, capacidad=args.capacidad,
+                                       por_hora=args.por_hora or None, **opciones)
+            segundos = time.perf_counter() - inicio
+    finally:
+        servidor.parar()
+
+    informe = METRICAS.informe()
+    peticiones = suma(informe, "peticiones_http", api="jolpica")
+    timeouts = suma(informe, "peticiones_http", resultado="timeout")
+    esperas_reintento = suma(informe, "espera", motivo="backoff") + suma(informe, "espera", motivo="retry_after")
+    guardados = suma(informe, "filas_entrada", fase="fetch")
+    esperados = pitstops_esperados(datos, args.temporadas)
+    if guardados != esperados:
+        print(f"[AVISO] {nombre}: se han guardado {guardados} pit-stops de {esperados}")
+
+    return {
+        "segundos": segundos,
+        "peticiones": peticiones,
+        "peticiones_por_segundo": peticiones / segundos if segundos else 0.0,
+        "reintentos": suma(informe, "reintentos", api="jolpica"),
+        "429": suma(informe, "limite_tasa", api="jolpica"),
+        "5xx": sum(suma(informe, "peticiones_http", resultado=str(e)) for e in (500, 502, 503, 504)),
+        "timeouts": timeouts,
+        "sobrecoste_reintentos_s": esperas_reintento + timeouts * args.timeout,
+        "espera_pausas_s": suma(informe, "espera", motivo="pausa"),
+        "espera_limitador_s": suma(informe, "espera", motivo="limitador"),
+        "peticion_media_ms": 1000 * suma(informe, "peticion_http") / max(peticiones, 1),
+        "pitstops": guardados,
+        "servidor": dict(servidor.estadisticas),
+    }
+
+
+def leer_temporadas(texto):
+    # "2" -> 2 temporadas desde 2019; "2019,2021" o "2019-2021" -> esas
+    if "," not in texto and "-" not in texto and int(texto) < 1000:
+        return list(range(2019, 2019 + int(texto)))
+    temporadas = []
+    for trozo in texto.split(","):
+        inicio, _, fin = trozo.partition("-")
+        temporadas.extend(range(int(inicio), int(fin or inicio) + 1))
+    return temporadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la ingesta del apartado 2 contra un Jolpica local")
+    parser.add_argument("--estrategias", nargs="+", choices=list(ESTRATEGIAS), default=list(ESTRATEGIAS))
+    parser.add_argument("--temporadas", type=leer_temporadas, default=leer_temporadas("1"),
+                        help="número de temporadas (desde 2019) o lista, p.ej. 2019-2021")
+    parser.add_argument("--carreras", type=int, default=21, help="carreras de las temporadas sintéticas")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES)
+    parser.add_argument("--latencia", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--prob-429", type=float, default=0.05)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--prob-5xx", type=float, default=0.02)
+    parser.add_argument("--prob-cuelgue", type=float, default=0.0)
+    parser.add_argument("--cuelgue", type=float, default=3.0)
+    parser.add_argument("--max-fallos", type=int, default=2)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=1.0, help="apartado_2.TIMEOUT_PETICION durante el benchmark")
+    parser.add_argument("--backoff", type=float, default=1.0, help="apartado_2.BACKOFF_BASE (primera espera del backoff)")
+    parser.add_argument("--hilos", type=int, default=8, help="max_workers del modo concurrente")
+    parser.add_argument("--tasa", type=float, default=4.0, help="peticiones por segundo del limitador")
+    parser.add_argument("--capacidad", type=int, default=4, help="ráfaga del limitador")
+    parser.add_argument("--por-hora", type=int, default=0,
+                        help="límite por hora del limitador (0 = sin límite, el servidor local no lo tiene)")
+    args = parser.parse_args()
+
+    resultados = {}
+    print(f"{'estrategia':<18}{'s':>8}{'pet.':>7}{'pet/s':>8}{'reint.':>8}{'429':>6}{'5xx':>6}{'t/o':>5}"
+          f"{'reint. s':>10}{'pausas s':>10}{'limit. s':>10}{'ms/pet':>8}")
+    for nombre in args.estrategias:
+        r = medir(nombre, ESTRATEGIAS[nombre], args)
+        resultados[nombre] = r
+        print(f"{nombre:<18}{r['segundos']:>8.2f}{r['peticiones']:>7}{r['peticiones_por_segundo']:>8.1f}{r['reintentos']:>8}"
+              f"{r['429']:>6}{r['5xx']:>6}{r['timeouts']:>5}{r['sobrecoste_reintentos_s']:>10.2f}"
+              f"{r['espera_pausas_s']:>10.2f}{r['espera_limitador_s']:>10.2f}{r['peticion_media_ms']:>8.1f}")
+
+    RESULTADOS.parent.mkdir(parents=True, exist_ok=True)
+    opciones = {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()}
+    RESULTADOS.write_text(json.dumps({"fecha": datetime.now().isoformat(timespec="seconds"), "opciones": opciones,
+                                      "resultados": resultados}, indent=1), encoding="utf-8")
+    print(f"[TERMINADO] Resultados en {RESULTADOS}")
+
+
+if __name__ == "__main__":
+    main()
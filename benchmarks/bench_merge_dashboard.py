@@ -0,0 +1,281 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# benchmarks/bench_merge_dashboard.py
+#
+# Benchmark del apartado 3 y de los cálculos del dashboard sobre datos
+# sintéticos (ver generar_datos.py) a 1x, 10x, 100x y 1000x el volumen actual.
+#
+# Para cada escala medimos:
+#   apartado_3               run_part_iii completo (incremental=False)
+#   apartado_3_sin_cambios   run_part_iii incremental cuando todo sale de la caché
+#   dashboard.*              lo que hace app.py: carga, cubos, filtros,
+#                            groupby, regresión y tabla por grupos con bootstrap,
+#                            más la referencia fila a fila (groupby + polyfit) y el
+#                            filtro de las observaciones con máscara o con consultas.py
+#
+# Cada medida del apartado 3 corre en un proceso nuevo (el pico de memoria
+# residente es el de ese proceso y no se mezcla con el anterior); las del
+# dashboard dan la mediana de varias repeticiones y el pico de memoria de
+# Python (tracemalloc) de una ejecución aparte.
+#
+# Los resultados se comparan con la base guardada en base/merge_dashboard.json
+# y se marca como regresión lo que tarde más de un (1 + tolerancia) de la base.
+#
+# Uso:
+#   python benchmarks/bench_merge_dashboard.py [--escalas 1 10 100] [--repeticiones 5]
+#   python benchmarks/bench_merge_dashboard.py --escalas 1 10 --guardar-base
+#   python benchmarks/bench_merge_dashboard.py --completar-base    # añade a la base solo las medidas nuevas
+#   python benchmarks/bench_merge_dashboard.py --estricto    # código de salida 1 si hay regresiones
+# Los árboles generados se quedan en benchmarks/.datos/escala_<k> para las siguientes ejecuciones.
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import tracemalloc
+import multiprocessing as mp
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))    # para importar los apartados desde la raíz
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import numpy as np
+import pandas as pd
+from generar_datos import generar_arbol
+from metricas import memoria_pico_bytes
+
+DATOS = Path(__file__).resolve().parent / ".datos"
+BASE = Path(__file__).resolve().parent / "base" / "merge_dashboard.json"
+ULTIMO = Path(__file__).resolve().parent / "resultados" / "merge_dashboard.json"
+SUELO_RUIDO = 0.05    # segundos: por debajo de esta diferencia no hablamos de regresión
+
+
+# --------------------------------------------------
+# APARTADO 3 (en un proceso nuevo por medida)
+# --------------------------------------------------
+
+def medir_apartado_3(datos, incremental, n_procesos):
+    """
+    Se ejecuta en el proceso hijo. Devuelve segundos y memoria (MB) de
+    run_part_iii sobre el árbol datos.
+    """
+    import contextlib, io
+    from apartado_3 import run_part_iii
+
+    salida = Path(datos) / "final_merged.csv"
+    if incremental:    # primera pasada para llenar la caché; medimos la segunda
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_part_iii(datos, salida, incremental=True, n_procesos=n_procesos)
+
+    memoria_inicial = memoria_pico_bytes()
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):    # sin los [CARGANDO] de cada temporada
+        run_part_iii(datos, salida, incremental=incremental, n_procesos=n_procesos)
+    return {"segundos": time.perf_counter() - inicio,
+            "memoria_pico_mb": memoria_pico_bytes() / 2**20,
+            "memoria_inicial_mb": memoria_inicial / 2**20}
+
+
+def en_proceso_nuevo(funcion, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+        return pool.submit(funcion, *args).result()
+
+
+# --------------------------------------------------
+# DASHBOARD
+# --------------------------------------------------
+
+def cargar_como_app(salida):
+    # lo mismo que load_data y load_puntos de app.py
+    from apartado_3 import nombre_canonico, normalizar_esquema
+    from agregados import POSICION_MAXIMA
+    columnas = ["Season", "Driver", "Constructor", "NPitstops", "MedianPitStopDuration", "Position"]
+    df = normalizar_esquema(pd.read_csv(salida, usecols=lambda c: nombre_canonico(c) in columnas))
+    df = df.dropna(subset=["Position", "NPitstops", "Season"]).astype({"Position": "int16", "NPitstops": "int16"})
+    puntos = df[(df["NPitstops"] > 0) & df["MedianPitStopDuration"].notna()
+                & (df["Position"] >= 1) & (df["Position"] <= POSICION_MAXIMA)]
+    return df, puntos[["Season", "Driver", "Constructor", "MedianPitStopDuration", "Position"]].reset_index(drop=True)
+
+
+def referencia_filas(df, temporadas):
+    # lo que hacía el dashboard antes de los cubos: filtrar filas, agrupar y polyfit
+    d = df[df["Season"].isin(temporadas) & (df["Position"] <= 20)]
+    d.groupby("NPitstops")["Position"].agg(["mean", "count"])
+    d = d[d["NPitstops"] > 0].dropna(subset=["MedianPitStopDuration"])
+    x, y = d["MedianPitStopDuration"].to_numpy(float), d["Position"].to_numpy(float)
+    return np.polyfit(x, y, 1), np.corrcoef(x, y)[0, 1]
+
+
+def operaciones_dashboard(salida, n_bootstrap):
+    """
+    Diccionario nombre -> función sin argumentos con cada cálculo del
+    dashboard para tres selecciones: todo, una temporada y tres pilotos.
+    """
+    from agregados import cubo_posiciones, cubo_duraciones, filtrar, resumen_por_paradas, estadisticas_caja, regresion
+    from estadisticas import resumen_por_grupo
+    from consultas import TablaIndexada
+
+    df, puntos = cargar_como_app(salida)
+    indice = TablaIndexada(puntos, indices=["Season", "Driver"])
+    posiciones, duraciones = cubo_posiciones(df), cubo_duraciones(df)
+    temporadas = tuple(sorted(df["Season"].unique()))
+    pilotos = tuple(df["Driver"].value_counts().index[:3])
+    selecciones = {"todo": (temporadas, ()), "temporada": (temporadas[-1:], ()), "pilotos": (temporadas, pilotos)}
+
+    operaciones = {
+        "carga": lambda: cargar_como_app(salida),
+        "cubos": lambda: (cubo_posiciones(df), cubo_duraciones(df)),
+        "indice_puntos": lambda: TablaIndexada(puntos, indices=["Season", "Driver"]),
+    }
+    for nombre, (t, p) in selecciones.items():
+        operaciones[f"paradas_{nombre}"] = lambda t=t, p=p: (lambda c: (resumen_por_paradas(c), estadisticas_caja(c)))(filtrar(posiciones, t, p))
+        operaciones[f"regresion_{nombre}"] = lambda t=t, p=p: regresion(filtrar(duraciones, t, p))
+        operaciones[f"referencia_filas_{nombre}"] = lambda t=t, p=p: referencia_filas(
+            df[df["Driver"].isin(p)] if p else df, t)
+        # filtro de las observaciones: máscara sobre todas las filas frente al índice de consultas.py
+        operaciones[f"puntos_mascara_{nombre}"] = lambda t=t, p=p: filtrar(puntos, t, p)
+        operaciones[f"puntos_indice_{nombre}"] = lambda t=t, p=p: indice.seleccionar(Season=list(t), Driver=list(p) or None)
+    # una consulta por temporada (como al ir cambiando el selector): a 100x el índice ya se mide por encima del ruido
+    operaciones["puntos_mascara_por_temporada"] = lambda: [filtrar(puntos, (s,), ()) for s in temporadas]
+    operaciones["puntos_indice_por_temporada"] = lambda: [indice.seleccionar(Season=s) for s in temporadas]
+    t, p = selecciones["todo"]
+    operaciones["grupos_temporada"] = lambda: (lambda d: resumen_por_grupo(
+        d["MedianPitStopDuration"], d["Position"], d["Season"], n_bootstrap=n_bootstrap))(filtrar(puntos, t, p))
+    operaciones["grupos_escuderia"] = lambda: (lambda d: resumen_por_grupo(
+        d["MedianPitStopDuration"], d["Position"], d["Constructor"], n_bootstrap=n_bootstrap))(filtrar(puntos, t, p))
+    return operaciones
+
+
+def medir_dashboard(salida, repeticiones, n_bootstrap):
+    """
+    Se ejecuta en el proceso hijo. Mediana de los tiempos y pico de memoria
+    de Python de cada operación.
+    """
+    resultados = {}
+    for nombre, funcion in operaciones_dashboard(salida, n_bootstrap).items():
+        funcion()    # calentamos (imports perezosos, cachés de pandas...)
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        tracemalloc.start()
+        funcion()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultados[f"dashboard.{nombre}"] = {"segundos": statistics.median(tiempos), "memoria_pico_mb": pico / 2**20}
+    return resultados
+
+
+# --------------------------------------------------
+# BASE Y COMPARACIÓN
+# --------------------------------------------------
+
+def maquina():
+    import pyarrow
+    return {"python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+            "pyarrow": pyarrow.__version__, "sistema": platform.platform(), "cpus": mp.cpu_count()}
+
+
+def comparar(resultados, base, tolerancia):
+    """
+    Imprime la tabla de resultados frente a la base y devuelve las medidas
+    que han empeorado.
+    """
+    regresiones = []
+    print(f"\n{'escala':>7} {'medida':<40}{'s':>10}{'MB':>9}{'base s':>10}{'x base':>8}")
+    for escala, medidas in resultados.items():
+        for nombre, m in medidas.items():
+            b = base.get(escala, {}).get(nombre)
+            linea = f"{escala:>7} {nombre:<40}{m['segundos']:>10.4f}{m['memoria_pico_mb']:>9.1f}"
+            if b is None:
+                print(linea)
+                continue
+            ratio = m["segundos"] / b["segundos"] if b["segundos"] > 0 else float("inf")
+            empeora = m["segundos"] > b["segundos"] * (1 + tolerancia) and m["segundos"] - b["segundos"] > SUELO_RUIDO
+            print(f"{linea}{b['segundos']:>10.4f}{ratio:>8.2f}{'  <- REGRESIÓN' if empeora else ''}")
+            if empeora:
+                regresiones.append((escala, nombre))
+    return regresiones
+
+
+def guardar_json(ruta, contenido):
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    ruta.write_text(json.dumps(contenido, indent=1, ensure_ascii=False), encoding="utf-8")
+
+
+def preparar_datos(escala, regenerar=False):
+    datos = DATOS / f"escala_{escala}"
+    if regenerar and datos.exists():
+        shutil.rmtree(datos)
+    if not datos.exists():
+        generar_arbol(datos, escala)
+    return datos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del apartado 3 y del dashboard con datos sintéticos")
+    parser.add_argument("--escalas", type=int, nargs="+", default=[1, 10, 100], help="1, 10, 100 y/o 1000")
+    parser.add_argument("--repeticiones", type=int, default=5, help="repeticiones de cada cálculo del dashboard")
+    parser.add_argument("--bootstrap", type=int, default=500, help="réplicas bootstrap de la tabla por grupos (como app.py)")
+    parser.add_argument("--procesos", type=int, default=1,
+                        help="n_procesos de run_part_iii (1 = todo en el proceso medido, así el pico de memoria es comparable)")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="cuánto más lento que la base cuenta como regresión")
+    parser.add_argument("--guardar-base", action="store_true", help="guardar estos resultados como nueva base")
+    parser.add_argument("--completar-base", action="store_true",
+                        help="añadir a la base solo las medidas que aún no tiene (p.ej. operaciones nuevas) sin tocar las demás")
+    parser.add_argument("--estricto", action="store_true", help="salir con código 1 si hay regresiones")
+    parser.add_argument("--regenerar", action="store_true", help="volver a generar los datos sintéticos")
+    args = parser.parse_args()
+
+    resultados = {}
+    for escala in args.escalas:
+        datos = preparar_datos(escala, args.regenerar)
+        print(f"[ESCALA] {escala}x")
+        medidas = {
+            "apartado_3": en_proceso_nuevo(medir_apartado_3, str(datos), False, args.procesos),
+            "apartado_3_sin_cambios": en_proceso_nuevo(medir_apartado_3, str(datos), True, args.procesos),
+        }
+        medidas.update(en_proceso_nuevo(medir_dashboard, str(datos / "final_merged.csv"), args.repeticiones, args.bootstrap))
+        resultados[str(escala)] = medidas
+
+    informe = {"fecha": datetime.now().isoformat(timespec="seconds"), "maquina": maquina(),
+               "opciones": {"repeticiones": args.repeticiones, "bootstrap": args.bootstrap, "procesos": args.procesos},
+               "resultados": resultados}
+    guardar_json(ULTIMO, informe)
+
+    base = json.loads(BASE.read_text(encoding="utf-8")) if BASE.exists() else None
+    if base is not None and base["maquina"] != informe["maquina"]:
+        print("[AVISO] La base se midió en otra máquina o con otras versiones: compara con cuidado")
+    regresiones = comparar(resultados, base["resultados"] if base else {}, args.tolerancia)
+
+    if args.guardar_base:
+        if base is not None:    # conservamos las escalas que no se han medido ahora
+            resultados = {**base["resultados"], **resultados}
+        guardar_json(BASE, {**informe, "resultados": resultados})
+        print(f"[TERMINADO] Base guardada en {BASE}")
+    elif args.completar_base and base is not None:
+        nuevas = 0
+        for escala, medidas in resultados.items():
+            actuales = base["resultados"].setdefault(escala, {})
+            for nombre, m in medidas.items():
+                if nombre not in actuales:
+                    actuales[nombre] = m
+                    nuevas += 1
+        guardar_json(BASE, base)
+        print(f"[TERMINADO] {nuevas} medidas nuevas añadidas a {BASE}")
+    if regresiones:
+        print(f"[AVISO] {len(regresiones)} medidas más lentas que la base (tolerancia {args.tolerancia:.0%})")
+    return 1 if regresiones and args.estricto else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
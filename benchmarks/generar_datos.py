@@ -0,0 +1,152 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# benchmarks/generar_datos.py
+#
+# Generador de datos sintéticos de F1 con la misma forma que los reales,
+# para medir el apartado 3 y el dashboard a escalas que no tenemos:
+#
+#   <destino>/<year>/<year>_Grand_Prix_<k>.csv   resultados (como los csv de Wikipedia,
+#                                                  con filas basura "Fastest lap" y "Source")
+#   <destino>/<year>/race_XX_pitstops.csv         resumen de pit-stops (apartado 2)
+#   <destino>/<year>/race_XX_drivers.csv          pilotos de cada carrera (apartado 2)
+#   <destino>/<year>/calendar.csv                 calendario (apartado 2)
+#
+# Escala 1 es el volumen actual (6 temporadas de 21 carreras con 20
+# pilotos); escala k son 6k temporadas. Las temporadas sintéticas siguen
+# numerándose desde 2019 (2019..8018 en escala 1000) porque las carreras de
+# una temporada no pueden pasar de 127 (RaceNumber es int8).
+#
+# Uso:
+#   python benchmarks/generar_datos.py <destino> [--escala 10] [--semilla 0]
+
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+TEMPORADAS_BASE = 6     # 2019-2024
+CARRERAS = 21
+PILOTOS = 20
+PRIMERA_TEMPORADA = 2019
+ESCUDERIAS = ["Mercedes", "Red Bull Racing-Honda", "Ferrari", "McLaren-Renault", "Alpine-Renault",
+              "AlphaTauri-Honda", "Aston Martin-Mercedes", "Williams-Mercedes", "Alfa Romeo-Ferrari", "Haas-Ferrari"]
+NOMBRES = ["Lewis", "Max", "Charles", "Lando", "Carlos", "Sergio", "George", "Fernando", "Esteban", "Pierre",
+           "Daniel", "Valtteri", "Kevin", "Yuki", "Lance", "Sebastian", "Nicholas", "Mick", "Zhou", "Alexander"]
+APELLIDOS = ["Hamilton", "Verstappen", "Leclerc", "Norris", "Sainz", "Pérez", "Russell", "Alonso", "Ocon", "Gasly",
+             "Ricciardo", "Bottas", "Magnussen", "Tsunoda", "Stroll", "Vettel", "Latifi", "Schumacher", "Guanyu", "Albon"]
+
+
+def parrilla_temporada(rng, season):
+    """
+    Los 20 pilotos de una temporada: cada temporada sintética baraja nombres
+    y apellidos, así que hay muchos pilotos distintos (como en el histórico).
+    """
+    nombres = rng.permutation(NOMBRES)
+    apellidos = rng.permutation(APELLIDOS)
+    numeros = rng.choice(np.arange(1, 100), PILOTOS, replace=False)
+    ids = [f"{a.lower()}_{season}_{i}" for i, a in enumerate(apellidos)]
+    return pd.DataFrame({"DriverId": ids, "DriverNumber": numeros, "GivenName": nombres, "FamilyName": apellidos,
+                         "Constructor": [ESCUDERIAS[i // 2] for i in range(PILOTOS)]})
+
+
+def escribir_por_carrera(df, carpeta, nombres, filas_por_carrera, extra=""):
+    """
+    Escribe un csv por carrera: pasamos a texto la temporada entera de una
+    vez (un solo to_csv) y repartimos las líneas, que es mucho más rápido
+    que un DataFrame y un to_csv por archivo.
+    """
+    cabecera, *lineas = df.to_csv(index=False).splitlines()
+    inicio = 0
+    for nombre, n in zip(nombres, filas_por_carrera):
+        texto = "\n".join([cabecera] + lineas[inicio:inicio + n]) + "\n" + extra
+        (carpeta / nombre).write_text(texto, encoding="utf-8")
+        inicio += n
+
+
+def generar_temporada(rng, carpeta, season):
+    carpeta.mkdir(parents=True, exist_ok=True)
+    parrilla = parrilla_temporada(rng, season)
+    articulos = [f"{season}_Grand_Prix_{rnd:02d}" for rnd in range(1, CARRERAS + 1)]
+    pd.DataFrame({
+        "round": range(1, CARRERAS + 1),
+        "date": [f"{season}-{3 + rnd // 3:02d}-{1 + rnd % 28:02d}" for rnd in range(CARRERAS)],
+        "raceName": [a.split("_", 1)[1].replace("_", " ") for a in articulos],
+        "url": [f"http://en.wikipedia.org/wiki/{a}" for a in articulos],
+    }).to_csv(carpeta / "calendar.csv", index=False)
+
+    # todas las carreras de la temporada a la vez: fila i = carrera i // PILOTOS
+    n = CARRERAS * PILOTOS
+    orden = rng.permuted(np.tile(np.arange(PILOTOS), (CARRERAS, 1)), axis=1).ravel()    # orden de llegada de cada carrera
+    pilotos = parrilla.iloc[orden].reset_index(drop=True)
+    rounds = np.repeat(np.arange(1, CARRERAS + 1), PILOTOS)
+    puesto = np.tile(np.arange(PILOTOS), CARRERAS)
+    retirados = rng.random(n) < 0.1
+    puntos = np.array([25, 18, 15, 12, 10, 8, 6, 4, 2, 1] + [0] * (PILOTOS - 10))
+
+    resultados = pd.DataFrame({
+        "Pos.": np.where(retirados, "Ret", (puesto + 1).astype(str)),
+        "No.": pilotos["DriverNumber"],
+        "Driver": pilotos["GivenName"] + " " + pilotos["FamilyName"],
+        "Constructor": pilotos["Constructor"],
+        "Laps": np.where(retirados, rng.integers(1, 57, n), 57),
+        "Time/Retired": np.where(retirados, "Engine", "+1 Lap"),
+        "Grid": rng.permuted(np.tile(np.arange(1, PILOTOS + 1), (CARRERAS, 1)), axis=1).ravel(),
+        "Points": puntos[puesto],
+    })
+    basura = "Fastest lap:,,Fastest lap: 1:32.000,,,,,\nSource:,,Source: [1],,,,,\n"    # filas que también trae Wikipedia
+    escribir_por_carrera(resultados, carpeta, [f"{a}.csv" for a in articulos], [PILOTOS] * CARRERAS, basura)
+
+    # pit-stops: la mayoría de pilotos para 1-3 veces y algún retirado no llega a parar
+    paradas = np.where(retirados & (rng.random(n) < 0.5), 0, rng.integers(1, 4, n))
+    con_paradas = paradas > 0
+    pitstops = pd.DataFrame({
+        "Season": season, "RaceNumber": rounds,
+        "DriverId": pilotos["DriverId"], "DriverNumber": pilotos["DriverNumber"],
+        "NPitstops": paradas,
+        "MedianPitStopDuration": np.round(rng.normal(23.5, 2.0, n) + 0.15 * puesto, 3),
+    })[con_paradas]
+    nombres = [f"race_{rnd:02d}_pitstops.csv" for rnd in range(1, CARRERAS + 1)]
+    escribir_por_carrera(pitstops, carpeta, nombres, np.bincount(rounds[con_paradas], minlength=CARRERAS + 1)[1:])
+
+    pilotos_carrera = pd.DataFrame({
+        "Season": season, "RaceNumber": rounds, "DriverId": pilotos["DriverId"], "DriverNumber": pilotos["DriverNumber"],
+        "GivenName": pilotos["GivenName"], "FamilyName": pilotos["FamilyName"],
+        "Url": "http://en.wikipedia.org/wiki/" + pilotos["GivenName"] + "_" + pilotos["FamilyName"],
+    })
+    nombres = [f"race_{rnd:02d}_drivers.csv" for rnd in range(1, CARRERAS + 1)]
+    escribir_por_carrera(pilotos_carrera, carpeta, nombres, [PILOTOS] * CARRERAS)
+
+
+def generar_arbol(destino, escala=1, semilla=0):
+    """
+    Escribe en destino un árbol data/<year>/ de escala * 6 temporadas.
+    Es reproducible: la misma escala y semilla dan los mismos archivos.
+    Devuelve la lista de temporadas generadas.
+    """
+    destino = Path(destino)
+    rng = np.random.default_rng(semilla)
+    temporadas = list(range(PRIMERA_TEMPORADA, PRIMERA_TEMPORADA + TEMPORADAS_BASE * escala))
+    for i, season in enumerate(temporadas, start=1):
+        generar_temporada(rng, destino / str(season), season)
+        if i % 100 == 0:
+            print(f"[GENERANDO] {i}/{len(temporadas)} temporadas")
+    print(f"[TERMINADO] Escala {escala}: {len(temporadas)} temporadas y {len(temporadas) * CARRERAS} carreras en {destino}")
+    return temporadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un árbol de datos sintético de F1")
+    parser.add_argument("destino", type=Path)
+    parser.add_argument("--escala", type=int, default=1)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+    if args.destino.exists() and any(args.destino.iterdir()):
+        sys.exit(f"{args.destino} no está vacía")
+    generar_arbol(args.destino, args.escala, args.semilla)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# benchmarks/servidor_jolpica.py
+#
+# Servidor local que imita la API de Jolpica para probar y medir el
+# apartado 2 sin salir a la red.
+#
+# Sirve las mismas rutas y la misma forma de JSON que usa apartado_2:
+#   /ergast/f1/<year>.json                        calendario
+#   /ergast/f1/<year>/results.json                resultados de la temporada (paginado)
+#   /ergast/f1/<year>/pitstops.json               pit-stops de la temporada (paginado)
+#   /ergast/f1/<year>/<round>/results.json        resultados de una carrera
+#   /ergast/f1/<year>/<round>/pitstops.json       pit-stops de una carrera
+#   /ergast/f1/<year>/<round>/laps.json           tiempos por vuelta de una carrera (vueltas.py)
+# con paginación como la real (limit como mucho 100, offset, total en MRData;
+# en laps se paginan los tiempos, así que una vuelta puede quedar partida
+# entre dos páginas).
+#
+# Los datos salen de fixtures grabadas (un <year>.json por temporada, ver
+# grabar_desde_cache) o, para las temporadas que no estén, de una temporada
+# sintética reproducible. Las vueltas no se graban: se generan siempre a
+# partir de los resultados y los pit-stops de la carrera.
+#
+# Además se pueden inyectar latencia, 429 con Retry-After, errores 5xx y
+# cuelgues (la respuesta tarda más que el timeout del cliente). Qué
+# peticiones fallan depende solo de la url y de cuántas veces se ha pedido
+# (con una semilla), no del orden de llegada, así que dos ejecuciones con
+# distinta concurrencia ven los mismos fallos.
+#
+# Uso:
+#   python benchmarks/servidor_jolpica.py --puerto 8000 --latencia 0.05 --prob-429 0.05
+#   JOLPICA_BASE=http://127.0.0.1:8000/ergast/f1 python main.py fetch --temporadas 2019
+#   python benchmarks/servidor_jolpica.py --grabar data/.cache_http benchmarks/fixtures/jolpica
+
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PREFIJO = "/ergast/f1"
+LIMITE_MAXIMO = 100    # Jolpica no devuelve más de 100 filas por página
+LIMITE_DEFECTO = 30
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "jolpica"
+RECURSOS = {"results": "Results", "pitstops": "PitStops"}
+
+
+# --------------------------------------------------
+# DATOS: FIXTURES GRABADAS O TEMPORADAS SINTÉTICAS
+# --------------------------------------------------
+
+def temporada_sintetica(season, carreras=21, pilotos=20, semilla=0):
+    """
+    Temporada con la forma de las fixtures: {"season", "Races": [carrera con
+    Results y PitStops]}. Reproducible para la misma temporada y semilla.
+    """
+    rng = random.Random(f"{semilla}-{season}")
+    parrilla = [{"driverId": f"piloto_{season}_{i}", "permanentNumber": str(n), "code": f"P{i:02d}",
+                 "url": f"http://en.wikipedia.org/wiki/Piloto_{season}_{i}", "givenName": "Piloto",
+                 "familyName": f"{season} {i}", "nationality": "Spanish"}
+                for i, n in enumerate(rng.sample(range(1, 100), pilotos))]
+    escuderias = [{"constructorId": f"escuderia_{i // 2}", "name": f"Escudería {i // 2}"} for i in range(pilotos)]
+
+    races = []
+    for rnd in range(1, carreras + 1):
+        orden = rng.sample(range(pilotos), pilotos)
+        results = [{"number": parrilla[i]["permanentNumber"], "position": str(pos), "positionText": str(pos),
+                    "points": str(max(0, 26 - 2 * pos) if pos <= 10 else 0), "Driver": parrilla[i],
+                    "Constructor": escuderias[i], "grid": str(rng.randint(1, pilotos)), "laps": "57", "status": "Finished"}
+                   for pos, i in enumerate(orden, start=1)]
+        pitstops = []
+        for i in orden:
+            for stop in range(1, rng.randint(1, 3) + 1):
+                duracion = rng.gauss(23.5, 2.0)
+                pitstops.append({"driverId": parrilla[i]["driverId"], "lap": str(15 * stop + rng.randint(-5, 5)),
+                                 "stop": str(stop), "time": f"15:{10 + stop * 15:02d}:{rng.randint(0, 59):02d}",
+                                 "duration": f"{duracion:.3f}"})
+        pitstops.sort(key=lambda p: (int(p["lap"]), p["time"]))    # como la API: por vuelta
+        races.append({"season": str(season), "round": str(rnd), "raceName": f"Grand Prix {rnd:02d}",
+                      "date": f"{season}-{3 + rnd // 3:02d}-{1 + rnd % 28:02d}",
+                      "url": f"http://en.wikipedia.org/wiki/{season}_Grand_Prix_{rnd:02d}",
+                      "Results": results, "PitStops": pitstops})
+    return {"season": str(season), "Races": races}
+
+
+def vueltas_sinteticas(carrera, semilla=0):
+    """
+    Tiempos por vuelta coherentes con los pit-stops de la carrera: ritmo
+    base por piloto, degradación dentro de cada stint y vueltas de entrada
+    y salida de boxes más lentas. Devuelve la lista Laps de la API:
+    [{"number": "1", "Timings": [{"driverId", "position", "time"}]}, ...]
+    """
+    rng = random.Random(f"{semilla}-{carrera['season']}-{carrera['round']}-vueltas")
+    paradas = {}
+    for p in carrera.get("PitStops", []):
+        paradas.setdefault(p["driverId"], set()).add(int(p["lap"]))
+
+    acumulado = {}    # driverId -> [(vuelta, tiempo de la vuelta, tiempo acumulado)]
+    for resultado in carrera.get("Results", []):
+        piloto = resultado["Driver"]["driverId"]
+        ritmo = rng.gauss(90.0, 0.6)
+        boxes = paradas.get(piloto, set())
+        total, vuelta_stint, filas = 0.0, 0, []
+        for vuelta in range(1, int(resultado.get("laps") or 0) + 1):
+            vuelta_stint += 1
+            tiempo = ritmo + 0.05 * vuelta_stint + rng.gauss(0, 0.3)
+            if vuelta == 1:
+                tiempo += 5.0
+            if vuelta in boxes:
+                tiempo += 3.0
+            if vuelta - 1 in boxes:
+                tiempo += 18.0
+                vuelta_stint = 0
+            total += tiempo
+            filas.append((vuelta, tiempo, total))
+        acumulado[piloto] = filas
+
+    laps = []
+    for vuelta in range(1, max((len(f) for f in acumulado.values()), default=0) + 1):
+        en_pista = sorted((f[vuelta - 1][2], piloto, f[vuelta - 1][1]) for piloto, f in acumulado.items() if len(f) >= vuelta)
+        laps.append({"number": str(vuelta), "Timings": [
+            {"driverId": piloto, "position": str(pos), "time": f"{int(t // 60)}:{t % 60:06.3f}"}
+            for pos, (_, piloto, t) in enumerate(en_pista, start=1)]})
+    return laps
+
+
+def grabar_desde_cache(cache_dir, destino):
+    """
+    Convierte las respuestas guardadas por la caché del apartado 2
+    (CacheRespuestas, data/.cache_http) en fixtures <year>.json: juntamos
+    las páginas de cada temporada y quitamos las filas repetidas.
+    """
+    carreras = {}    # (season, round) -> datos de la carrera sin filas
+    filas = {}       # (season, round, recurso) -> {fila serializada: fila}
+    for archivo in Path(cache_dir).rglob("*.json"):
+        entrada = json.loads(archivo.read_text(encoding="utf-8"))
+        ruta = urlparse(entrada["url"]).path
+        encontrado = re.search(r"/(\d{4})(?:/(\d+))?/(results|pitstops)\.json$", ruta) or re.search(r"/(\d{4})\.json$", ruta)
+        if encontrado is None:
+            continue
+        recurso = encontrado.group(3) if encontrado.re.groups == 3 else None
+        for carrera in entrada["datos"]["MRData"]["RaceTable"]["Races"]:
+            clave = (int(carrera["season"]), int(carrera["round"]))
+            carreras.setdefault(clave, {k: v for k, v in carrera.items() if k not in RECURSOS.values()})
+            if recurso is not None:
+                destino_filas = filas.setdefault(clave + (recurso,), {})
+                for fila in carrera.get(RECURSOS[recurso], []):
+                    destino_filas.setdefault(json.dumps(fila, sort_keys=True), fila)
+
+    destino = Path(destino)
+    destino.mkdir(parents=True, exist_ok=True)
+    for season in sorted({s for s, _ in carreras}):
+        races = []
+        for (s, rnd), carrera in sorted(carreras.items()):
+            if s == season:
+                races.append({**carrera, **{clave: list(filas.get((s, rnd, recurso), {}).values())
+                                            for recurso, clave in RECURSOS.items()}})
+        (destino / f"{season}.json").write_text(json.dumps({"season": str(season), "Races": races}), encoding="utf-8")
+        print(f"[TERMINADO] Fixture de {season}: {len(races)} carreras")
+
+
+class Datos:
+    """
+    Temporadas servidas: las fixtures de la carpeta y, si no están, sintéticas.
+    """
+    def __init__(self, fixtures=FIXTURES, carreras=21, pilotos=20, semilla=0):
+        self.fixtures = Path(fixtures) if fixtures else None
+        self.carreras = carreras
+        self.pilotos = pilotos
+        self.semilla = semilla
+        self.temporadas = {}
+        self.vueltas = {}
+        self.lock = threading.Lock()
+
+    def temporada(self, season):
+        with self.lock:
+            if season not in self.temporadas:
+                archivo = self.fixtures / f"{season}.json" if self.fixtures else None
+                if archivo is not None and archivo.exists():
+                    self.temporadas[season] = json.loads(archivo.read_text(encoding="utf-8"))
+                else:
+                    self.temporadas[season] = temporada_sintetica(season, self.carreras, self.pilotos, self.semilla)
+            return self.temporadas[season]
+
+    def vueltas_carrera(self, carrera):
+        clave = (carrera["season"], carrera["round"])
+        with self.lock:
+            if clave not in self.vueltas:
+                self.vueltas[clave] = vueltas_sinteticas(carrera, self.semilla)
+            return self.vueltas[clave]
+
+
+def pagina(carreras, recurso, limit, offset):
+    """
+    MRData de una página: las filas de todas las carreras van seguidas y
+    cortamos [offset, offset + limit); cada carrera de la página lleva solo
+    sus filas de ese tramo (como hace la API).
+    """
+    clave = RECURSOS.get(recurso)
+    if clave is None:    # calendario: se pagina por carreras
+        total = len(carreras)
+        races = [{k: v for k, v in c.items() if k not in RECURSOS.values()} for c in carreras[offset:offset + limit]]
+    else:
+        planas = [(c, fila) for c in carreras for fila in c.get(clave, [])]
+        total = len(planas)
+        races = []
+        for carrera, fila in planas[offset:offset + limit]:
+            if not races or races[-1]["round"] != carrera["round"]:
+                races.append({**{k: v for k, v in carrera.items() if k not in RECURSOS.values()}, clave: []})
+            races[-1][clave].append(fila)
+    return {"MRData": {"xmlns": "", "series": "f1", "limit": str(limit), "offset": str(offset), "total": str(total),
+                       "RaceTable": {"Races": races}}}
+
+
+def pagina_vueltas(carrera, laps, limit, offset):
+    """
+    MRData de una página de laps: se cortan los tiempos [offset, offset + limit)
+    y se vuelven a agrupar por vuelta.
+    """
+    planas = [(lap["number"], t) for lap in laps for t in lap["Timings"]]
+    vueltas = []
+    for numero, timing in planas[offset:offset + limit]:
+        if not vueltas or vueltas[-1]["number"] != numero:
+            vueltas.append({"number": numero, "Timings": []})
+        vueltas[-1]["Timings"].append(timing)
+    races = [{**{k: v for k, v in carrera.items() if k not in RECURSOS.values()}, "Laps": vueltas}] if vueltas else []
+    return {"MRData": {"xmlns": "", "series": "f1", "limit": str(limit), "offset": str(offset), "total": str(len(planas)),
+                       "RaceTable": {"Races": races}}}
+
+
+# --------------------------------------------------
+# SERVIDOR
+# --------------------------------------------------
+
+class Fallos:
+    """
+    Inyección de fallos reproducible. El intento n de una url falla con las
+    probabilidades dadas (429, 5xx, cuelgue) solo si n < max_fallos, así
+    que toda petición acaba funcionando si el cliente reintenta lo bastante.
+    """
+    def __init__(self, prob_429=0.0, retry_after=1.0, prob_5xx=0.0, prob_cuelgue=0.0, cuelgue=5.0, max_fallos=2, semilla=0):
+        self.prob_429 = prob_429
+        self.retry_after = retry_after
+        self.prob_5xx = prob_5xx
+        self.prob_cuelgue = prob_cuelgue
+        self.cuelgue = cuelgue
+        self.max_fallos = max_fallos
+        self.semilla = semilla
+        self.intentos = {}
+        self.lock = threading.Lock()
+
+    def decidir(self, clave):
+        """
+        Devuelve None (responder bien), "429", "5xx" o "cuelgue".
+        """
+        with self.lock:
+            intento = self.intentos.get(clave, 0)
+            self.intentos[clave] = intento + 1
+        if intento >= self.max_fallos:
+            return None
+        u = int(hashlib.sha256(f"{self.semilla}|{clave}|{intento}".encode()).hexdigest()[:8], 16) / 16**8
+        for fallo, prob in (("429", self.prob_429), ("5xx", self.prob_5xx), ("cuelgue", self.prob_cuelgue)):
+            if u < prob:
+                return fallo
+            u -= prob
+        return None
+
+
+class ManejadorJolpica(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"    # keep-alive, como el servidor real
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        servidor = self.server
+        servidor.contar("peticiones")
+        url = urlparse(self.path)
+        q = parse_qs(url.query)
+        ruta = url.path[len(PREFIJO):] if url.path.startswith(PREFIJO) else None
+
+        if servidor.latencia or servidor.jitter:
+            time.sleep(servidor.latencia + servidor.jitter * random.random())
+
+        fallo = servidor.fallos.decidir(self.path)
+        if fallo == "429":
+            servidor.contar("429")
+            return self.responder(429, {"detail": "Too many requests"}, {"Retry-After": f"{servidor.fallos.retry_after:g}"})
+        if fallo == "5xx":
+            servidor.contar("5xx")
+            return self.responder(503, {"detail": "Service unavailable"})
+        if fallo == "cuelgue":
+            servidor.contar("cuelgues")
+            time.sleep(servidor.fallos.cuelgue)    # el cliente debería haber cortado ya por timeout
+
+        try:
+            limit = min(int(q.get("limit", [LIMITE_DEFECTO])[0]), LIMITE_MAXIMO)
+            offset = int(q.get("offset", ["0"])[0])
+        except ValueError:
+            return self.responder(400, {"detail": "limit y offset deben ser enteros"})
+
+        m = re.fullmatch(r"/(\d{4})(?:/(\d+))?(?:/(results|pitstops|laps))?\.json", ruta or "")
+        if m is None or (m.group(2) and not m.group(3)) or (m.group(3) == "laps" and not m.group(2)):
+            servidor.contar("404")
+            return self.responder(404, {"detail": "Not found"})
+        carreras = servidor.datos.temporada(int(m.group(1)))["Races"]
+        if m.group(2):
+            carreras = [c for c in carreras if c["round"] == m.group(2)]
+        if m.group(3) == "laps":
+            if not carreras:
+                return self.responder(200, pagina_vueltas(None, [], limit, offset))
+            return self.responder(200, pagina_vueltas(carreras[0], servidor.datos.vueltas_carrera(carreras[0]), limit, offset))
+        self.responder(200, pagina(carreras, m.group(3), limit, offset))
+
+    def responder(self, estado, cuerpo, cabeceras=None):
+        datos = json.dumps(cuerpo).encode("utf-8")
+        try:
+            self.send_response(estado)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(datos)))
+            for nombre, valor in (cabeceras or {}).items():
+                self.send_header(nombre, valor)
+            self.end_headers()
+            self.wfile.write(datos)
+        except (BrokenPipeError, ConnectionResetError):    # el cliente cortó (timeout)
+            return
+        self.server.contar("bytes", len(datos))
+
+
+class ServidorJolpica(ThreadingHTTPServer):
+    """
+    Servidor de pruebas. arrancar() lo pone a escuchar en un hilo y devuelve
+    la url base para apartado_2.BASE (o la variable JOLPICA_BASE).
+    """
+    daemon_threads = True
+
+    def __init__(self, datos=None, fallos=None, latencia=0.0, jitter=0.0, puerto=0):
+        super().__init__(("127.0.0.1", puerto), ManejadorJolpica)
+        self.datos = datos or Datos()
+        self.fallos = fallos or Fallos()
+        self.latencia = latencia
+        self.jitter = jitter
+        self.estadisticas = {}
+        self.lock = threading.Lock()
+
+    @property
+    def base(self):
+        return f"http://127.0.0.1:{self.server_port}{PREFIJO}"
+
+    def contar(self, nombre, n=1):
+        with self.lock:
+            self.estadisticas[nombre] = self.estadisticas.get(nombre, 0) + n
+
+    def arrancar(self):
+        threading.Thread(target=self.serve_forever, name="servidor_jolpica", daemon=True).start()
+        return self.base
+
+    def parar(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de Jolpica")
+    parser.add_argument("--puerto", type=int, default=8000)
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES, help="carpeta con las fixtures <year>.json")
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos de latencia por petición")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latencia extra aleatoria (0..jitter segundos)")
+    parser.add_argument("--prob-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--prob-5xx", type=float, default=0.0)
+    parser.add_argument("--prob-cuelgue", type=float, default=0.0)
+    parser.add_argument("--cuelgue", type=float, default=5.0, help="segundos que tarda una respuesta colgada")
+    parser.add_argument("--max-fallos", type=int, default=2, help="intentos de una misma url que pueden fallar")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--grabar", nargs=2, metavar=("CACHE", "DESTINO"),
+                        help="convertir la caché de respuestas del apartado 2 en fixtures y salir")
+    args = parser.parse_args()
+
+    if args.grabar:
+        grabar_desde_cache(*args.grabar)
+        return
+
+    fallos = Fallos(args.prob_429, args.retry_after, args.prob_5xx, args.prob_cuelgue, args.cuelgue, args.max_fallos, args.semilla)
+    servidor = ServidorJolpica(Datos(args.fixtures, semilla=args.semilla), fallos, args.latencia, args.jitter, args.puerto)
+    print(f"[SERVIDOR] Escuchando en {servidor.base}")
+    print(f"[SERVIDOR] JOLPICA_BASE={servidor.base} python main.py fetch ...")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n[FINALIZADO] {servidor.estadisticas}")
+
+
+if __name__ == "__main__":
+    main()
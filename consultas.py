@@ -0,0 +1,246 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# consultas.py
+#
+# Consultas indexadas en memoria sobre el dataset final del apartado 3.
+#
+# Filtrar con máscaras (df["Season"].isin(...), df["Driver"].isin(...))
+# recorre todas las filas en cada consulta. Aquí ordenamos el dataset una
+# vez por (Season, RaceNumber) y, para cada columna indexada, guardamos un
+# índice agrupado tipo CSR (como en estadisticas.ordenar_por_grupo):
+#
+#   etiquetas   valores distintos de la columna, ordenados
+#   inicios     dónde empieza cada valor dentro de `orden` (n_grupos + 1)
+#   orden       posiciones de las filas agrupadas por valor
+#
+# Las filas de un valor son orden[inicios[k]:inicios[k + 1]] y las de un
+# rango de valores, un único tramo de `orden`. Para Season y RaceNumber ni
+# eso: el dataset ya está ordenado por ellas y un rango es un tramo de filas.
+# Así el coste de una consulta depende de cuántas filas devuelve y no del
+# tamaño del dataset.
+#
+# Uso:
+#   python consultas.py [data/final_merged.csv]    informe por temporada y escudería
+
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+INDICES = ["Season", "RaceNumber", "DriverId", "Constructor"]
+ORDEN_PRINCIPAL = ["Season", "RaceNumber"]
+
+
+class IndiceAgrupado:
+    """
+    Índice de una columna: posiciones de las filas agrupadas por valor.
+    """
+    def __init__(self, columna):
+        codigos, self.etiquetas = pd.factorize(pd.Series(columna), sort=True)
+        validos = codigos >= 0    # los nulos no se indexan
+        self.orden = np.flatnonzero(validos)[np.argsort(codigos[validos], kind="stable")]
+        tamanos = np.bincount(codigos[validos], minlength=len(self.etiquetas))
+        self.inicios = np.concatenate(([0], np.cumsum(tamanos)))
+
+    def grupos(self, valores):
+        """
+        Números de grupo de los valores que existen (los demás se ignoran).
+        """
+        valores = pd.Index(np.atleast_1d(valores))
+        k = self.etiquetas.get_indexer(valores)
+        return np.unique(k[k >= 0])
+
+    def tramo(self, desde=None, hasta=None):
+        """
+        (inicio, fin) dentro de `orden` de los valores entre desde y hasta
+        (ambos incluidos; None = sin límite). Es un único tramo porque las
+        etiquetas están ordenadas.
+        """
+        a = 0 if desde is None else self.etiquetas.searchsorted(desde, side="left")
+        b = len(self.etiquetas) if hasta is None else self.etiquetas.searchsorted(hasta, side="right")
+        return self.inicios[a], self.inicios[max(a, b)]
+
+    def posiciones(self, filtro):
+        """
+        Posiciones (ordenadas) de las filas que cumplen el filtro: un valor,
+        una lista de valores o un slice(desde, hasta) con ambos extremos incluidos.
+        """
+        if isinstance(filtro, slice):
+            inicio, fin = self.tramo(filtro.start, filtro.stop)
+            return np.sort(self.orden[inicio:fin])
+        k = self.grupos(filtro)
+        if len(k) == 1:    # caso más habitual: el tramo de un solo valor ya está ordenado
+            return self.orden[self.inicios[k[0]]:self.inicios[k[0] + 1]]
+        return np.sort(np.concatenate([self.orden[self.inicios[g]:self.inicios[g + 1]] for g in k] or [np.array([], dtype=np.intp)]))
+
+    def tamanos(self):
+        """
+        Filas por valor, sin recorrer los datos (sale de los offsets).
+        """
+        return pd.Series(np.diff(self.inicios), index=self.etiquetas)
+
+
+class TablaIndexada:
+    """
+    El dataset final ordenado por ORDEN_PRINCIPAL con un IndiceAgrupado por
+    columna indexada. Los filtros se pasan como argumentos con nombre:
+
+        tabla.seleccionar(Season=slice(2019, 2021), Constructor=["Ferrari", "Mercedes"])
+        tabla.contar(DriverId="alonso")
+        tabla.agregar("Constructor", {"Puntos": ("Points", "sum")}, Season=2021)
+
+    Un filtro a None no filtra; una lista vacía no deja pasar ninguna fila
+    (como agregados.filtrar con temporadas=()).
+    """
+    def __init__(self, df, indices=None):
+        indices = [c for c in (indices or INDICES) if c in df.columns]
+        principal = [c for c in ORDEN_PRINCIPAL if c in df.columns]
+        self.df = df.sort_values(principal, kind="stable", ignore_index=True) if principal else df.reset_index(drop=True)
+        self.principal = principal[0] if principal else None
+        self.indices = {c: IndiceAgrupado(self.df[c]) for c in indices}
+
+    def __len__(self):
+        return len(self.df)
+
+    def posiciones(self, **filtros):
+        """
+        Posiciones de las filas que cumplen todos los filtros. El filtro de
+        la columna de orden principal suele ser un tramo contiguo de filas
+        (a, b): los demás índices solo tienen que quedarse con sus filas
+        dentro del tramo (dos searchsorted). Si no, cruzamos las posiciones
+        empezando por el filtro más selectivo.
+        """
+        filtros = {c: f for c, f in filtros.items() if f is not None}
+        for columna in filtros:
+            if columna not in self.indices:
+                raise RuntimeError(f"La columna {columna} no está indexada (índices: {list(self.indices)})")
+
+        tramo, resultado = None, None
+        if self.principal in filtros:
+            filtro = filtros.pop(self.principal)
+            indice = self.indices[self.principal]
+            if isinstance(filtro, slice):
+                tramo = indice.tramo(filtro.start, filtro.stop)    # `orden` es la identidad: el tramo son las filas
+            else:
+                k = indice.grupos(filtro)
+                if len(k) == 0:
+                    return np.array([], dtype=np.intp)
+                if (np.diff(k) == 1).all():    # valores seguidos (p.ej. todas las temporadas): un solo tramo
+                    tramo = indice.inicios[k[0]], indice.inicios[k[-1] + 1]
+                else:    # varios tramos, ya en orden porque la tabla está ordenada por esta columna
+                    resultado = np.concatenate([np.arange(indice.inicios[g], indice.inicios[g + 1]) for g in k])
+
+        for columna, filtro in sorted(filtros.items(), key=lambda cf: self.estimar(*cf)):
+            filas = self.indices[columna].posiciones(filtro)
+            if tramo is not None:
+                a, b = filas.searchsorted(tramo[0]), filas.searchsorted(tramo[1])
+                resultado, tramo = filas[a:b], None
+            elif resultado is None:
+                resultado = filas
+            else:
+                resultado = np.intersect1d(resultado, filas, assume_unique=True)
+            if len(resultado) == 0:
+                break
+
+        if resultado is not None:
+            return resultado
+        return np.arange(*tramo) if tramo is not None else np.arange(len(self.df))
+
+    def estimar(self, columna, filtro):
+        # filas que devolvería un filtro (para cruzar primero el más selectivo)
+        indice = self.indices[columna]
+        if isinstance(filtro, slice):
+            inicio, fin = indice.tramo(filtro.start, filtro.stop)
+            return fin - inicio
+        k = indice.grupos(filtro)
+        return int((indice.inicios[k + 1] - indice.inicios[k]).sum())
+
+    def seleccionar(self, columnas=None, **filtros):
+        """
+        Filas (y columnas) que cumplen los filtros, en el orden de la tabla.
+        """
+        posiciones = self.posiciones(**filtros)
+        df = self.df if columnas is None else self.df[columnas]
+        if len(posiciones) and posiciones[-1] - posiciones[0] + 1 == len(posiciones):    # tramo contiguo: sin copiar filas sueltas
+            return df.iloc[posiciones[0]:posiciones[-1] + 1]
+        return df.iloc[posiciones]
+
+    def contar(self, **filtros):
+        if not filtros:
+            return len(self.df)
+        return len(self.posiciones(**filtros))
+
+    def valores(self, columna, **filtros):
+        """
+        Valores distintos de una columna indexada (ordenados); con filtros,
+        solo los de las filas seleccionadas.
+        """
+        if not filtros:
+            return list(self.indices[columna].etiquetas)
+        return sorted(self.seleccionar([columna], **filtros)[columna].dropna().unique())
+
+    def tamanos(self, columna):
+        return self.indices[columna].tamanos()
+
+    def agregar(self, por, agregaciones=None, **filtros):
+        """
+        Agregado por `por` (columna o lista) de las filas seleccionadas:
+        agregaciones = {nombre: (columna, función)}. Sin agregaciones cuenta
+        filas (Filas).
+        """
+        agregaciones = agregaciones or {"Filas": (por if isinstance(por, str) else por[0], "size")}
+        seleccion = self.seleccionar(**filtros)
+        return seleccion.groupby(por, observed=True, sort=True).agg(**agregaciones).reset_index()
+
+
+def cargar_tabla(ruta="data/final_merged.csv", columnas=None, indices=None):
+    """
+    Lee el dataset final (csv o parquet particionado) con el esquema canónico
+    y lo indexa.
+    """
+    from almacenamiento import leer_particionado
+    from apartado_3 import ALIAS_COLUMNAS, nombre_canonico, normalizar_esquema
+    ruta = Path(ruta)
+    if ruta.is_dir():
+        leer = None if columnas is None else [c for c in ALIAS_COLUMNAS if ALIAS_COLUMNAS[c] in columnas]
+        df = leer_particionado(ruta, columnas=leer)
+    else:
+        df = pd.read_csv(ruta, usecols=None if columnas is None else (lambda c: nombre_canonico(c) in columnas), low_memory=False)
+    return TablaIndexada(normalizar_esquema(df), indices)
+
+
+def informe(tabla):
+    """
+    Informe por lotes: carreras, pilotos y paradas por temporada, y las
+    escuderías de la última temporada con su posición media. Con la tabla
+    vacía el informe sale vacío (y ultima = None).
+    """
+    por_temporada = tabla.agregar("Season", {
+        "Carreras": ("RaceNumber", "nunique"),
+        "Pilotos": ("DriverId", "nunique"),
+        "Paradas": ("NPitstops", "sum"),
+        "DuracionMediana": ("MedianPitStopDuration", "median"),
+    })
+    temporadas = tabla.valores("Season")
+    ultima = temporadas[-1] if temporadas else None
+    escuderias = tabla.agregar("Constructor", {
+        "Resultados": ("Position", "count"),
+        "PosicionMedia": ("Position", "mean"),
+        "ParadasMedias": ("NPitstops", "mean"),
+    }, Season=ultima if ultima is not None else [])
+    escuderias = escuderias[escuderias["Resultados"] > 0].sort_values("PosicionMedia", ignore_index=True)    # fuera las filas basura sin posición
+    return por_temporada, ultima, escuderias
+
+
+if __name__ == "__main__":
+    ruta = sys.argv[1] if len(sys.argv) > 1 else "data/final_merged.csv"
+    tabla = cargar_tabla(ruta)
+    por_temporada, ultima, escuderias = informe(tabla)
+    if ultima is None:
+        sys.exit(f"[AVISO] {ruta} no tiene filas: no hay nada que informar")
+    print(por_temporada.round(3).to_string(index=False))
+    print(f"\nEscuderías en {ultima}:")
+    print(escuderias.round(2).to_string(index=False))
+    print(f"\n[FINALIZADO] Informe de {len(tabla)} filas")
@@ -0,0 +1,142 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# estadisticas.py
+#
+# Estadística por grupos vectorizada con NumPy.
+#
+# Para calcular la regresión, la correlación y la mediana de cada temporada,
+# escudería o piloto no recorremos los grupos en Python: ordenamos una vez
+# las observaciones por grupo, guardamos dónde empieza cada uno (offsets) y
+# sacamos todas las sumas de golpe con np.add.reduceat.
+#
+# Los intervalos de confianza son bootstrap: cada réplica remuestrea con
+# reemplazo dentro de cada grupo. Generamos las réplicas por lotes como una
+# matriz de índices (réplicas x observaciones) y las reducimos igual que
+# los datos originales, así que todo el bootstrap también es vectorizado.
+
+import warnings
+import numpy as np
+import pandas as pd
+
+N_BOOTSTRAP = 1000
+ELEMENTOS_POR_LOTE = 4_000_000    # réplicas x observaciones por lote (acota la memoria, ~32 MB por matriz)
+
+
+def ordenar_por_grupo(grupos):
+    """
+    Devuelve (orden, etiquetas, inicios, tamaños): el orden que deja las
+    observaciones agrupadas, la etiqueta de cada grupo y dónde empieza y
+    cuánto mide cada uno dentro de ese orden.
+    """
+    codigos, etiquetas = pd.factorize(pd.Series(grupos), sort=True)
+    validos = codigos >= 0    # los grupos nulos no cuentan
+    orden = np.flatnonzero(validos)[np.argsort(codigos[validos], kind="stable")]
+    tamanos = np.bincount(codigos[validos], minlength=len(etiquetas))
+    inicios = np.concatenate(([0], np.cumsum(tamanos)[:-1]))
+    return orden, etiquetas, inicios, tamanos
+
+
+def sumas_por_grupo(valores, inicios):
+    """
+    Suma por grupo a lo largo del último eje (valores ya ordenados por grupo).
+    Sirve igual para un vector (datos) que para una matriz (réplicas).
+    """
+    return np.add.reduceat(valores, inicios, axis=-1)
+
+
+def regresion_por_grupo(x, y, inicios, tamanos):
+    """
+    Pendiente, ordenada y r de Pearson de y frente a x en cada grupo.
+    x e y pueden ser vectores o matrices (réplicas x observaciones).
+    Grupos con menos de 3 observaciones o sin variación quedan a NaN.
+    """
+    n = tamanos.astype("float64")
+    sx, sy = sumas_por_grupo(x, inicios), sumas_por_grupo(y, inicios)
+    sxx = sumas_por_grupo(x * x, inicios) - sx * sx / n
+    syy = sumas_por_grupo(y * y, inicios) - sy * sy / n
+    sxy = sumas_por_grupo(x * y, inicios) - sx * sy / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pendiente = np.where((sxx > 1e-12) & (n >= 3), sxy / sxx, np.nan)
+        ordenada = (sy - pendiente * sx) / n
+        r = np.where(syy > 1e-12, sxy / np.sqrt(sxx * syy), np.nan)
+        r = np.where(np.isnan(pendiente), np.nan, np.clip(r, -1, 1))
+    return pendiente, ordenada, r
+
+
+def mediana_por_grupo(valores, grupo_de, inicios, tamanos):
+    """
+    Mediana de cada grupo sin recorrerlos: ordenamos cada fila por
+    (grupo, valor) sumando al valor un desplazamiento por grupo mayor que su
+    rango, y leemos los elementos centrales a partir de los offsets.
+    """
+    desplazamiento = (np.nanmax(valores) - np.nanmin(valores) + 1) * grupo_de
+    ordenados = np.sort(valores + desplazamiento, axis=-1) - desplazamiento    # los grupos siguen en su sitio
+    bajo = np.take(ordenados, inicios + (tamanos - 1) // 2, axis=-1)
+    alto = np.take(ordenados, inicios + tamanos // 2, axis=-1)
+    return (bajo + alto) / 2
+
+
+def indices_bootstrap(rng, replicas, inicios, tamanos, grupo_de):
+    """
+    Matriz (replicas x observaciones) de índices remuestreados: la columna j
+    toma un índice al azar (con reemplazo) dentro del grupo de j.
+    """
+    u = rng.random((replicas, len(grupo_de)))
+    return inicios[grupo_de] + (u * tamanos[grupo_de]).astype(np.int64)
+
+
+def resumen_por_grupo(x, y, grupos, n_bootstrap=N_BOOTSTRAP, nivel=0.95, semilla=0):
+    """
+    Regresión de y frente a x, r de Pearson y medianas de x e y para cada
+    grupo, con intervalos de confianza bootstrap (percentiles) para la
+    pendiente, r y la mediana de x.
+
+    Devuelve un DataFrame con una fila por grupo:
+    [n, pendiente, pendiente_inf, pendiente_sup, r, r_inf, r_sup,
+     mediana_x, mediana_x_inf, mediana_x_sup, mediana_y]
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    orden, etiquetas, inicios, tamanos = ordenar_por_grupo(grupos)
+    columnas = ["n", "pendiente", "pendiente_inf", "pendiente_sup", "r", "r_inf", "r_sup",
+                "mediana_x", "mediana_x_inf", "mediana_x_sup", "mediana_y"]
+    if len(orden) == 0:
+        return pd.DataFrame(columns=columnas)
+
+    # quitamos los grupos vacíos (categorías sin observaciones)
+    con_datos = tamanos > 0
+    etiquetas, inicios, tamanos = etiquetas[con_datos], inicios[con_datos], tamanos[con_datos]
+    x, y = x[orden], y[orden]
+    grupo_de = np.repeat(np.arange(len(tamanos)), tamanos)    # grupo de cada observación ya ordenada
+
+    pendiente, _, r = regresion_por_grupo(x, y, inicios, tamanos)
+    mediana_x = mediana_por_grupo(x, grupo_de, inicios, tamanos)
+    mediana_y = mediana_por_grupo(y, grupo_de, inicios, tamanos)
+
+    # bootstrap por lotes de réplicas
+    rng = np.random.default_rng(semilla)
+    lote = max(1, ELEMENTOS_POR_LOTE // len(x))
+    pendientes, rs, medianas = [], [], []
+    for hechas in range(0, n_bootstrap, lote):
+        idx = indices_bootstrap(rng, min(lote, n_bootstrap - hechas), inicios, tamanos, grupo_de)
+        xb, yb = x[idx], y[idx]
+        p, _, rb = regresion_por_grupo(xb, yb, inicios, tamanos)
+        pendientes.append(p)
+        rs.append(rb)
+        medianas.append(mediana_por_grupo(xb, grupo_de, inicios, tamanos))
+
+    cola = (1 - nivel) / 2 * 100
+    def intervalo(replicas):
+        with warnings.catch_warnings():    # grupos con todas las réplicas a NaN (p.ej. n < 3)
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanpercentile(np.vstack(replicas), [cola, 100 - cola], axis=0)
+
+    (p_inf, p_sup), (r_inf, r_sup), (m_inf, m_sup) = intervalo(pendientes), intervalo(rs), intervalo(medianas)
+
+    return pd.DataFrame({
+        "n": tamanos, "pendiente": pendiente, "pendiente_inf": p_inf, "pendiente_sup": p_sup,
+        "r": r, "r_inf": r_inf, "r_sup": r_sup,
+        "mediana_x": mediana_x, "mediana_x_inf": m_inf, "mediana_x_sup": m_sup, "mediana_y": mediana_y,
+    }, index=pd.Index(etiquetas, name="grupo"))
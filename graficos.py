@@ -0,0 +1,113 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# graficos.py
+#
+# Capa de dibujo del dashboard.
+#
+# Streamlit vuelve a ejecutar app.py en cada interacción y st.pyplot
+# rasteriza la figura cada vez. Aquí guardamos el PNG ya dibujado de cada
+# figura en una caché LRU con clave (figura, filtros), de modo que repetir
+# una selección no vuelve a pasar por matplotlib.
+#
+# Además, con muchas observaciones el scatter se sustituye por un mapa de
+# densidad (hexbin) o por una muestra estratificada por posición, para que
+# el tiempo de dibujo no crezca con N. La regresión y la correlación se
+# siguen calculando con todos los datos (ver agregados.regresion).
+
+import io
+import threading
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")    # sin ventana: solo generamos imágenes
+import matplotlib.pyplot as plt
+from collections import OrderedDict
+
+UMBRAL_PUNTOS = 5000    # a partir de aquí no dibujamos cada observación
+MAX_MUESTRA = 2000      # puntos de la muestra estratificada
+
+
+class CacheFiguras:
+    """
+    Caché LRU de figuras ya renderizadas como PNG.
+
+    obtener(clave, dibujar) devuelve los bytes del PNG de la clave; si no
+    está llama a dibujar() (que devuelve una figura de matplotlib), la pasa a
+    PNG y la cierra. Cuando hay más de max_entradas se descarta la usada hace
+    más tiempo. Es segura entre hilos (cada sesión de Streamlit es un hilo).
+    """
+    def __init__(self, max_entradas=32, dpi=100):
+        self.max_entradas = max_entradas
+        self.dpi = dpi
+        self.entradas = OrderedDict()
+        self.lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave, dibujar):
+        with self.lock:
+            if clave in self.entradas:
+                self.entradas.move_to_end(clave)
+                self.aciertos += 1
+                return self.entradas[clave]
+            self.fallos += 1
+
+        png = figura_a_png(dibujar(), self.dpi)    # fuera del lock: dibujar puede tardar
+
+        with self.lock:
+            self.entradas[clave] = png
+            self.entradas.move_to_end(clave)
+            while len(self.entradas) > self.max_entradas:
+                self.entradas.popitem(last=False)
+        return png
+
+
+def figura_a_png(fig, dpi=100):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    plt.close(fig)    # si no, pyplot se queda con todas las figuras en memoria
+    return buffer.getvalue()
+
+
+def muestra_estratificada(x, y, max_puntos=MAX_MUESTRA, semilla=0):
+    """
+    Índices de una muestra de como mucho ~max_puntos observaciones en la que
+    cada valor de y (cada posición) conserva su proporción y ninguno se queda
+    sin puntos. Es reproducible (semilla fija) para que la misma selección
+    dé siempre la misma imagen.
+    """
+    n = len(y)
+    if n <= max_puntos:
+        return np.arange(n)
+
+    rng = np.random.default_rng(semilla)
+    orden = rng.permutation(n)
+    estratos = pd.Series(np.asarray(y)[orden])
+    cupo = np.ceil(estratos.map(estratos.value_counts()) * max_puntos / n)
+    rango = estratos.groupby(estratos).cumcount()    # posición de cada punto dentro de su estrato (ya barajado)
+    return np.sort(orden[(rango < cupo).to_numpy()])
+
+
+def dispersion(ax, x, y, modo="densidad", umbral=UMBRAL_PUNTOS):
+    """
+    Dibuja y frente a x en ax. Con más de `umbral` puntos usa un hexbin
+    (modo="densidad") o una muestra estratificada (modo="muestra").
+    Devuelve la etiqueta de lo que se ha dibujado.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    if len(x) <= umbral:
+        ax.scatter(x, y, alpha=0.4, label="Observaciones")
+        return "Observaciones"
+
+    if modo == "densidad":
+        hb = ax.hexbin(x, y, gridsize=40, mincnt=1, cmap="Blues", bins="log")
+        ax.figure.colorbar(hb, ax=ax, label="Observaciones (log)")
+        return f"Densidad ({len(x)} observaciones)"
+
+    indices = muestra_estratificada(x, y)
+    etiqueta = f"Muestra estratificada ({len(indices)} de {len(x)})"
+    ax.scatter(x[indices], y[indices], alpha=0.4, label=etiqueta)
+    return etiqueta
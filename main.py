@@ -2,11 +2,242 @@
 # Adquisición de Datos – PROYECTO FINAL
 # Grado en Ingeniería Matemática e Inteligencia Artificial
 # ETSI ICAI
+#
+# Uso:
+#   python main.py                               menú interactivo
+#   python main.py todo                          crawl y fetch a la vez y luego merge
+#   python main.py crawl --temporadas 2012-2024  solo el apartado 1
+#   python main.py crawl --backfill              apartado 1 de todas las temporadas desde 1950
+#   python main.py fetch merge --temporadas 2019-2024 --bulk --concurrente
+#   python main.py fetch merge --streaming       apartados 2 y 3 encadenados en memoria
+#   python main.py fetch vueltas --concurrente   pit-stops y tiempos por vuelta (ver vueltas.py)
+#   python main.py fetch vueltas merge           y el merge con el ritmo por stint (o merge --ritmo)
+#
+# Las etapas forman un grafo: crawl (apartado 1) y fetch (apartado 2) no
+# dependen entre sí y se lanzan en paralelo, cada una en su proceso; merge
+# (apartado 3) espera a las dos. vueltas (tiempos por vuelta y ritmo por
+# stint) espera a fetch porque necesita las paradas en bruto, y si se
+# ejecuta, merge espera también a vueltas para unir su ritmo. Cada apartado se importa solo si se va a
+# ejecutar. Sin preguntas y con código de salida distinto de 0 si algo
+# falla, así que se puede programar con cron:
+#   0 6 * * 1  cd /ruta/proyecto && python main.py todo --temporadas 2024 >> pipeline.log 2>&1
+#
+# Cada etapa deja sus métricas (tiempos, peticiones, filas, memoria) en
+# <data-dir>/metricas y al final se juntan en informe.json y pipeline.prom
+# (ver metricas.py). Con --perfil cprofile|tracemalloc se perfila cada etapa.
 
-from apartado_1 import run_part_i
-from apartado_2 import run_part_ii
-from apartado_3 import run_part_iii
+import sys
+import time
+import argparse
+import multiprocessing as mp
+from pathlib import Path
+from multiprocessing.connection import wait
+from metricas import METRICAS, combinar_informes
 
+TEMPORADAS = [2019, 2020, 2021, 2022, 2023, 2024]
+
+
+# --------------------------------------------------
+# ETAPAS (cada una importa su apartado al ejecutarse)
+# --------------------------------------------------
+
+def etapa_crawl(args):
+    from apartado_1 import run_part_i
+    run_part_i(incremental=args.incremental, formato=args.formato,
+               seasons=args.temporadas_crawl, data_dir=args.dir_crawl, backfill=args.backfill)
+
+
+def etapa_fetch(args):
+    from apartado_2 import run_part_ii
+    run_part_ii(seasons=args.temporadas_fetch, out_dir=args.dir_fetch, concurrente=args.concurrente,
+                bulk=args.bulk, offline=args.offline, formato=args.formato)
+
+
+def etapa_merge(args):
+    from apartado_3 import run_part_iii
+    run_part_iii(data_dir=args.data_dir, output_file=args.salida, formato=args.formato, ritmo=args.ritmo)
+
+
+def etapa_vueltas(args):
+    from vueltas import run_vueltas
+    run_vueltas(seasons=args.temporadas_fetch, out_dir=args.dir_fetch, concurrente=args.concurrente,
+                offline=args.offline)
+
+
+def etapa_streaming(args):
+    from apartado_3 import run_part_ii_iii
+    run_part_ii_iii(seasons=args.temporadas_fetch, data_dir=args.data_dir, output_file=args.salida,
+                    formato=args.formato, concurrente=args.concurrente, bulk=args.bulk, offline=args.offline)
+
+
+# nombre -> (etapas de las que depende, función)
+ETAPAS = {
+    "crawl": ((), etapa_crawl),
+    "fetch": ((), etapa_fetch),
+    "merge": (("crawl", "fetch", "vueltas"), etapa_merge),
+    "vueltas": (("fetch",), etapa_vueltas),
+}
+
+
+def correr_etapa(nombre, funcion, args):
+    # la etapa escribe su informe en args.metricas aunque falle
+    with METRICAS.etapa(nombre, carpeta=args.metricas, perfil=args.perfil):
+        funcion(args)
+
+
+def lanzar_etapa(nombre, args):
+    # punto de entrada de cada proceso hijo
+    correr_etapa(nombre, ETAPAS[nombre][1], args)
+
+
+def ejecutar_dag(seleccion, args, paralelo=True):
+    """
+    Ejecuta las etapas seleccionadas respetando sus dependencias (solo las
+    que también están seleccionadas). Las etapas listas a la vez se lanzan
+    cada una en su proceso (Scrapy necesita su propio reactor, y así el
+    crawl y las descargas de Jolpica avanzan en paralelo). Con paralelo=False
+    o una sola etapa todo va en este proceso, una detrás de otra.
+
+    Si una etapa falla no se lanzan las que dependen de ella y se devuelve
+    False cuando terminan las que ya estaban en marcha.
+    """
+    pendientes = [e for e in ETAPAS if e in seleccion]
+    hechas, fallidas = set(), set()
+    en_marcha = {}    # sentinel del proceso -> (nombre, proceso, inicio)
+    contexto = mp.get_context("spawn")    # nada de fork con hilos de por medio
+
+    while pendientes or en_marcha:
+        listas = [e for e in pendientes if all(d in hechas or d not in seleccion for d in ETAPAS[e][0])]
+        bloqueadas = [e for e in pendientes if any(d in fallidas for d in ETAPAS[e][0])]
+        for nombre in bloqueadas:
+            print(f"[ETAPA] {nombre} no se ejecuta: ha fallado una etapa de la que depende")
+            pendientes.remove(nombre)
+            fallidas.add(nombre)
+
+        for nombre in listas:
+            pendientes.remove(nombre)
+            print(f"[ETAPA] {nombre} empieza")
+            if not paralelo or (len(listas) == 1 and not en_marcha):
+                inicio = time.perf_counter()
+                try:
+                    correr_etapa(nombre, ETAPAS[nombre][1], args)
+                    hechas.add(nombre)
+                    print(f"[ETAPA] {nombre} terminada en {time.perf_counter() - inicio:.1f} s")
+                except Exception as e:
+                    fallidas.add(nombre)
+                    print(f"[ERROR] etapa {nombre}: {e}")
+                break    # volvemos a mirar qué etapas quedan listas
+            proceso = contexto.Process(target=lanzar_etapa, args=(nombre, args), name=f"etapa-{nombre}")
+            proceso.start()
+            en_marcha[proceso.sentinel] = (nombre, proceso, time.perf_counter())
+        else:
+            if not en_marcha:
+                continue
+            for sentinel in wait(list(en_marcha)):    # esperamos a que acabe alguna
+                nombre, proceso, inicio = en_marcha.pop(sentinel)
+                proceso.join()
+                if proceso.exitcode == 0:
+                    hechas.add(nombre)
+                    print(f"[ETAPA] {nombre} terminada en {time.perf_counter() - inicio:.1f} s")
+                else:
+                    fallidas.add(nombre)
+                    print(f"[ERROR] etapa {nombre} terminó con código {proceso.exitcode}")
+
+    return not fallidas
+
+
+# --------------------------------------------------
+# LÍNEA DE COMANDOS
+# --------------------------------------------------
+
+def leer_temporadas(texto):
+    """
+    "2019-2024" -> [2019, ..., 2024]; "2019,2021" -> [2019, 2021]
+    """
+    temporadas = []
+    for trozo in texto.split(","):
+        inicio, _, fin = trozo.strip().partition("-")
+        temporadas.extend(range(int(inicio), int(fin or inicio) + 1))
+    return temporadas
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Pipeline del proyecto de F1 (sin argumentos: menú interactivo)")
+    parser.add_argument("etapas", nargs="+", choices=["crawl", "fetch", "merge", "vueltas", "todo"],
+                        help="etapas a ejecutar (todo = crawl + fetch + merge)")
+    parser.add_argument("--temporadas", type=leer_temporadas,
+                        help="temporadas de crawl y fetch, p.ej. 2019-2024 o 2019,2021 "
+                             "(por defecto: crawl las de apartado_1 y fetch 2019-2024)")
+    parser.add_argument("--temporadas-crawl", type=leer_temporadas, help="temporadas solo para crawl")
+    parser.add_argument("--temporadas-fetch", type=leer_temporadas, help="temporadas solo para fetch y vueltas")
+    parser.add_argument("--data-dir", default="data", help="carpeta de datos de todas las etapas")
+    parser.add_argument("--dir-crawl", help="carpeta de salida de crawl (por defecto --data-dir)")
+    parser.add_argument("--dir-fetch", help="carpeta de salida de fetch (por defecto --data-dir)")
+    parser.add_argument("--salida", help="archivo final del merge (por defecto <data-dir>/final_merged.csv)")
+    parser.add_argument("--formato", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--incremental", action="store_true", help="crawl incremental (caché HTTP de Scrapy)")
+    parser.add_argument("--backfill", action="store_true",
+                        help="crawl de todo el histórico (desde 1950 salvo --temporadas o --temporadas-crawl), reanudable y con más concurrencia")
+    parser.add_argument("--concurrente", action="store_true", help="fetch y vueltas con descargas concurrentes")
+    parser.add_argument("--bulk", action="store_true", help="fetch paginando temporadas enteras")
+    parser.add_argument("--offline", action="store_true", help="fetch solo desde la caché de respuestas")
+    parser.add_argument("--ritmo", action="store_true",
+                        help="merge añade el ritmo por stint de vueltas.py (implícito si también se ejecuta vueltas)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="fetch y merge encadenados en memoria (los resultados de Wikipedia ya deben estar en disco)")
+    parser.add_argument("--secuencial", action="store_true", help="no lanzar etapas en paralelo")
+    parser.add_argument("--metricas", help="carpeta de los informes de métricas (por defecto <data-dir>/metricas)")
+    parser.add_argument("--perfil", choices=["cprofile", "tracemalloc"],
+                        help="perfilar cada etapa (tiempo por función o memoria por línea)")
+    return parser
+
+
+def leer_argumentos(argv):
+    parser = crear_parser()
+    args = parser.parse_args(argv)
+
+    seleccion = {"crawl", "fetch", "merge"} if "todo" in args.etapas else set(args.etapas)
+    args.temporadas_crawl = args.temporadas_crawl or args.temporadas    # None: run_part_i usa las suyas (o 1950-hoy con backfill), como la opción 1 del menú
+    args.temporadas_fetch = args.temporadas_fetch or args.temporadas or TEMPORADAS
+    args.ritmo = args.ritmo or "vueltas" in seleccion
+    args.dir_crawl = args.dir_crawl or args.data_dir
+    args.dir_fetch = args.dir_fetch or args.data_dir
+    args.metricas = args.metricas or f"{args.data_dir}/metricas"
+    args.salida = args.salida or (f"{args.data_dir}/final_merged.parquet" if args.formato == "parquet"
+                                  else f"{args.data_dir}/final_merged.csv")
+
+    if "merge" in seleccion and (args.dir_crawl != args.data_dir or args.dir_fetch != args.data_dir):
+        parser.error("merge lee de --data-dir: --dir-crawl y --dir-fetch no pueden cambiarlo")
+    if args.streaming and seleccion != {"fetch", "merge"}:
+        parser.error("--streaming es solo para 'fetch merge' (el merge lee los resultados según llegan los pit-stops)")
+    return seleccion, args
+
+
+def ejecutar(argv):
+    seleccion, args = leer_argumentos(argv)
+    etapas = ["streaming"] if args.streaming else [e for e in ETAPAS if e in seleccion]
+    for nombre in etapas:    # que no se cuele el informe de una ejecución anterior
+        Path(args.metricas, f"etapa_{nombre}.json").unlink(missing_ok=True)
+
+    inicio = time.perf_counter()
+    if args.streaming:
+        print("[ETAPA] fetch + merge en streaming")
+        try:
+            correr_etapa("streaming", etapa_streaming, args)
+            ok = True
+        except Exception as e:
+            print(f"[ERROR] streaming: {e}")
+            ok = False
+    else:
+        ok = ejecutar_dag(seleccion, args, paralelo=not args.secuencial)
+    combinar_informes(args.metricas, etapas)
+    print(f"[FINALIZADO] {'OK' if ok else 'CON ERRORES'} en {time.perf_counter() - inicio:.1f} s (métricas en {args.metricas})")
+    return 0 if ok else 1
+
+
+# --------------------------------------------------
+# MENÚ INTERACTIVO
+# --------------------------------------------------
 
 def mostrar_menu():
     print("\n" + "=" * 50)
@@ -27,19 +258,22 @@ def main():
 
         if opcion == "1":
             print("\n[EJECUTANDO] Apartado 1 - Scraping Wikipedia\n")
+            from apartado_1 import run_part_i
             run_part_i()
             print("\n[FINALIZADO] Apartado 1\n")
 
         elif opcion == "2":
             print("\n[EJECUTANDO] Apartado 2 - Pit-stops Jolpica API\n")
+            from apartado_2 import run_part_ii
             run_part_ii(
-                seasons=[2019, 2020, 2021, 2022, 2023, 2024],
+                seasons=TEMPORADAS,
                 out_dir="data"
             )
             print("\n[FINALIZADO] Apartado 2\n")
 
         elif opcion == "3":
             print("\n[EJECUTANDO] Apartado 3 - Merge de datos\n")
+            from apartado_3 import run_part_iii
             run_part_iii(
                 data_dir="data",
                 output_file="data/final_merged.csv"
@@ -48,15 +282,8 @@ def main():
 
         elif opcion == "4":
             print("\n[EJECUTANDO] Proyecto completo\n")
-            run_part_i()
-            run_part_ii(
-                seasons=[2019, 2020, 2021, 2022, 2023, 2024],
-                out_dir="data"
-            )
-            run_part_iii(
-                data_dir="data",
-                output_file="data/final_merged.csv"
-            )
+            # apartados 1 y 2 a la vez (cada uno en su proceso) y después el 3
+            ejecutar(["todo"])
             print("\n[FINALIZADO] Proyecto completo\n")
 
         elif opcion == "0":
@@ -68,4 +295,6 @@ def main():
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(ejecutar(sys.argv[1:]))
     main()
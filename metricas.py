@@ -0,0 +1,242 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# metricas.py
+#
+# Métricas del pipeline: contadores, tiempos y memoria de cada etapa.
+#
+# Los apartados apuntan aquí lo que hacen (METRICAS.contar, cronometro,
+# dormir...) y cada etapa de main.py acaba escribiendo un informe JSON y un
+# fichero de texto en formato Prometheus (para el textfile collector de
+# node_exporter) en <data_dir>/metricas:
+#
+#   etapa_fetch.json          informe de una etapa
+#   informe.json              todas las etapas de la última ejecución
+#   pipeline.prom             lo mismo en formato Prometheus
+#   perfil_fetch.prof / .txt  solo con perfil="cprofile" (o _memoria.txt con "tracemalloc")
+
+import os
+import io
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+
+
+def memoria_pico_bytes():
+    """
+    Pico de memoria residente del proceso (0 si el sistema no lo da).
+    """
+    try:
+        import resource
+    except ImportError:    # Windows
+        return 0
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if sys.platform == "darwin" else pico * 1024    # en Linux viene en KiB
+
+
+def clave(nombre, etiquetas):
+    return nombre, tuple(sorted(etiquetas.items()))
+
+
+class Metricas:
+    """
+    Registro de métricas de un proceso, seguro entre hilos.
+
+    - contadores: contar("peticiones_http", api="jolpica", resultado="200")
+    - tiempos: with cronometro("merge"): ... (o observar(nombre, segundos))
+      guardan número de medidas, total y máximo
+    - dormir(segundos, motivo): time.sleep que además cuenta el tiempo de espera
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self.lock:
+            self.contadores = {}
+            self.tiempos = {}
+
+    def contar(self, nombre, n=1, **etiquetas):
+        k = clave(nombre, etiquetas)
+        with self.lock:
+            self.contadores[k] = self.contadores.get(k, 0) + n
+
+    def observar(self, nombre, segundos, **etiquetas):
+        k = clave(nombre, etiquetas)
+        with self.lock:
+            n, total, maximo = self.tiempos.get(k, (0, 0.0, 0.0))
+            self.tiempos[k] = (n + 1, total + segundos, max(maximo, segundos))
+
+    @contextmanager
+    def cronometro(self, nombre, **etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nombre, time.perf_counter() - inicio, **etiquetas)
+
+    def dormir(self, segundos, motivo):
+        if segundos > 0:
+            self.observar("espera", segundos, motivo=motivo)
+            time.sleep(segundos)
+
+    def filas(self, fase, entrada=0, salida=0):
+        # fase y no etapa: la etiqueta etapa la pone a_prometheus (y una misma etapa puede tener varias fases)
+        if entrada:
+            self.contar("filas_entrada", entrada, fase=fase)
+        if salida:
+            self.contar("filas_salida", salida, fase=fase)
+
+    def informe(self):
+        """
+        Foto de todas las métricas como diccionario serializable a JSON.
+        """
+        with self.lock:
+            contadores = [{"nombre": n, "etiquetas": dict(e), "valor": v} for (n, e), v in sorted(self.contadores.items())]
+            tiempos = [{"nombre": n, "etiquetas": dict(e), "n": c, "segundos": round(t, 6), "max": round(m, 6)}
+                       for (n, e), (c, t, m) in sorted(self.tiempos.items())]
+        return {"contadores": contadores, "tiempos": tiempos}
+
+    @contextmanager
+    def etapa(self, nombre, carpeta=None, perfil=None):
+        """
+        Mide una etapa entera: tiempo total, pico de memoria y todo lo que se
+        apunte dentro (empezamos con el registro vacío). Al terminar, bien o
+        con error, guarda <carpeta>/etapa_<nombre>.json.
+
+        perfil="cprofile" perfila la etapa (solo el hilo principal; los
+        hilos de descarga no salen) y perfil="tracemalloc" guarda las líneas
+        que más memoria reservan.
+        """
+        self.reiniciar()
+        perfilador = cProfile.Profile() if perfil == "cprofile" else None
+        if perfil == "tracemalloc":
+            tracemalloc.start(10)
+        if perfilador is not None:
+            perfilador.enable()
+
+        inicio = time.perf_counter()
+        fecha_inicio = datetime.now()
+        estado = "ok"
+        try:
+            yield self
+        except BaseException:
+            estado = "error"
+            raise
+        finally:
+            duracion = time.perf_counter() - inicio
+            if perfilador is not None:
+                perfilador.disable()
+            informe = {
+                "etapa": nombre,
+                "estado": estado,
+                "inicio": fecha_inicio.isoformat(timespec="seconds"),
+                "segundos": round(duracion, 3),
+                "memoria_pico_bytes": memoria_pico_bytes(),
+                **self.informe(),
+            }
+            if carpeta is not None:
+                carpeta = Path(carpeta)
+                carpeta.mkdir(parents=True, exist_ok=True)
+                if perfilador is not None:
+                    guardar_perfil(perfilador, carpeta / f"perfil_{nombre}")
+                if perfil == "tracemalloc":
+                    informe["memoria_python_pico_bytes"] = guardar_memoria(carpeta / f"perfil_{nombre}_memoria.txt")
+                escribir_atomico(carpeta / f"etapa_{nombre}.json", json.dumps(informe, indent=1, ensure_ascii=False))
+            elif perfil == "tracemalloc":
+                tracemalloc.stop()
+
+
+METRICAS = Metricas()    # el registro del proceso; lo importan los apartados
+
+
+def escribir_atomico(path, texto):
+    temporal = Path(f"{path}.tmp")
+    temporal.write_text(texto, encoding="utf-8")
+    os.replace(temporal, path)    # el textfile collector nunca ve un fichero a medias
+
+
+def guardar_perfil(perfilador, base):
+    perfilador.dump_stats(f"{base}.prof")    # para snakeviz / pstats
+    texto = io.StringIO()
+    pstats.Stats(perfilador, stream=texto).sort_stats("cumulative").print_stats(40)
+    Path(f"{base}.txt").write_text(texto.getvalue(), encoding="utf-8")
+
+
+def guardar_memoria(path, lineas=25):
+    instantanea = tracemalloc.take_snapshot()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    top = instantanea.statistics("lineno")[:lineas]
+    Path(path).write_text(f"pico: {pico / 2**20:.1f} MiB\n" + "\n".join(str(s) for s in top), encoding="utf-8")
+    return pico
+
+
+# --------------------------------------------------
+# INFORME DE LA EJECUCIÓN Y FORMATO PROMETHEUS
+# --------------------------------------------------
+
+def combinar_informes(carpeta, etapas):
+    """
+    Junta los informes de las etapas de esta ejecución en informe.json y
+    pipeline.prom. Devuelve el informe combinado.
+    """
+    carpeta = Path(carpeta)
+    informes = []
+    for nombre in etapas:
+        ruta = carpeta / f"etapa_{nombre}.json"
+        if ruta.exists():
+            informes.append(json.loads(ruta.read_text(encoding="utf-8")))
+
+    informe = {"fecha": datetime.now().isoformat(timespec="seconds"), "etapas": informes}
+    carpeta.mkdir(parents=True, exist_ok=True)
+    escribir_atomico(carpeta / "informe.json", json.dumps(informe, indent=1, ensure_ascii=False))
+    escribir_atomico(carpeta / "pipeline.prom", a_prometheus(informes))
+    return informe
+
+
+def etiquetas_prometheus(etiquetas):
+    if not etiquetas:
+        return ""
+    pares = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for k, v in sorted(etiquetas.items()))
+    return "{" + pares + "}"
+
+
+def a_prometheus(informes, prefijo="f1"):
+    """
+    Informes de etapa -> formato de exposición de texto de Prometheus.
+    Cada serie lleva la etiqueta etapa (si un contador trae otra etapa
+    entre sus etiquetas, manda la del informe).
+    """
+    series = {}    # nombre -> (tipo, [líneas])
+
+    def anadir(nombre, tipo, etiquetas, valor):
+        series.setdefault(nombre, (tipo, []))[1].append(f"{nombre}{etiquetas_prometheus(etiquetas)} {valor}")
+
+    for inf in informes:
+        etapa = {"etapa": inf["etapa"]}
+        anadir(f"{prefijo}_etapa_duracion_segundos", "gauge", etapa, inf["segundos"])
+        anadir(f"{prefijo}_etapa_memoria_pico_bytes", "gauge", etapa, inf["memoria_pico_bytes"])
+        anadir(f"{prefijo}_etapa_correcta", "gauge", etapa, int(inf["estado"] == "ok"))
+        for c in inf["contadores"]:
+            anadir(f"{prefijo}_{c['nombre']}_total", "counter", {**c["etiquetas"], **etapa}, c["valor"])
+        for t in inf["tiempos"]:
+            base = f"{prefijo}_{t['nombre']}_segundos"
+            anadir(f"{base}_sum", "counter", {**t["etiquetas"], **etapa}, t["segundos"])
+            anadir(f"{base}_count", "counter", {**t["etiquetas"], **etapa}, t["n"])
+            anadir(f"{base}_max", "gauge", {**t["etiquetas"], **etapa}, t["max"])
+
+    lineas = []
+    for nombre, (tipo, filas) in series.items():
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        lineas.extend(filas)
+    return "\n".join(lineas) + "\n"
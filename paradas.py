@@ -0,0 +1,149 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# paradas.py
+#
+# Almacén de los pit-stops en bruto (una fila por parada).
+#
+# El apartado 2 resume cada carrera en NPitstops y MedianPitStopDuration,
+# pero antes de resumir guardamos aquí cada parada tal cual llega de la API
+# (vuelta, número de parada, hora y duración) con tipos compactos:
+#
+#   data/paradas/season=2021/race_05.parquet
+#
+# Solo se añaden archivos (uno por carrera; si una carrera se vuelve a
+# descargar se sustituye el suyo), así que cualquier resumen nuevo (vuelta
+# de la primera parada, ventana de paradas, media en vez de mediana...) sale
+# de leer este almacén y agregar en local, sin volver a pedir nada.
+#
+# Uso:
+#   python paradas.py [data_dir]    recalcula el resumen de todas las temporadas
+
+import sys
+import pandas as pd
+from pathlib import Path
+from almacenamiento import ruta_particion, escribir_parquet, leer_particionado
+
+DATASET = "paradas"
+
+TIPOS_PARADAS = {
+    "Season": "int16",
+    "RaceNumber": "int8",
+    "DriverId": "string",    # en el archivo es texto; al leer todas las temporadas lo pasamos a category
+    "Stop": "int8",
+    "Lap": "int16",
+    "TimeOfDay": "Int32",    # segundos desde medianoche (hora local del circuito)
+    "Duration": "float32",   # segundos
+}
+
+CLAVES = ["Season", "RaceNumber", "DriverId"]
+
+# resúmenes por piloto y carrera: nombre -> (columna, función de agregación)
+AGREGACIONES = {
+    "NPitstops": ("Stop", "size"),
+    "MedianPitStopDuration": ("Duration", "median"),
+    "MeanPitStopDuration": ("Duration", "mean"),
+    "TotalPitStopTime": ("Duration", "sum"),
+    "FirstStopLap": ("Lap", "min"),
+    "LastStopLap": ("Lap", "max"),
+}
+
+
+def duracion_a_segundos(serie):
+    """
+    "23.456" -> 23.456, "1:02.345" -> 62.345 y "1:02:03.456" -> 3723.456
+    (las paradas largas, p.ej. con bandera roja, vienen en minutos o en
+    horas). Lo que no se entiende queda como NaN.
+    """
+    # una columna por cada parte separada por ":"; las que faltan quedan a NA (también con la serie vacía)
+    partes = serie.astype("string").str.extract(r"^\s*(?:(?:(\d+):)?(\d+):)?(\d+(?:\.\d+)?)\s*$")
+    horas, minutos, segundos = (pd.to_numeric(partes[i], errors="coerce") for i in range(3))
+    return horas.fillna(0) * 3600 + minutos.fillna(0) * 60 + segundos
+
+
+def hora_a_segundos(serie):
+    """
+    "14:05:33" -> 50733 (segundos desde medianoche).
+    """
+    partes = serie.astype("string").str.split(":", n=2, expand=True).reindex(columns=range(3))
+    h, m, s = (pd.to_numeric(partes[i], errors="coerce") for i in range(3))
+    return (h * 3600 + m * 60 + s).round().astype("Int32")
+
+
+def tipar_paradas(season, rnd, filas):
+    """
+    Lista de diccionarios de la API ({"driverId", "stop", "lap", "time",
+    "duration"}) -> DataFrame con TIPOS_PARADAS. Una carrera sin paradas
+    (anteriores a 2011, aún sin publicar...) da un DataFrame vacío con los
+    mismos tipos.
+    """
+    if len(filas) == 0:
+        return pd.DataFrame({c: pd.Series(dtype=t) for c, t in TIPOS_PARADAS.items()})
+    crudo = pd.DataFrame(filas, columns=["driverId", "stop", "lap", "time", "duration"])
+    df = pd.DataFrame({
+        "Season": int(season),
+        "RaceNumber": int(rnd),
+        "DriverId": crudo["driverId"],
+        "Stop": pd.to_numeric(crudo["stop"], errors="coerce"),
+        "Lap": pd.to_numeric(crudo["lap"], errors="coerce"),
+        "TimeOfDay": hora_a_segundos(crudo["time"]),
+        "Duration": duracion_a_segundos(crudo["duration"]),
+    }, index=crudo.index)
+    return df.astype(TIPOS_PARADAS)
+
+
+def ruta_paradas(out_dir, season, rnd):
+    return ruta_particion(out_dir, DATASET, season) / f"race_{int(rnd):02d}.parquet"
+
+
+def guardar_paradas(filas, out_dir, season, rnd):
+    """
+    Escribe las paradas de una carrera (también si no tiene ninguna, para
+    saber que ya está) y devuelve la ruta.
+    """
+    return str(escribir_parquet(tipar_paradas(season, rnd, filas), ruta_paradas(out_dir, season, rnd)))
+
+
+def leer_paradas(data_dir="data", temporadas=None, columnas=None):
+    """
+    Todas las paradas guardadas (o las de `temporadas`), con DriverId como category.
+    """
+    paradas = leer_particionado(Path(data_dir) / DATASET, columnas=columnas, temporadas=temporadas)
+    if paradas.empty:
+        return pd.DataFrame({c: pd.Series(dtype=t) for c, t in TIPOS_PARADAS.items() if columnas is None or c in columnas})
+    tipos = {c: t for c, t in TIPOS_PARADAS.items() if c in paradas.columns}
+    if "DriverId" in tipos:
+        tipos["DriverId"] = "category"
+    return paradas.astype(tipos)
+
+
+def agregar_paradas(paradas, agregaciones=None, por=None):
+    """
+    Resumen vectorizado de las paradas: un único groupby sobre todas las
+    temporadas a la vez. Por defecto una fila por (Season, RaceNumber,
+    DriverId) con AGREGACIONES y la ventana de paradas (PitWindow, vueltas
+    entre la primera y la última parada); con `por` se agrupa por otras
+    columnas (p.ej. ["Season", "RaceNumber"] para resumir cada carrera).
+    """
+    agregaciones = agregaciones or AGREGACIONES
+    resumen = paradas.groupby(por or CLAVES, observed=True, sort=True).agg(**agregaciones).reset_index()
+    if {"FirstStopLap", "LastStopLap"} <= set(resumen.columns):
+        resumen["PitWindow"] = resumen["LastStopLap"] - resumen["FirstStopLap"]
+    if "NPitstops" in resumen.columns:
+        resumen["NPitstops"] = resumen["NPitstops"].astype("int16")
+    return resumen
+
+
+def recalcular_resumen(data_dir="data", temporadas=None, agregaciones=None):
+    """
+    Lee el almacén y devuelve el resumen por piloto y carrera, sin red.
+    """
+    return agregar_paradas(leer_paradas(data_dir, temporadas), agregaciones)
+
+
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "data"
+    resumen = recalcular_resumen(data_dir)
+    destino = escribir_parquet(resumen, Path(data_dir) / "agregados" / "resumen_paradas.parquet")
+    print(f"[FINALIZADO] Resumen de {len(resumen)} pilotos-carrera guardado en {destino}")
@@ -0,0 +1,84 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# tests/test_agregados.py
+#
+# Uso:
+#   python -m pytest tests
+
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+from matplotlib import cbook
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))    # para importar los módulos desde la raíz
+
+from agregados import (cubo_posiciones, cubo_duraciones, filtrar, resumen_por_paradas,
+                       percentil_ponderado, estadisticas_caja, regresion)
+
+
+def dataset_aleatorio(semilla, n=600):
+    # filas como las del dataset final, con posiciones fuera de 1..20 y huecos
+    rng = np.random.default_rng(semilla)
+    return pd.DataFrame({
+        "Season": rng.choice([2019, 2020, 2021], size=n),
+        "Driver": rng.choice(["Alonso", "Sainz", "Hamilton", "Verstappen", "Leclerc"], size=n),
+        "NPitstops": rng.choice([0, 1, 2, 3, np.nan], size=n, p=[0.1, 0.35, 0.35, 0.15, 0.05]),
+        "Position": rng.choice(np.r_[1:23, np.nan], size=n),
+        "MedianPitStopDuration": np.where(rng.random(n) < 0.1, np.nan, rng.normal(24, 2, size=n).round(2)),
+    })
+
+
+@pytest.mark.parametrize("semilla", range(20))
+def test_percentil_ponderado_como_numpy(semilla):
+    rng = np.random.default_rng(semilla)
+    valores = np.sort(rng.choice(np.arange(1, 21), size=rng.integers(1, 15), replace=False)).astype(float)
+    cuentas = rng.integers(1, 9, size=len(valores))
+    repetidos = np.repeat(valores, cuentas)
+    for q in (0, 0.1, 0.25, 0.5, 0.75, 0.9, 1):
+        assert percentil_ponderado(valores, cuentas, q) == pytest.approx(np.percentile(repetidos, q * 100))
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_cajas_como_matplotlib(semilla):
+    df = dataset_aleatorio(semilla)
+    cajas = estadisticas_caja(cubo_posiciones(df))
+    validas = df.dropna(subset=["Season", "NPitstops", "Position"])
+    validas = validas[validas["Position"].between(1, 20)]
+    assert [c["label"] for c in cajas] == [str(p) for p in sorted(validas["NPitstops"].astype(int).unique())]
+    for caja in cajas:
+        datos = validas.loc[validas["NPitstops"] == int(caja["label"]), "Position"].to_numpy()
+        esperado = cbook.boxplot_stats(datos, whis=1.5)[0]
+        for clave in ("q1", "med", "q3", "whislo", "whishi"):
+            assert caja[clave] == pytest.approx(esperado[clave])
+        assert set(caja["fliers"]) == set(esperado["fliers"])
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_cubos_como_filas(semilla):
+    df = dataset_aleatorio(semilla)
+    posiciones, duraciones = cubo_posiciones(df), cubo_duraciones(df)
+    for temporadas, pilotos in (([2019, 2020, 2021], ()), ([2020], ()), ([2019, 2021], ("Alonso", "Sainz"))):
+        filas = df.dropna(subset=["Season", "NPitstops", "Position"])
+        filas = filas[filas["Season"].isin(temporadas) & (filas["Driver"].isin(pilotos) if pilotos else True)]
+
+        resumen = resumen_por_paradas(filtrar(posiciones, temporadas, pilotos))
+        en_rango = filas[filas["Position"].between(1, 20)]
+        esperado = en_rango.groupby("NPitstops")["Position"].agg(["mean", "size"])
+        np.testing.assert_allclose(resumen["Posición_media"], esperado["mean"])
+        np.testing.assert_array_equal(resumen["Observaciones"], esperado["size"])
+
+        puntos = en_rango[(en_rango["NPitstops"] > 0) & en_rango["MedianPitStopDuration"].notna()]
+        pendiente, ordenada, r, xmin, xmax, n = regresion(filtrar(duraciones, temporadas, pilotos))
+        x, y = puntos["MedianPitStopDuration"].to_numpy(), puntos["Position"].to_numpy()
+        assert n == len(puntos) and (xmin, xmax) == (x.min(), x.max())
+        assert (pendiente, ordenada) == pytest.approx(tuple(np.polyfit(x, y, 1)))
+        assert r == pytest.approx(np.corrcoef(x, y)[0, 1])
+
+
+def test_regresion_sin_datos():
+    vacio = cubo_duraciones(dataset_aleatorio(0).iloc[:0])
+    assert regresion(vacio) is None
@@ -0,0 +1,99 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# tests/test_consultas.py
+#
+# Uso:
+#   python -m pytest tests
+
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))    # para importar los módulos desde la raíz
+
+from consultas import TablaIndexada, informe
+
+PILOTOS = ["alonso", "sainz", "hamilton", "verstappen", "leclerc", "norris"]
+ESCUDERIAS = ["Ferrari", "Mercedes", "McLaren", "Red Bull"]
+
+
+def tabla_aleatoria(semilla, n=500):
+    rng = np.random.default_rng(semilla)
+    df = pd.DataFrame({
+        "Season": rng.integers(2015, 2025, size=n).astype("int16"),
+        "RaceNumber": rng.integers(1, 23, size=n).astype("int8"),
+        "DriverId": pd.Series(rng.choice(PILOTOS + [None], size=n), dtype="string"),
+        "Constructor": pd.Categorical(rng.choice(ESCUDERIAS, size=n), categories=ESCUDERIAS + ["Williams"]),
+        "Position": rng.integers(1, 21, size=n).astype("float32"),
+        "NPitstops": rng.integers(0, 4, size=n).astype("float32"),
+        "MedianPitStopDuration": rng.normal(24, 2, size=n).astype("float32"),
+    })
+    return df.sample(frac=1, random_state=semilla, ignore_index=True)    # desordenado, como al leer varias fuentes
+
+
+def mascara(df, columna, filtro):
+    if filtro is None:
+        return pd.Series(True, index=df.index)
+    if isinstance(filtro, slice):
+        return df[columna].between(filtro.start if filtro.start is not None else -np.inf,
+                                   filtro.stop if filtro.stop is not None else np.inf)
+    return df[columna].isin(np.atleast_1d(filtro))
+
+
+def filtros_aleatorios(rng):
+    opciones = {
+        "Season": [None, 2019, [2016, 2020, 2024], slice(2018, 2021), slice(None, 2016), [2030], []],
+        "RaceNumber": [None, 5, slice(3, 10)],
+        "DriverId": [None, "alonso", ["sainz", "norris"], "nadie"],
+        "Constructor": [None, "Ferrari", ["Mercedes", "Williams"]],
+    }
+    return {columna: valores[rng.integers(len(valores))] for columna, valores in opciones.items()}
+
+
+@pytest.mark.parametrize("semilla", range(10))
+def test_seleccionar_como_mascaras(semilla):
+    tabla = TablaIndexada(tabla_aleatoria(semilla))
+    df = tabla.df
+    rng = np.random.default_rng(semilla)
+    for _ in range(40):
+        filtros = filtros_aleatorios(rng)
+        esperado = df[np.logical_and.reduce([mascara(df, c, f).to_numpy() for c, f in filtros.items()])]
+        obtenido = tabla.seleccionar(**filtros)
+        pd.testing.assert_frame_equal(obtenido, esperado)
+        assert tabla.contar(**filtros) == len(esperado)
+
+
+def test_orden_y_tamanos():
+    df = tabla_aleatoria(0)
+    tabla = TablaIndexada(df)
+    assert tabla.df[["Season", "RaceNumber"]].equals(df.sort_values(["Season", "RaceNumber"], kind="stable")[["Season", "RaceNumber"]].reset_index(drop=True))
+    assert tabla.tamanos("DriverId").to_dict() == df["DriverId"].value_counts().to_dict()    # los nulos no se indexan
+    assert tabla.valores("Constructor") == [c for c in ESCUDERIAS if c in set(df["Constructor"])]    # orden de las categorías
+    assert tabla.valores("DriverId", Season=2019) == sorted(df.loc[df["Season"] == 2019, "DriverId"].dropna().unique())
+    with pytest.raises(RuntimeError):
+        tabla.seleccionar(Position=1)
+
+
+def test_agregar_como_groupby():
+    df = tabla_aleatoria(1)
+    tabla = TablaIndexada(df)
+    obtenido = tabla.agregar("Constructor", {"Media": ("Position", "mean"), "Filas": ("Position", "size")}, Season=slice(2018, 2021))
+    filas = df[df["Season"].between(2018, 2021)]
+    esperado = filas.groupby("Constructor", observed=True).agg(Media=("Position", "mean"), Filas=("Position", "size")).reset_index()
+    pd.testing.assert_frame_equal(obtenido, esperado)
+
+
+def test_informe():
+    df = tabla_aleatoria(2)
+    por_temporada, ultima, escuderias = informe(TablaIndexada(df))
+    assert ultima == df["Season"].max()
+    assert por_temporada["Carreras"].tolist() == df.groupby("Season")["RaceNumber"].nunique().tolist()
+    esperado = df[df["Season"] == ultima].groupby("Constructor", observed=True)["Position"].mean().sort_values()
+    np.testing.assert_allclose(escuderias["PosicionMedia"], esperado.to_numpy())
+
+    por_temporada, ultima, escuderias = informe(TablaIndexada(df.iloc[:0]))
+    assert ultima is None and por_temporada.empty and escuderias.empty
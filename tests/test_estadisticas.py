@@ -0,0 +1,72 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# tests/test_estadisticas.py
+#
+# Uso:
+#   python -m pytest tests
+
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))    # para importar los módulos desde la raíz
+
+from estadisticas import resumen_por_grupo, mediana_por_grupo, ordenar_por_grupo
+
+
+def datos_aleatorios(semilla, n=400, grupos=7):
+    rng = np.random.default_rng(semilla)
+    g = rng.choice([f"g{k}" for k in range(grupos)], size=n)
+    x = rng.normal(22, 3, size=n).round(1)    # con empates, como las duraciones reales
+    y = (0.4 * x + rng.normal(0, 2, size=n)).round()
+    return x, y, g
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_mediana_por_grupo_como_pandas(semilla):
+    x, _, g = datos_aleatorios(semilla)
+    orden, etiquetas, inicios, tamanos = ordenar_por_grupo(g)
+    grupo_de = np.repeat(np.arange(len(tamanos)), tamanos)
+    medianas = mediana_por_grupo(x[orden], grupo_de, inicios, tamanos)
+    esperado = pd.Series(x).groupby(g).median().reindex(etiquetas)
+    np.testing.assert_allclose(medianas, esperado.to_numpy())
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_resumen_como_numpy(semilla):
+    x, y, g = datos_aleatorios(semilla)
+    resumen = resumen_por_grupo(x, y, g, n_bootstrap=50)
+    for grupo, fila in resumen.iterrows():
+        xs, ys = x[g == grupo], y[g == grupo]
+        assert fila["n"] == len(xs)
+        pendiente, _ = np.polyfit(xs, ys, 1)
+        assert fila["pendiente"] == pytest.approx(pendiente)
+        assert fila["r"] == pytest.approx(np.corrcoef(xs, ys)[0, 1])
+        assert fila["mediana_x"] == pytest.approx(np.median(xs))
+        assert fila["mediana_y"] == pytest.approx(np.median(ys))
+        assert fila["pendiente_inf"] <= fila["pendiente_sup"]
+        assert fila["mediana_x_inf"] <= fila["mediana_x"] <= fila["mediana_x_sup"]
+
+
+def test_bootstrap_reproducible_y_por_lotes(monkeypatch):
+    import estadisticas
+    x, y, g = datos_aleatorios(0)
+    completo = resumen_por_grupo(x, y, g, n_bootstrap=60, semilla=3)
+    pd.testing.assert_frame_equal(completo, resumen_por_grupo(x, y, g, n_bootstrap=60, semilla=3))
+    monkeypatch.setattr(estadisticas, "ELEMENTOS_POR_LOTE", len(x) * 7)    # 60 réplicas en lotes de 7
+    pd.testing.assert_frame_equal(resumen_por_grupo(x, y, g, n_bootstrap=60, semilla=3), completo)    # mismas réplicas
+
+
+def test_grupos_pequenos_nulos_y_vacio():
+    x = np.array([20.0, 21.0, 22.0, 23.0, 24.0, 25.0])
+    y = np.array([1.0, 3.0, 2.0, 5.0, 4.0, 6.0])
+    g = pd.Series(["a", "a", "a", "b", "b", None])
+    resumen = resumen_por_grupo(x, y, g, n_bootstrap=20)
+    assert list(resumen.index) == ["a", "b"]    # el grupo nulo no cuenta
+    assert resumen.loc["b", "n"] == 2 and np.isnan(resumen.loc["b", "pendiente"])    # menos de 3 observaciones
+    assert resumen.loc["b", "mediana_x"] == 23.5
+    assert resumen_por_grupo([], [], []).empty
@@ -0,0 +1,88 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# tests/test_merge_streaming.py
+#
+# El modo streaming (apartados 2 y 3 encadenados) frente a run_part_iii,
+# con datos sintéticos y el servidor local de Jolpica de benchmarks/.
+#
+# Uso:
+#   python -m pytest tests
+
+import sys
+import shutil
+import contextlib
+import io
+import pandas as pd
+import pytest
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))    # para importar los módulos desde la raíz
+sys.path.insert(0, str(RAIZ / "benchmarks"))
+
+import apartado_2
+from apartado_3 import run_part_iii, run_part_ii_iii, CacheMerge, rutas_temporadas, huella_temporada
+from generar_datos import generar_arbol
+from servidor_jolpica import ServidorJolpica, Datos
+
+DESCARGA_RAPIDA = {"concurrente": True, "tasa": 1000, "capacidad": 1000, "por_hora": None}
+
+
+@pytest.fixture(scope="module")
+def arbol(tmp_path_factory):
+    # árbol sintético (2019-2024) y su salida de referencia con run_part_iii
+    base = tmp_path_factory.mktemp("arbol")
+    with contextlib.redirect_stdout(io.StringIO()):
+        temporadas = generar_arbol(base / "datos")
+        run_part_iii(base / "datos", base / "referencia.csv", n_procesos=1)
+    return base, temporadas
+
+
+@pytest.fixture
+def servidor(monkeypatch):
+    s = ServidorJolpica(Datos(fixtures=None, carreras=3))
+    monkeypatch.setattr(apartado_2, "BASE", s.arrancar())
+    yield s
+    s.parar()
+
+
+def streaming(arbol, destino, temporada, guardar):
+    base, _ = arbol
+    shutil.copytree(base / "datos", destino)
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_part_ii_iii([temporada], destino, destino / "final.csv", guardar=guardar, **DESCARGA_RAPIDA)
+    return pd.read_csv(destino / "final.csv"), pd.read_csv(base / "referencia.csv")
+
+
+def test_streaming_incluye_todas_las_temporadas(arbol, servidor, tmp_path):
+    _, temporadas = arbol
+    final, referencia = streaming(arbol, tmp_path / "datos", temporadas[-1], guardar=True)
+    assert sorted(final["Season"].unique()) == temporadas
+
+    otras = lambda df: df[df["Season"] != temporadas[-1]].reset_index(drop=True)
+    pd.testing.assert_frame_equal(otras(final), otras(referencia), check_dtype=False)    # el csv no guarda los tipos
+
+
+def test_streaming_registra_la_cache(arbol, servidor, tmp_path):
+    _, temporadas = arbol
+    datos = tmp_path / "datos"
+    final, _ = streaming(arbol, datos, temporadas[-1], guardar=True)
+    cache = CacheMerge(datos)
+    assert all(cache.vigente(s, huella_temporada(r, p)) for s, r, p in rutas_temporadas(datos))
+
+    with contextlib.redirect_stdout(io.StringIO()):    # y run_part_iii da lo mismo sin recalcular nada
+        run_part_iii(datos, tmp_path / "otra.csv", n_procesos=1)
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / "otra.csv"), final)
+
+
+def test_streaming_sin_guardar_no_toca_la_cache(arbol, servidor, tmp_path):
+    _, temporadas = arbol
+    datos = tmp_path / "datos"
+    final, referencia = streaming(arbol, datos, temporadas[-1], guardar=False)
+    assert sorted(final["Season"].unique()) == temporadas
+    # en disco siguen los archivos de antes: la caché conserva su merge y no el de la descarga
+    ultima = temporadas[-1]
+    parte = CacheMerge(datos).cargar(ultima)
+    assert len(parte) == (referencia["Season"] == ultima).sum() != (final["Season"] == ultima).sum()
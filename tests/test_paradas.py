@@ -0,0 +1,49 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# tests/test_paradas.py
+#
+# Uso:
+#   python -m pytest tests
+
+import sys
+import pandas as pd
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))    # para importar los módulos desde la raíz
+
+from paradas import TIPOS_PARADAS, duracion_a_segundos, tipar_paradas, guardar_paradas, leer_paradas, recalcular_resumen
+
+
+def test_carrera_sin_paradas(tmp_path):
+    # carreras anteriores a 2011 o sin publicar: vacío, con sus tipos, y se guarda igual
+    vacio = tipar_paradas(2005, 3, [])
+    assert vacio.empty
+    assert {c: str(t) for c, t in vacio.dtypes.items()} == {c: str(pd.Series(dtype=t).dtype) for c, t in TIPOS_PARADAS.items()}
+
+    ruta = guardar_paradas([], tmp_path, 2005, 3)
+    assert Path(ruta).exists()
+    assert leer_paradas(tmp_path, [2005]).empty
+    assert recalcular_resumen(tmp_path).empty
+
+
+def test_duraciones():
+    segundos = duracion_a_segundos(pd.Series(["23.456", "1:02.345", "1:02:03.456", "basura", None]))
+    assert segundos[:3].round(3).tolist() == [23.456, 62.345, 3723.456]
+    assert segundos[3:].isna().all()
+    assert duracion_a_segundos(pd.Series([], dtype="object")).empty
+
+
+def test_resumen_por_piloto(tmp_path):
+    filas = [
+        {"driverId": "alonso", "stop": "1", "lap": "12", "time": "14:05:33", "duration": "22.5"},
+        {"driverId": "alonso", "stop": "2", "lap": "30", "time": "14:35:10", "duration": "24.5"},
+        {"driverId": "sainz", "stop": "1", "lap": "20", "time": "14:20:00", "duration": "1:01.0"},
+    ]
+    guardar_paradas(filas, tmp_path, 2021, 5)
+    resumen = recalcular_resumen(tmp_path).set_index("DriverId")
+    assert resumen.loc["alonso", "NPitstops"] == 2
+    assert resumen.loc["alonso", "MedianPitStopDuration"] == 23.5
+    assert resumen.loc["alonso", "PitWindow"] == 18
+    assert resumen.loc["sainz", "TotalPitStopTime"] == 61.0
@@ -0,0 +1,323 @@
+# José Herrera, Mateo Gómez-Acebo, Gonzalo Crespo y Diego Bertolín
+# Adquisición de Datos - PROYECTO FINAL
+# Ingeniería Matemática e Inteligenica Artificial
+# ETSI ICAI
+# vueltas.py
+#
+# Descarga de los tiempos por vuelta de Jolpica (/{season}/{round}/laps) y
+# ritmo de cada stint, para relacionar la estrategia de paradas con el
+# tiempo que se pierde en pista.
+#
+# Una carrera tiene unas 1000 filas de tiempos (unas 100 veces más que de
+# pit-stops), así que no las juntamos en una lista de diccionarios como
+# descargar_pitstops_carrera: cada página que llega se pasa enseguida a
+# columnas tipadas (pyarrow) y se va escribiendo por grupos de filas en
+#
+#   data/vueltas/season=2021/race_05.parquet
+#
+# En memoria solo hay una página y como mucho FILAS_POR_GRUPO filas
+# pendientes de escribir, descarguemos las temporadas que descarguemos.
+#
+# Con las vueltas y las paradas en bruto (paradas.py) calculamos por
+# temporada un resumen por piloto y carrera que el apartado 3 une por
+# (Season, RaceNumber, DriverId) con run_part_iii(ritmo=True) o
+# `python main.py merge --ritmo`:
+#
+#   data/agregados/ritmo_stints.parquet
+#
+# Uso:
+#   python vueltas.py [data_dir] [temporadas...]    descarga lo que falte y recalcula el ritmo
+
+import os
+import sys
+import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib import Path
+import apartado_2
+from almacenamiento import ruta_particion, escribir_parquet, leer_particionado, temporadas_particionadas
+from paradas import duracion_a_segundos, leer_paradas, CLAVES
+from metricas import METRICAS
+
+DATASET = "vueltas"
+FILAS_POR_GRUPO = 4096    # filas que juntamos antes de escribir un grupo en el parquet
+
+ESQUEMA_VUELTAS = pa.schema([
+    ("Season", pa.int16()),
+    ("RaceNumber", pa.int8()),
+    ("DriverId", pa.string()),
+    ("Lap", pa.int16()),
+    ("Position", pa.int8()),
+    ("LapTime", pa.float32()),    # segundos
+])
+
+MARGEN_VUELTA_LIMPIA = 1.07    # como la regla del 107%: más lento que esto sobre su mediana es safety car, tráfico...
+
+
+# --------------------------------------------------
+# DESCARGA EN STREAMING
+# --------------------------------------------------
+
+def paginas_vueltas(temporada, numero_ronda, limit=100, sleep=1.2):
+    """
+    Generador con la lista Laps de cada página de la carrera:
+    [{"number": "1", "Timings": [{"driverId", "position", "time"}, ...]}, ...]
+
+    Jolpica pagina por tiempos (no por vueltas), así que una vuelta puede
+    venir partida entre dos páginas; no importa porque cada tiempo lleva su
+    número de vuelta.
+    """
+    url = f"{apartado_2.BASE}/{temporada}/{numero_ronda}/laps.json"
+    offset = 0
+    while True:
+        antes = apartado_2.PETICIONES_RED
+        datos = apartado_2.peticion_json(url, params={"limit": limit, "offset": offset})
+        carreras = datos["MRData"]["RaceTable"]["Races"]
+        laps = carreras[0].get("Laps", []) if carreras else []
+        if not laps:
+            break
+        yield laps
+
+        total = int(datos["MRData"].get("total", "0"))
+        offset += int(datos["MRData"].get("limit", limit)) #el servidor puede darnos menos de lo pedido
+        if offset >= total:
+            break
+        if apartado_2.LIMITADOR is None and apartado_2.PETICIONES_RED > antes: #solo esperamos si la página vino de la red
+            METRICAS.dormir(sleep, "pausa")
+
+
+def lote_vueltas(temporada, numero_ronda, laps):
+    """
+    Una página de la API -> RecordBatch con ESQUEMA_VUELTAS.
+    """
+    pilotos, numeros, posiciones, tiempos = [], [], [], []
+    for lap in laps:
+        for timing in lap.get("Timings", []):
+            pilotos.append(timing["driverId"])
+            numeros.append(lap["number"])
+            posiciones.append(timing.get("position"))
+            tiempos.append(timing.get("time"))
+    df = pd.DataFrame({
+        "Season": pd.Series(int(temporada), index=range(len(pilotos)), dtype="int16"),
+        "RaceNumber": pd.Series(int(numero_ronda), index=range(len(pilotos)), dtype="int8"),
+        "DriverId": pd.Series(pilotos, dtype="string"),
+        "Lap": pd.to_numeric(pd.Series(numeros), errors="coerce").astype("int16"),
+        "Position": pd.to_numeric(pd.Series(posiciones), errors="coerce").astype("Int8"),
+        "LapTime": duracion_a_segundos(pd.Series(tiempos, dtype="string")).astype("Float32"),
+    })
+    return pa.RecordBatch.from_pandas(df, schema=ESQUEMA_VUELTAS, preserve_index=False)
+
+
+def ruta_vueltas(out_dir, season, rnd):
+    return ruta_particion(out_dir, DATASET, season) / f"race_{int(rnd):02d}.parquet"
+
+
+def descargar_vueltas_carrera(temporada, numero_ronda, out_dir="data", limit=100, sleep=1.2, filas_por_grupo=None):
+    """
+    Descarga los tiempos por vuelta de una carrera escribiéndolos según
+    llegan. Las páginas se acumulan solo hasta filas_por_grupo filas, que se
+    escriben como un grupo de filas del parquet. Escribimos en un temporal y
+    lo renombramos al final, así que nunca queda una carrera a medias.
+    Si Jolpica aún no tiene sus vueltas no dejamos archivo: la carrera
+    sigue pendiente y se vuelve a pedir en la siguiente ejecución.
+
+    Devuelve el número de filas escritas.
+    """
+    filas_por_grupo = filas_por_grupo or FILAS_POR_GRUPO
+    destino = ruta_vueltas(out_dir, temporada, numero_ronda)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    temporal = destino.with_name(destino.name + ".tmp")
+
+    pendientes, n_pendientes, escritas = [], 0, 0
+    try:
+        with pq.ParquetWriter(temporal, ESQUEMA_VUELTAS, compression="zstd") as escritor:
+            for laps in paginas_vueltas(temporada, numero_ronda, limit, sleep):
+                lote = lote_vueltas(temporada, numero_ronda, laps)
+                pendientes.append(lote)
+                n_pendientes += lote.num_rows
+                if n_pendientes >= filas_por_grupo:
+                    escritor.write_table(pa.Table.from_batches(pendientes))
+                    escritas += n_pendientes
+                    pendientes, n_pendientes = [], 0
+            if pendientes:
+                escritor.write_table(pa.Table.from_batches(pendientes))
+                escritas += n_pendientes
+    except BaseException:
+        temporal.unlink(missing_ok=True)
+        raise
+    if escritas == 0:
+        temporal.unlink(missing_ok=True)
+        print(f"[AVISO] Vueltas {temporada} R{int(numero_ronda):02d}: Jolpica aún no tiene tiempos, se pedirán otra vez")
+        return 0
+    os.replace(temporal, destino)
+
+    METRICAS.filas("laps", salida=escritas)
+    print(f"[TERMINADO] Vueltas {temporada} R{int(numero_ronda):02d}: {escritas} tiempos")
+    return escritas
+
+
+def carreras_pendientes(seasons, out_dir="data", reanudar=True):
+    """
+    [(season, round)] de las carreras ya disputadas (fecha anterior a hoy)
+    sin archivo de vueltas. Las de hoy o futuras no se piden todavía: sus
+    vueltas aún no están completas. Un archivo sin filas (de versiones
+    anteriores, que sí los escribían) cuenta como pendiente.
+    """
+    hoy = datetime.date.today().isoformat()
+    pendientes = []
+    for season in seasons:
+        for carrera in apartado_2.calendario_temporada(season):
+            if not carrera["date"] or carrera["date"] >= hoy:
+                continue
+            ruta = ruta_vueltas(out_dir, season, carrera["round"])
+            if reanudar and ruta.exists() and pq.ParquetFile(ruta).metadata.num_rows > 0:
+                continue
+            pendientes.append((season, carrera["round"]))
+    return pendientes
+
+
+# --------------------------------------------------
+# RITMO POR STINT
+# --------------------------------------------------
+
+def leer_vueltas(data_dir="data", temporadas=None, columnas=None):
+    vueltas = leer_particionado(Path(data_dir) / DATASET, columnas=columnas, temporadas=temporadas)
+    if vueltas.empty:
+        return ESQUEMA_VUELTAS.empty_table().to_pandas()
+    return vueltas
+
+
+def marcar_stints(vueltas, paradas):
+    """
+    Añade a cada vuelta si es de entrada a boxes (la vuelta de la parada),
+    de salida (la siguiente) y su número de stint: el stint k va desde la
+    salida de la parada k-1 hasta la vuelta de entrada de la parada k.
+    """
+    vueltas = vueltas.astype({"DriverId": "string"}).sort_values(CLAVES + ["Lap"], ignore_index=True)
+    boxes = paradas[CLAVES + ["Lap"]].astype({"DriverId": "string", "Lap": "int16"}).drop_duplicates()
+
+    entrada = vueltas[CLAVES + ["Lap"]].merge(boxes.assign(EnBoxes=True), on=CLAVES + ["Lap"], how="left")
+    salida = vueltas[CLAVES + ["Lap"]].merge(boxes.assign(Lap=(boxes["Lap"] + 1).astype("int16"), EnBoxes=True),
+                                            on=CLAVES + ["Lap"], how="left")
+    vueltas["VueltaEntrada"] = entrada["EnBoxes"].notna().to_numpy()
+    vueltas["VueltaSalida"] = salida["EnBoxes"].notna().to_numpy()
+    paradas_previas = vueltas.groupby(CLAVES, sort=False)["VueltaEntrada"].cumsum() - vueltas["VueltaEntrada"]
+    vueltas["Stint"] = (paradas_previas + 1).astype("int8")
+    return vueltas
+
+
+def ritmo_stints(vueltas, paradas):
+    """
+    Resumen por (Season, RaceNumber, DriverId):
+    - NStints: stints disputados (paradas + 1)
+    - CleanLaps y MedianLapTime: vueltas limpias (ni la primera, ni de
+      entrada o salida de boxes, ni más lentas que el 107% de su mediana)
+      y su mediana
+    - BestStintPace y WorstStintPace: mediana de las vueltas limpias del
+      stint más rápido y del más lento
+    - PitLossPerStop: segundos perdidos por parada en las vueltas de
+      entrada y salida respecto a MedianLapTime (NaN si no paró)
+    """
+    columnas = ["NStints", "CleanLaps", "MedianLapTime", "BestStintPace", "WorstStintPace", "PitLossPerStop"]
+    if vueltas.empty:
+        return pd.DataFrame(columns=CLAVES + columnas)
+    vueltas = marcar_stints(vueltas, paradas)
+    por_piloto = vueltas.groupby(CLAVES, sort=False)["LapTime"]
+    limpia = (~vueltas["VueltaEntrada"] & ~vueltas["VueltaSalida"] & (vueltas["Lap"] > 1)
+              & (vueltas["LapTime"] <= MARGEN_VUELTA_LIMPIA * por_piloto.transform("median")))
+    limpias = vueltas[limpia]
+
+    resumen = vueltas.groupby(CLAVES, sort=True).agg(NStints=("Stint", "max"), NStops=("VueltaEntrada", "sum"))
+    resumen = resumen.join(limpias.groupby(CLAVES).agg(CleanLaps=("LapTime", "size"), MedianLapTime=("LapTime", "median")))
+    stints = limpias.groupby(CLAVES + ["Stint"])["LapTime"].median()
+    resumen = resumen.join(stints.groupby(level=CLAVES).agg(["min", "max"])
+                           .rename(columns={"min": "BestStintPace", "max": "WorstStintPace"}))
+
+    en_boxes = vueltas[vueltas["VueltaEntrada"] | vueltas["VueltaSalida"]].join(resumen["MedianLapTime"], on=CLAVES)
+    perdido = (en_boxes["LapTime"] - en_boxes["MedianLapTime"]).groupby([en_boxes[c] for c in CLAVES]).sum()
+    resumen["PitLossPerStop"] = perdido.reindex(resumen.index) / resumen["NStops"].where(resumen["NStops"] > 0)
+
+    resumen = resumen.reset_index()[CLAVES + columnas]
+    return resumen.astype({"Season": "int16", "RaceNumber": "int8", "DriverId": "string", "NStints": "int8",
+                           "CleanLaps": "Int16", "MedianLapTime": "float32", "BestStintPace": "float32",
+                           "WorstStintPace": "float32", "PitLossPerStop": "float32"})
+
+
+def calcular_ritmo(data_dir="data", temporadas=None):
+    """
+    Ritmo por stint de todas las temporadas con vueltas guardadas (o de
+    `temporadas`). Vamos temporada a temporada para no tener nunca en
+    memoria las vueltas de todas a la vez.
+    """
+    partes = []
+    for season in temporadas_particionadas(Path(data_dir) / DATASET):
+        if temporadas is not None and season not in temporadas:
+            continue
+        partes.append(ritmo_stints(leer_vueltas(data_dir, [season]), leer_paradas(data_dir, [season])))
+    if not partes:
+        return ritmo_stints(leer_vueltas(data_dir, []), None)
+    return pd.concat(partes, ignore_index=True)
+
+
+def guardar_ritmo(data_dir="data"):
+    ritmo = calcular_ritmo(data_dir)
+    return escribir_parquet(ritmo, Path(data_dir) / "agregados" / "ritmo_stints.parquet")
+
+
+def unir_ritmo(final_df, data_dir="data"):
+    """
+    Añade al dataset final del apartado 3 las columnas de ritmo_stints
+    (NaN en las carreras sin vueltas descargadas).
+    """
+    ruta = Path(data_dir) / "agregados" / "ritmo_stints.parquet"
+    if not ruta.exists():
+        return final_df
+    ritmo = pd.read_parquet(ruta)
+    claves = final_df[CLAVES].astype({"Season": "int16", "RaceNumber": "int8", "DriverId": "string"})
+    return final_df.join(claves.merge(ritmo, on=CLAVES, how="left").drop(columns=CLAVES).set_axis(final_df.index))
+
+
+# --------------------------------------------------
+# EJECUCIÓN
+# --------------------------------------------------
+
+def run_vueltas(seasons, out_dir="data", concurrente=False, max_workers=8, tasa=4.0, capacidad=4,
+                por_hora=apartado_2.POR_HORA_JOLPICA, usar_cache=True, cache_dir=None, offline=False, reanudar=True):
+    """
+    Descarga las vueltas de las carreras que falten (en paralelo con el
+    mismo limitador de tasa que el apartado 2 si concurrente=True) y
+    recalcula data/agregados/ritmo_stints.parquet. Usa la misma caché de
+    respuestas que el apartado 2.
+
+    El ritmo necesita las paradas en bruto, así que conviene haber
+    ejecutado antes el apartado 2 para las mismas temporadas.
+    """
+    apartado_2.configurar_sesion(max_conexiones=max_workers if concurrente else 2)
+    if usar_cache or offline:
+        apartado_2.CACHE = apartado_2.CacheRespuestas(cache_dir or os.path.join(out_dir, ".cache_http"), offline=offline)
+    try:
+        pendientes = carreras_pendientes(seasons, out_dir, reanudar)
+        print(f"[PLAN] {len(pendientes)} carreras sin vueltas")
+        tareas = [(descargar_vueltas_carrera, (season, rnd, out_dir)) for season, rnd in pendientes]
+        if concurrente:
+            apartado_2.run_part_ii_concurrente(tareas, max_workers=max_workers, tasa=tasa, capacidad=capacidad,
+                                               por_hora=por_hora)
+        else:
+            for funcion, args in tareas:
+                antes = apartado_2.PETICIONES_RED
+                funcion(*args)
+                if apartado_2.PETICIONES_RED > antes:
+                    METRICAS.dormir(1.2, "pausa")
+    finally:
+        apartado_2.CACHE = None
+
+    destino = guardar_ritmo(out_dir)
+    print(f"[FINALIZADO] Ritmo por stint guardado en {destino}")
+    return destino
+
+
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "data"
+    temporadas = [int(t) for t in sys.argv[2:]] or [2019, 2020, 2021, 2022, 2023, 2024]
+    run_vueltas(temporadas, out_dir=data_dir)